@@ -1,4 +1,16 @@
-from .data import load_pbp
+from .data import load_pbp, iter_games_csv
 from .pbp import PbP
 from .playertotals import PlayerTotals
 from .teamtotals import TeamTotals
+from .rapmmodel import RapmModel
+from .registry import Registry
+from .partials import TotalsPartial
+from .lineuptotals import LineupTotals
+from .assistnetwork import AssistNetwork
+from .rollup import RollupCache
+from .cache import PbPCache
+from .responsecache import ResponseCache
+from .schedule import Schedule
+from .bulkload import load_pbp_many
+from .sink import DatabaseSink
+from .seasonstore import SeasonStore
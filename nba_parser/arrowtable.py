@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+OUTPUTS = ["pandas", "arrow"]
+
+
+def _arrow_column(pa, column: pd.Series):
+    """
+    function to build one arrow array from the numpy data of a column.
+    Numbers and dates are wrapped without inferring anything, categoricals
+    keep their codes and strings are factorized into dictionary arrays
+    """
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        codes = column.cat.codes.to_numpy()
+        return pa.DictionaryArray.from_arrays(
+            pa.array(codes, mask=codes < 0),
+            pa.array(np.asarray(column.cat.categories)),
+        )
+    if isinstance(column.dtype, pd.api.extensions.ExtensionDtype):
+        # nullable integers hand arrow their data and mask directly
+        return pa.array(column.array)
+    if column.dtype == object and pd.api.types.infer_dtype(column) == "string":
+        codes, uniques = pd.factorize(column.to_numpy())
+        codes = codes.astype(np.int32)
+        return pa.DictionaryArray.from_arrays(
+            pa.array(codes, mask=codes < 0),
+            pa.array(np.asarray(uniques, dtype=object), pa.string()),
+        )
+
+    return pa.array(column.to_numpy(), from_pandas=True)
+
+
+def to_arrow(df: pd.DataFrame):
+    """
+    function to turn a stats dataframe into a pyarrow Table. The arrays are
+    built straight from the numpy data of each column so numeric columns
+    aren't copied and string columns are dictionary encoded instead of
+    being inferred from python objects
+
+    Inputs:
+    df      - dataframe of stats
+
+    Outputs:
+    table   - pyarrow Table with the same columns
+    """
+    try:
+        import pyarrow as pa
+    except Exception as exc:  # pragma: no cover - import failure
+        raise ImportError("pyarrow is required for arrow output") from exc
+
+    return pa.Table.from_arrays(
+        [_arrow_column(pa, df[column]) for column in df.columns],
+        names=[str(column) for column in df.columns],
+    )
+
+
+def check_output(output: str) -> None:
+    """
+    function to check an output format before any stats are calculated
+    """
+    if output not in OUTPUTS:
+        raise ValueError(f"output must be one of {', '.join(OUTPUTS)} not {output}")
+
+
+def convert_output(df: pd.DataFrame, output: str):
+    """
+    function to return a stats dataframe in the requested output format,
+    either the dataframe itself or a pyarrow Table
+    """
+    check_output(output)
+    if output == "arrow":
+        return to_arrow(df)
+
+    return df
@@ -0,0 +1,198 @@
+from __future__ import annotations
+
+from typing import Iterable, Optional, Union
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from .pbp import PbP
+from .registry import Registry
+
+
+class AssistNetwork:
+    """
+    This class accumulates who assisted whom as a sparse passer x scorer
+    network with the number of assists, the points they led to and how many
+    of them were threes. The edges are kept as coalesced coordinate arrays
+    keyed on player ids so networks built from different games or seasons can
+    be merged without renumbering anything, and can be saved to a compressed
+    npz file instead of keeping per game edge lists around in pandas
+    """
+
+    stats = ["assists", "points", "threes"]
+
+    def __init__(
+        self,
+        games: Iterable[Union[PbP, pd.DataFrame]] = (),
+        registry: Optional[Registry] = None,
+    ) -> None:
+        self.passer_ids = np.empty(0, dtype=np.int64)
+        self.scorer_ids = np.empty(0, dtype=np.int64)
+        self.values = np.empty((0, len(self.stats)), dtype=np.int64)
+        self.registry = registry if registry is not None else Registry()
+        self.add_games(games)
+
+    @staticmethod
+    def _coalesce(
+        passer_ids: np.ndarray, scorer_ids: np.ndarray, values: np.ndarray
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        function to sort edges by passer and scorer and sum the values of
+        duplicate edges
+        """
+        order = np.lexsort((scorer_ids, passer_ids))
+        passer_ids = passer_ids[order]
+        scorer_ids = scorer_ids[order]
+        values = values[order]
+
+        new_edge = np.ones(len(order), dtype=bool)
+        new_edge[1:] = (passer_ids[1:] != passer_ids[:-1]) | (
+            scorer_ids[1:] != scorer_ids[:-1]
+        )
+        starts = np.flatnonzero(new_edge)
+        if len(starts) == 0:
+            return passer_ids, scorer_ids, values
+
+        return (
+            passer_ids[starts],
+            scorer_ids[starts],
+            np.add.reduceat(values, starts, axis=0),
+        )
+
+    @staticmethod
+    def _game_edges(
+        pbp_df: pd.DataFrame,
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        function to pull the passer, scorer and value of every assisted made
+        shot out of a play by play dataframe
+        """
+        assisted = (
+            (pbp_df["event_type_de"] == "shot")
+            & (pbp_df["shot_made"] == 1)
+            & (pbp_df["player2_id"] != 0)
+        ).to_numpy()
+        points = pbp_df["points_made"].to_numpy()[assisted].astype(np.int64)
+        values = np.column_stack(
+            [
+                np.ones(len(points), dtype=np.int64),
+                points,
+                (points == 3).astype(np.int64),
+            ]
+        )
+
+        return (
+            pbp_df["player2_id"].to_numpy()[assisted].astype(np.int64),
+            pbp_df["player1_id"].to_numpy()[assisted].astype(np.int64),
+            values,
+        )
+
+    def add_games(self, games: Iterable[Union[PbP, pd.DataFrame]]) -> AssistNetwork:
+        """
+        method to add the assisted shots of more games to the network. Games
+        can be PbP objects or their PbP.df dataframes
+        """
+        passer_ids = [self.passer_ids]
+        scorer_ids = [self.scorer_ids]
+        values = [self.values]
+        for game in games:
+            if isinstance(game, PbP):
+                self.registry = self.registry.merge(game.registry)
+                game = game.df
+            else:
+                self.registry = self.registry.merge(Registry.from_events(game))
+            passers, scorers, game_values = self._game_edges(game)
+            passer_ids.append(passers)
+            scorer_ids.append(scorers)
+            values.append(game_values)
+
+        self.passer_ids, self.scorer_ids, self.values = self._coalesce(
+            np.concatenate(passer_ids), np.concatenate(scorer_ids), np.vstack(values)
+        )
+
+        return self
+
+    def merge(self, other: AssistNetwork) -> AssistNetwork:
+        """
+        method to combine two networks into a new one. Merging is associative
+        so networks from separate workers or seasons can be combined in any
+        grouping
+        """
+        network = AssistNetwork(registry=self.registry.merge(other.registry))
+        network.passer_ids, network.scorer_ids, network.values = self._coalesce(
+            np.concatenate([self.passer_ids, other.passer_ids]),
+            np.concatenate([self.scorer_ids, other.scorer_ids]),
+            np.vstack([self.values, other.values]),
+        )
+
+        return network
+
+    def matrices(self) -> tuple[np.ndarray, dict[str, sparse.csr_matrix]]:
+        """
+        method to return the network as sparse passer x scorer matrices
+
+        Outputs:
+        player_ids - sorted player ids labeling both the rows (passers) and
+                     the columns (scorers)
+        matrices   - dictionary of stat name -> sparse matrix
+        """
+        player_ids = np.union1d(self.passer_ids, self.scorer_ids)
+        rows = np.searchsorted(player_ids, self.passer_ids)
+        columns = np.searchsorted(player_ids, self.scorer_ids)
+        shape = (len(player_ids), len(player_ids))
+
+        return player_ids, {
+            stat: sparse.csr_matrix((self.values[:, i], (rows, columns)), shape=shape)
+            for i, stat in enumerate(self.stats)
+        }
+
+    def edges(self) -> pd.DataFrame:
+        """
+        method to return the network as a dataframe of passer and scorer pairs
+
+        Outputs:
+        edges_df - one row per passer and scorer with names and the assists,
+                   points and threes between them
+        """
+        edges_df = pd.DataFrame(self.values, columns=self.stats)
+        edges_df.insert(0, "passer_id", self.passer_ids)
+        edges_df.insert(1, "passer_name", self.registry.player_names(self.passer_ids))
+        edges_df.insert(2, "scorer_id", self.scorer_ids)
+        edges_df.insert(3, "scorer_name", self.registry.player_names(self.scorer_ids))
+
+        return edges_df
+
+    def save(self, path) -> None:
+        """
+        method to write the network and the names of its players to a
+        compressed npz file
+        """
+        player_ids = np.union1d(self.passer_ids, self.scorer_ids)
+        np.savez_compressed(
+            path,
+            passer_ids=self.passer_ids,
+            scorer_ids=self.scorer_ids,
+            values=self.values,
+            player_ids=player_ids,
+            player_names=self.registry.player_names(player_ids).astype(str),
+        )
+
+    @classmethod
+    def load(cls, path) -> AssistNetwork:
+        """
+        method to read a network written by save()
+        """
+        with np.load(path) as data:
+            network = cls(
+                registry=Registry(
+                    pd.Series(
+                        data["player_names"].astype(object), index=data["player_ids"]
+                    )
+                )
+            )
+            network.passer_ids = data["passer_ids"]
+            network.scorer_ids = data["scorer_ids"]
+            network.values = data["values"]
+
+        return network
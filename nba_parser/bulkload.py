@@ -0,0 +1,227 @@
+from __future__ import annotations
+
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import TYPE_CHECKING, Iterable, Iterator, Optional, Union
+
+import pandas as pd
+
+from .data import load_pbp
+from .responsecache import ResponseCache
+
+if TYPE_CHECKING:
+    from .schedule import Schedule
+
+STATS_URL = "https://stats.nba.com/stats/{endpoint}"
+
+# responses worth retrying, everything else is a bad request that would fail
+# again
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """
+    This class is a thread safe token bucket that limits how many requests
+    are started per second across all the threads sharing it. Tokens refill
+    continuously at rate per second up to capacity, which is how many
+    requests can go out at once after the bucket has been idle
+    """
+
+    def __init__(self, rate: float, capacity: float = 1) -> None:
+        if rate <= 0:
+            raise ValueError(f"rate must be greater than 0 not {rate}")
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """
+        method to take a token, sleeping until one is available
+        """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_time = (1 - self.tokens) / self.rate
+            time.sleep(wait_time)
+
+
+class StatsClient:
+    """
+    This class requests stats.nba.com endpoints through one pooled
+    requests.Session shared by every thread, so connections are reused
+    instead of opened per request. Requests go through a TokenBucket and
+    connection errors, timeouts and 429 or 5xx responses are retried with
+    exponential backoff. Its fetch method can be used anywhere a fetcher is
+    taken, and base_url can point at a local server for testing. The request
+    headers default to the ones nba_api sends
+    """
+
+    def __init__(
+        self,
+        base_url: str = STATS_URL,
+        rate: float = 2,
+        pool_size: int = 8,
+        retries: int = 3,
+        backoff: float = 1,
+        timeout: float = 30,
+        headers: Optional[dict] = None,
+    ) -> None:
+        try:
+            import requests
+            from requests.adapters import HTTPAdapter
+        except Exception as exc:  # pragma: no cover - import failure
+            raise ImportError("requests is required to use StatsClient") from exc
+
+        if headers is None:
+            try:
+                from nba_api.stats.library.http import STATS_HEADERS
+            except Exception as exc:  # pragma: no cover - import failure
+                raise ImportError(
+                    "nba_api is required for the default headers, pass headers"
+                ) from exc
+            headers = STATS_HEADERS
+
+        self.base_url = base_url
+        self.bucket = TokenBucket(rate)
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update(headers)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._errors = (requests.ConnectionError, requests.Timeout)
+
+    def fetch(self, endpoint: str, params: dict) -> dict:
+        """
+        method to request an endpoint and return the raw json payload as a
+        dictionary
+
+        Inputs:
+        endpoint    - stats.nba.com endpoint name like playbyplayv2
+        params      - request parameters
+
+        Outputs:
+        payload     - the raw json payload as a dictionary
+        """
+        url = self.base_url.format(endpoint=endpoint.lower())
+        params = sorted(params.items())
+        for attempt in range(self.retries + 1):
+            self.bucket.acquire()
+            try:
+                response = self.session.get(url, params=params, timeout=self.timeout)
+            except self._errors:
+                if attempt == self.retries:
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUSES:
+                    response.raise_for_status()
+                    return response.json()
+                if attempt == self.retries:
+                    response.raise_for_status()
+            time.sleep(self.backoff * 2**attempt)
+
+    def close(self) -> None:
+        """
+        method to close the pooled connections
+        """
+        self.session.close()
+
+
+def load_pbp_many(
+    game_ids: Iterable[Union[int, str]],
+    max_concurrency: int = 8,
+    rate: float = 2,
+    cache: Optional[ResponseCache] = None,
+    schedule: Optional[Schedule] = None,
+    base_url: str = STATS_URL,
+    retries: int = 3,
+    backoff: float = 1,
+    timeout: float = 30,
+    headers: Optional[dict] = None,
+    failures: Optional[dict] = None,
+) -> Iterator[pd.DataFrame]:
+    """
+    function to load the play by play of many games concurrently. Games are
+    loaded by load_pbp in a thread pool sharing one StatsClient so all of
+    them together stay under the rate limit. Frames are yielded in the order
+    the games finish, not the order of game_ids, and only a few more games
+    than max_concurrency are in flight at a time so a long backfill doesn't
+    pile up frames in memory. By default the first game that fails to load
+    raises and every game still in flight or not started yet is dropped.
+    Pass a failures dictionary to skip failed games and keep going instead
+
+    Inputs:
+    game_ids        - NBA game ids to load
+    max_concurrency - number of games loaded at once
+    rate            - maximum requests started per second
+    cache           - optional ResponseCache, cached payloads aren't
+                      requested again and don't count against the rate
+    schedule        - optional Schedule to skip the box score summary
+                      requests
+    base_url        - url of the stats api with an {endpoint} placeholder
+    retries         - times a failed request is retried
+    backoff         - seconds to wait before the first retry, doubled after
+                      each one
+    timeout         - seconds to wait for a response
+    headers         - optional request headers, nba_api's by default
+    failures        - optional dictionary the exception of every game that
+                      fails is stored in, keyed by its game id
+
+    Outputs:
+    pbp_df          - play by play dataframe of each game as it finishes
+    """
+    client = StatsClient(
+        base_url=base_url,
+        rate=rate,
+        pool_size=max_concurrency,
+        retries=retries,
+        backoff=backoff,
+        timeout=timeout,
+        headers=headers,
+    )
+    game_ids = iter(game_ids)
+    pending = {}
+    executor = ThreadPoolExecutor(max_workers=max_concurrency)
+    try:
+
+        def submit(count: int) -> None:
+            for game_id in game_ids:
+                future = executor.submit(
+                    load_pbp,
+                    game_id,
+                    cache=cache,
+                    schedule=schedule,
+                    fetcher=client.fetch,
+                )
+                pending[future] = game_id
+                count -= 1
+                if count == 0:
+                    return
+
+        submit(2 * max_concurrency)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                game_id = pending.pop(future)
+                if failures is not None and future.exception() is not None:
+                    failures[game_id] = future.exception()
+                    continue
+                yield future.result()
+            submit(len(done))
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
+        client.close()
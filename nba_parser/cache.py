@@ -0,0 +1,186 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+from pathlib import Path
+from typing import Iterable, Optional, Union
+
+import pandas as pd
+
+from .pbp import PbP
+
+# bump this whenever the stat definitions in PbP change so every cached game
+# is recomputed the next time it's requested. The default cache version also
+# includes a digest of the stat code so edits to it can't be missed
+STATS_VERSION = "1"
+
+
+# modules the cached outputs are computed with, PbP itself, the registry it
+# looks names up in and the output conversion it returns through
+STATS_MODULES = ["pbp.py", "registry.py", "arrowtable.py"]
+
+
+def stats_code_digest() -> str:
+    """
+    function to hash the source of the modules the cached stats are computed
+    with, so a cache never serves stats from a different version of the code.
+    Changes the digest can't see, like a pandas upgrade that changes results,
+    still need a STATS_VERSION bump
+    """
+    digest = hashlib.sha1()
+    for module in STATS_MODULES:
+        digest.update(Path(__file__).with_name(module).read_bytes())
+
+    return digest.hexdigest()[:8]
+
+
+class PbPCache:
+    """
+    This class keeps the playerbygamestats(), teambygamestats() and
+    rapm_possessions() outputs of each game on disk as compressed parquet or
+    feather files. Entries are keyed by game_id, a hash of the raw play by
+    play events and the stats version, which defaults to STATS_VERSION plus a
+    digest of the stat code, so a game is only recomputed when its events or
+    the stat code change. Writing a new entry for a game removes the stale
+    ones
+    """
+
+    outputs = ["playerbygamestats", "teambygamestats", "rapm_possessions"]
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        version: Optional[str] = None,
+        file_format: str = "parquet",
+    ) -> None:
+        if file_format not in ["parquet", "feather"]:
+            raise ValueError(
+                f"file_format must be parquet or feather not {file_format}"
+            )
+        try:
+            import pyarrow  # noqa: F401
+        except Exception as exc:  # pragma: no cover - import failure
+            raise ImportError("pyarrow is required to use PbPCache") from exc
+
+        self.path = Path(path)
+        if version is None:
+            version = f"{STATS_VERSION}.{stats_code_digest()}"
+        self.version = str(version)
+        self.file_format = file_format
+
+    @staticmethod
+    def content_hash(pbp_df: pd.DataFrame) -> str:
+        """
+        function to hash the raw play by play events of a game. This has to be
+        run before the dataframe is passed to PbP as PbP adds columns to it
+        """
+        digest = hashlib.sha1()
+        digest.update("\x1f".join(map(str, pbp_df.columns)).encode())
+        digest.update(pd.util.hash_pandas_object(pbp_df, index=False).to_numpy())
+
+        return digest.hexdigest()[:16]
+
+    def _game_dir(self, game_id: int) -> Path:
+        return self.path / str(int(game_id))
+
+    def _file(self, game_id: int, output: str, digest: str) -> Path:
+        return (
+            self._game_dir(game_id)
+            / f"{output}-{digest}-v{self.version}.{self.file_format}"
+        )
+
+    def get(
+        self, game_id: int, digest: str
+    ) -> Optional[tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]]:
+        """
+        method to read the cached outputs of a game, returns None if any of
+        them are missing for this hash and version
+        """
+        files = [self._file(game_id, output, digest) for output in self.outputs]
+        if not all(file.exists() for file in files):
+            return None
+        if self.file_format == "parquet":
+            return tuple(pd.read_parquet(file) for file in files)
+
+        return tuple(pd.read_feather(file) for file in files)
+
+    def put(
+        self,
+        game_id: int,
+        digest: str,
+        frames: tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame],
+    ) -> None:
+        """
+        method to write the outputs of a game and remove any entries of the
+        game with an older hash or version. Files are written under a
+        temporary name and renamed so readers never see half written files
+        """
+        game_dir = self._game_dir(game_id)
+        game_dir.mkdir(parents=True, exist_ok=True)
+        # the process and thread ids keep concurrent writers from sharing a
+        # temporary name
+        writer = f"{os.getpid()}.{threading.get_ident()}"
+        current = []
+        for output, frame in zip(self.outputs, frames):
+            file = self._file(game_id, output, digest)
+            tmp_file = file.with_name(f".{file.name}.{writer}.tmp")
+            frame = frame.reset_index(drop=True)
+            if self.file_format == "parquet":
+                frame.to_parquet(tmp_file, index=False, compression="zstd")
+            else:
+                frame.to_feather(tmp_file, compression="zstd")
+            os.replace(tmp_file, file)
+            current.append(file)
+
+        for file in game_dir.iterdir():
+            if file not in current and not file.name.startswith("."):
+                file.unlink()
+
+    def game_stats(
+        self, pbp_df: pd.DataFrame
+    ) -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+        """
+        method to get the stats of one game from the cache, computing and
+        storing them first if the game's events or the stats version changed
+
+        Inputs:
+        pbp_df  - raw play by play dataframe like the output of load_pbp()
+
+        Outputs:
+        pbg_df  - PbP.playerbygamestats()
+        tbg_df  - PbP.teambygamestats()
+        rapm_df - PbP.rapm_possessions() with a fresh index
+        """
+        game_id = pbp_df["game_id"].iloc[0]
+        digest = self.content_hash(pbp_df)
+        frames = self.get(game_id, digest)
+        if frames is None:
+            pbp = PbP(pbp_df.copy())
+            frames = (
+                pbp.playerbygamestats(),
+                pbp.teambygamestats(),
+                pbp.rapm_possessions().reset_index(drop=True),
+            )
+            self.put(game_id, digest, frames)
+
+        return frames
+
+    def season_stats(
+        self, pbp_dfs: Iterable[pd.DataFrame]
+    ) -> tuple[list[pd.DataFrame], list[pd.DataFrame], list[pd.DataFrame]]:
+        """
+        method to run game_stats() over many games and return lists of the
+        player, team and rapm possession dataframes ready for PlayerTotals and
+        TeamTotals
+        """
+        pbg_dfs = []
+        tbg_dfs = []
+        rapm_dfs = []
+        for pbp_df in pbp_dfs:
+            pbg_df, tbg_df, rapm_df = self.game_stats(pbp_df)
+            pbg_dfs.append(pbg_df)
+            tbg_dfs.append(tbg_df)
+            rapm_dfs.append(rapm_df)
+
+        return pbg_dfs, tbg_dfs, rapm_dfs
@@ -1,28 +1,554 @@
 from __future__ import annotations
 
+import json
+import tempfile
 from pathlib import Path
-from typing import Optional, Union
+from typing import TYPE_CHECKING, Callable, Iterable, Iterator, Optional, Union
 
+import numpy as np
 import pandas as pd
 
+from .responsecache import ResponseCache, fetch_nba_stats
+
+if TYPE_CHECKING:
+    from .schedule import Schedule
+
+# dtypes of every play by play column. Ids that are blank for team events use
+# pandas' nullable integers so they don't come back as floats and the low
+# cardinality strings are categoricals. game_date is parsed as a date
+PBP_SCHEMA = {
+    "game_id": "int64",
+    "eventnum": "int64",
+    "eventmsgtype": "int64",
+    "eventmsgactiontype": "int64",
+    "period": "int64",
+    "wctimestring": "object",
+    "pctimestring": "object",
+    "homedescription": "object",
+    "neutraldescription": "object",
+    "visitordescription": "object",
+    "score": "object",
+    "scoremargin": "object",
+    "person1type": "Int64",
+    "player1_id": "int64",
+    "player1_name": "object",
+    "player1_team_id": "Int64",
+    "player1_team_city": "category",
+    "player1_team_nickname": "category",
+    "player1_team_abbreviation": "category",
+    "person2type": "Int64",
+    "player2_id": "int64",
+    "player2_name": "object",
+    "player2_team_id": "Int64",
+    "player2_team_city": "category",
+    "player2_team_nickname": "category",
+    "player2_team_abbreviation": "category",
+    "person3type": "Int64",
+    "player3_id": "int64",
+    "player3_name": "object",
+    "player3_team_id": "Int64",
+    "player3_team_city": "category",
+    "player3_team_nickname": "category",
+    "player3_team_abbreviation": "category",
+    "video_available_flag": "int64",
+    "home_team_abbrev": "category",
+    "away_team_abbrev": "category",
+    "home_team_id": "int64",
+    "away_team_id": "int64",
+    "game_date": "datetime64[ns]",
+    "season": "int64",
+    "event_team": "category",
+    "event_type_de": "category",
+    "shot_type_de": "category",
+    "shot_made": "float64",
+    "is_block": "int64",
+    "shot_type": "category",
+    "seconds_elapsed": "int64",
+    "event_length": "float64",
+    "is_three": "int64",
+    "points_made": "int64",
+    "is_o_rebound": "int64",
+    "is_d_rebound": "int64",
+    "is_turnover": "int64",
+    "is_steal": "int64",
+    "foul_type": "category",
+    "is_putback": "int64",
+}
+for _side in ["home", "away"]:
+    for _i in range(1, 6):
+        PBP_SCHEMA[f"{_side}_player_{_i}"] = "object"
+        PBP_SCHEMA[f"{_side}_player_{_i}_id"] = "int64"
+
+_PARSE_DTYPES = {"Int64": "float64", "category": "object"}
+
+_TEAM_ABBREV_COLUMNS = [
+    "player1_team_abbreviation",
+    "player2_team_abbreviation",
+    "player3_team_abbreviation",
+    "home_team_abbrev",
+    "away_team_abbrev",
+    "event_team",
+]
+
+# columns PbP needs for each of its outputs. Every output needs the event
+# player and lineup columns because PbP builds its name registry from them
+_SHARED_COLUMNS = [
+    "game_id",
+    "homedescription",
+    "visitordescription",
+    "scoremargin",
+    "player1_id",
+    "player1_name",
+    "player2_id",
+    "player2_name",
+    "player3_id",
+    "player3_name",
+    "home_team_abbrev",
+    "away_team_abbrev",
+    "home_team_id",
+    "away_team_id",
+    "game_date",
+    "season",
+    "event_team",
+    "event_type_de",
+    "seconds_elapsed",
+    "points_made",
+    "is_o_rebound",
+    "is_d_rebound",
+] + [
+    f"{side}_player_{i}{suffix}"
+    for side in ["home", "away"]
+    for i in range(1, 6)
+    for suffix in ["", "_id"]
+]
+PBP_STAT_COLUMNS = {
+    "playerbygamestats": _SHARED_COLUMNS
+    + [
+        "eventnum",
+        "eventmsgactiontype",
+        "period",
+        "pctimestring",
+        "player1_team_id",
+        "player2_team_id",
+        "player3_team_id",
+        "shot_made",
+        "is_block",
+        "event_length",
+        "is_three",
+        "is_turnover",
+        "is_steal",
+    ],
+    "teambygamestats": _SHARED_COLUMNS
+    + [
+        "eventnum",
+        "eventmsgactiontype",
+        "player1_team_id",
+        "player2_team_id",
+        "player3_team_id",
+        "is_block",
+        "is_three",
+        "is_turnover",
+        "is_steal",
+    ],
+    "rapm_possessions": _SHARED_COLUMNS,
+}
+
+
+def pbp_usecols(stats: Iterable[str]) -> list[str]:
+    """
+    function to list the play by play columns needed to calculate some of the
+    PbP outputs, in file order
+
+    Inputs:
+    stats   - names of PbP methods like playerbygamestats or rapm_possessions
+
+    Outputs:
+    columns - column names to pass as usecols
+    """
+    needed = set()
+    for stat in stats:
+        if stat not in PBP_STAT_COLUMNS:
+            raise ValueError(f"{stat} must be one of {', '.join(PBP_STAT_COLUMNS)}")
+        needed.update(PBP_STAT_COLUMNS[stat])
+
+    return [column for column in PBP_SCHEMA if column in needed]
+
+
+def apply_pbp_schema(pbp_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    function to convert the columns of a play by play dataframe to their
+    PBP_SCHEMA dtypes. Columns that aren't in the schema are left alone
+
+    Inputs:
+    pbp_df  - play by play dataframe
+
+    Outputs:
+    pbp_df  - dataframe with converted columns
+    """
+    # team abbreviation columns get compared to each other so they have to
+    # share the same categories
+    abbrev_columns = [
+        column for column in _TEAM_ABBREV_COLUMNS if column in pbp_df.columns
+    ]
+    abbrevs = set()
+    for column in abbrev_columns:
+        abbrevs.update(pbp_df[column].dropna().unique())
+    abbrev_dtype = pd.CategoricalDtype(sorted(abbrevs))
+
+    dtypes = {}
+    for column, dtype in pbp_df.dtypes.items():
+        if column in abbrev_columns:
+            if dtype != abbrev_dtype:
+                dtypes[column] = abbrev_dtype
+        elif column in PBP_SCHEMA and str(dtype) != PBP_SCHEMA[column]:
+            dtypes[column] = PBP_SCHEMA[column]
+
+    return pbp_df.astype(dtypes) if dtypes else pbp_df
+
+
+def _csv_read_args(
+    csv_path: Union[str, Path],
+    stats: Optional[Iterable[str]] = None,
+    engine: Optional[str] = None,
+) -> dict:
+    """
+    function to build the read_csv arguments that read a play by play csv
+    with the PBP_SCHEMA dtypes, before apply_pbp_schema converts them
+    """
+    columns = list(PBP_SCHEMA)
+    usecols = None
+    if stats is not None:
+        columns = pbp_usecols(stats)
+        usecols = columns
+    if engine == "pyarrow":
+        # the pyarrow engine fails on dtypes or usecols of columns the file
+        # doesn't have
+        header = set(pd.read_csv(csv_path, nrows=0).columns)
+        columns = [column for column in columns if column in header]
+        usecols = columns if usecols is not None else None
+    elif usecols is not None:
+        needed = set(usecols)
+        usecols = needed.__contains__
+
+    # the csv parser is a lot slower building nullable integers and
+    # categoricals than converting plain columns afterwards
+    dtype = {
+        column: _PARSE_DTYPES.get(PBP_SCHEMA[column], PBP_SCHEMA[column])
+        for column in columns
+        if PBP_SCHEMA[column] != "datetime64[ns]"
+    }
+    dates = [column for column in columns if PBP_SCHEMA[column] == "datetime64[ns]"]
+
+    kwargs = {"usecols": usecols, "dtype": dtype, "parse_dates": dates}
+    if engine is not None:
+        kwargs["engine"] = engine
+
+    return kwargs
+
+
+def read_pbp_csv(
+    csv_path: Union[str, Path],
+    stats: Optional[Iterable[str]] = None,
+    engine: Optional[str] = None,
+) -> pd.DataFrame:
+    """
+    function to read a saved play by play csv with the declared PBP_SCHEMA
+    dtypes instead of inferring them. Columns that aren't in the schema are
+    read with inferred types
+
+    Inputs:
+    csv_path    - path of the csv
+    stats       - optional PbP method names, only the columns they need are
+                  read
+    engine      - optional pandas csv engine, "pyarrow" reads with multiple
+                  threads
+
+    Outputs:
+    pbp_df      - play by play dataframe ready for PbP
+    """
+    pbp_df = pd.read_csv(csv_path, **_csv_read_args(csv_path, stats, engine))
+
+    return apply_pbp_schema(pbp_df)
+
+
+def iter_games_csv(
+    csv_path: Union[str, Path],
+    chunksize: int = 100_000,
+    stats: Optional[Iterable[str]] = None,
+    presorted: bool = True,
+    spill_dir: Optional[Union[str, Path]] = None,
+) -> Iterator[pd.DataFrame]:
+    """
+    function to walk a csv holding the play by play of many games, like a
+    whole season, in chunks and yield one game at a time ready for PbP. When
+    the rows of each game are next to each other only the game being read is
+    kept in memory. Otherwise pass presorted=False and every game's rows are
+    first spilled to their own file in a temporary directory and read back
+    one at a time
+
+    Inputs:
+    csv_path    - path of the csv
+    chunksize   - rows read from the csv at a time
+    stats       - optional PbP method names, only the columns they need are
+                  read
+    presorted   - whether the rows of each game are contiguous, a game that
+                  shows up again after another one raises a ValueError
+    spill_dir   - optional directory for the temporary spill files of an
+                  unsorted csv
+
+    Outputs:
+    pbp_df      - play by play dataframe of each game in file order
+    """
+    read_args = _csv_read_args(csv_path, stats)
+    if not presorted:
+        yield from _iter_spilled_games(csv_path, chunksize, read_args, spill_dir)
+        return
+
+    finished = set()
+
+    def finish(pieces: list) -> pd.DataFrame:
+        game_id = pieces[0]["game_id"].iat[0]
+        if game_id in finished:
+            raise ValueError(
+                f"rows of game {game_id} aren't contiguous in {csv_path}, "
+                "read it with presorted=False"
+            )
+        finished.add(game_id)
+
+        return apply_pbp_schema(pd.concat(pieces, ignore_index=True))
+
+    pieces = []
+    for chunk in pd.read_csv(csv_path, chunksize=chunksize, **read_args):
+        game_ids = chunk["game_id"].to_numpy()
+        starts = np.flatnonzero(np.r_[True, game_ids[1:] != game_ids[:-1]])
+        for start, end in zip(starts, np.r_[starts[1:], len(chunk)]):
+            if pieces and pieces[0]["game_id"].iat[0] != game_ids[start]:
+                yield finish(pieces)
+                pieces = []
+            pieces.append(chunk.iloc[start:end])
+    if pieces:
+        yield finish(pieces)
+
+
+def _iter_spilled_games(
+    csv_path: Union[str, Path],
+    chunksize: int,
+    read_args: dict,
+    spill_dir: Optional[Union[str, Path]],
+) -> Iterator[pd.DataFrame]:
+    """
+    function to split an unsorted play by play csv into one temporary file
+    per game and yield the games in the order they first show up
+    """
+    with tempfile.TemporaryDirectory(dir=spill_dir) as tmp_dir:
+        spill_files = {}
+        for chunk in pd.read_csv(csv_path, chunksize=chunksize, **read_args):
+            for game_id, game_df in chunk.groupby("game_id", sort=False):
+                new_file = game_id not in spill_files
+                if new_file:
+                    spill_files[game_id] = Path(tmp_dir) / f"{game_id}.csv"
+                game_df.to_csv(
+                    spill_files[game_id], mode="a", header=new_file, index=False
+                )
+
+        for spill_file in spill_files.values():
+            yield read_pbp_csv(spill_file)
+            spill_file.unlink()
+
+
+def result_set_frame(payload: dict, index: int = 0) -> pd.DataFrame:
+    """
+    function to turn one result set of a raw stats.nba.com payload into a
+    dataframe with lowercase column names
+    """
+    result_sets = payload.get("resultSets", payload.get("resultSet"))
+    if isinstance(result_sets, dict):
+        result_sets = [result_sets]
+    result_set = result_sets[index]
+
+    return pd.DataFrame(
+        result_set["rowSet"], columns=[c.lower() for c in result_set["headers"]]
+    )
+
+
+def _loads(payload: Union[bytes, str]) -> dict:
+    """
+    function to parse raw json with orjson if it's installed
+    """
+    try:
+        import orjson
+    except ImportError:
+        return json.loads(payload)
+
+    return orjson.loads(payload)
+
+
+def _decode_column(values: tuple, kind: Optional[str]) -> np.ndarray:
+    """
+    function to turn the values of one rowSet column into an array of its
+    PBP_SCHEMA dtype, categoricals are left as object arrays
+    """
+    if kind == "int64":
+        try:
+            return np.array(values, dtype=np.int64)
+        except (TypeError, ValueError):
+            # blanks where the schema expects none, keep them as nulls
+            kind = "Int64"
+    if kind == "Int64":
+        floats = np.array(values, dtype=np.float64)
+        mask = np.isnan(floats)
+        return pd.arrays.IntegerArray(np.where(mask, 0, floats).astype(np.int64), mask)
+    if kind == "float64":
+        return np.array(values, dtype=np.float64)
+
+    # json nulls become NaN like they do when the same column is read from a csv
+    array = np.array(values, dtype=object)
+    array[pd.isnull(array)] = np.nan
+
+    return array
+
+
+def decode_pbp_payload(payload: Union[bytes, str, dict]) -> pd.DataFrame:
+    """
+    function to decode a PlayByPlayV2 payload straight into a dataframe with
+    lowercase column names and the PBP_SCHEMA dtypes. The rowSet is
+    transposed once and each column is built as a typed array instead of
+    going through an object dataframe first. Raw json bytes or strings, like
+    a cached response body, are parsed with orjson if it's installed
+
+    Inputs:
+    payload - PlayByPlayV2 json as bytes, a string or an already parsed
+              dictionary
+
+    Outputs:
+    pbp_df  - play by play dataframe of the raw api columns
+    """
+    if isinstance(payload, (bytes, bytearray, str)):
+        payload = _loads(payload)
+    result_sets = payload.get("resultSets", payload.get("resultSet"))
+    if isinstance(result_sets, dict):
+        result_sets = [result_sets]
+    result_set = next(
+        (rs for rs in result_sets if rs.get("name") == "PlayByPlay"), result_sets[0]
+    )
+
+    headers = [header.lower() for header in result_set["headers"]]
+    rows = result_set["rowSet"]
+    values = zip(*rows) if rows else [() for _ in headers]
+    columns = {
+        header: _decode_column(column, PBP_SCHEMA.get(header))
+        for header, column in zip(headers, values)
+    }
+
+    # team abbreviation columns share their categories like apply_pbp_schema
+    abbrevs = set()
+    for header in _TEAM_ABBREV_COLUMNS:
+        if header in columns:
+            abbrevs.update(columns[header][pd.notnull(columns[header])])
+    abbrev_dtype = pd.CategoricalDtype(sorted(abbrevs))
+    for header in columns:
+        if header in _TEAM_ABBREV_COLUMNS:
+            columns[header] = pd.Categorical(columns[header], dtype=abbrev_dtype)
+        elif PBP_SCHEMA.get(header) == "category":
+            columns[header] = pd.Categorical(columns[header])
+
+    return pd.DataFrame(columns, columns=headers)
+
+
+def _jump_ball_teams(pbp_df: pd.DataFrame) -> tuple:
+    """
+    function to get the home and away team abbreviations and ids from the
+    first jump ball of a game, the player whose description is in the home
+    column is on the home team. Works on the column arrays so no rows are
+    built
+
+    Inputs:
+    pbp_df  - play by play dataframe of the raw api columns
+
+    Outputs:
+    teams   - home_team_abbrev, away_team_abbrev, home_team_id, away_team_id
+    """
+    jump_balls = np.flatnonzero(pbp_df["eventmsgtype"].to_numpy() == 10)
+    if len(jump_balls) == 0:
+        raise ValueError("there is no jump ball to find the home and away teams")
+    row = jump_balls[0]
+    if pd.notnull(pbp_df["homedescription"].to_numpy()[row]):
+        home, away = "player1", "player2"
+    else:
+        home, away = "player2", "player1"
+
+    return (
+        pbp_df[f"{home}_team_abbreviation"].to_numpy()[row],
+        pbp_df[f"{away}_team_abbreviation"].to_numpy()[row],
+        int(pbp_df[f"{home}_team_id"].to_numpy()[row]),
+        int(pbp_df[f"{away}_team_id"].to_numpy()[row]),
+    )
+
+
+def _pbp_is_final(payload: dict) -> bool:
+    """
+    function to guess from a PlayByPlayV2 payload whether the game is over,
+    the last event has to be the end of the fourth period or later with a
+    score that isn't tied
+    """
+    df = result_set_frame(payload)
+    if df.empty or df["eventmsgtype"].iloc[-1] != 13 or df["period"].iloc[-1] < 4:
+        return False
+    scores = df["score"].dropna()
+    if scores.empty:
+        return False
+    away_score, home_score = scores.iloc[-1].split(" - ")
+
+    return away_score != home_score
+
+
+def _summary_is_final(payload: dict) -> bool:
+    """
+    function to check the game status of a BoxScoreSummaryV2 payload
+    """
+    return int(result_set_frame(payload)["game_status_id"].iloc[0]) == 3
+
 
 def load_pbp(
-    game_id: Union[int, str], csv_path: Optional[Union[str, Path]] = None
+    game_id: Union[int, str],
+    csv_path: Optional[Union[str, Path]] = None,
+    cache: Optional[ResponseCache] = None,
+    stats: Optional[Iterable[str]] = None,
+    engine: Optional[str] = None,
+    schedule: Optional[Schedule] = None,
+    fetcher: Optional[Callable[[str, dict], dict]] = None,
 ) -> pd.DataFrame:
     """Load a play-by-play dataframe.
 
     If ``csv_path`` is provided and points to an existing file, the data is
-    loaded from that CSV. Otherwise the function will attempt to pull data from
-    the official NBA Stats API using ``nba_api``.
+    loaded from that CSV using the dtypes declared in ``PBP_SCHEMA``. Otherwise
+    the function will attempt to pull data from the official NBA Stats API
+    using ``nba_api``.
 
     Parameters
     ----------
     game_id:
         The NBA game id to load. When ``csv_path`` is ``None`` the id is passed
-        to :class:`nba_api.stats.endpoints.PlayByPlayV2`.
+        to the ``playbyplayv2`` endpoint.
     csv_path:
         Optional path to a CSV file. If present, the CSV is read instead of
         calling the API.
+    cache:
+        Optional :class:`~nba_parser.responsecache.ResponseCache`. The raw API
+        payloads are read from and stored in it instead of being requested
+        every time.
+    stats:
+        Optional names of the PbP methods the data is loaded for, like
+        ``["playerbygamestats"]``. Only the CSV columns they need are read.
+    engine:
+        Optional pandas CSV engine, ``"pyarrow"`` reads with multiple threads.
+    schedule:
+        Optional :class:`~nba_parser.schedule.Schedule`. The game date and
+        home and away teams are taken from it and ``boxscoresummaryv2`` is
+        only requested for games it doesn't have.
+    fetcher:
+        Optional function taking an endpoint name and parameters that returns
+        the raw payload, used instead of ``nba_api`` to make the requests.
 
     Returns
     -------
@@ -31,43 +557,46 @@ def load_pbp(
     """
 
     if csv_path is not None and Path(csv_path).exists():
-        return pd.read_csv(csv_path)
+        return read_pbp_csv(csv_path, stats, engine)
 
-    try:
-        from nba_api.stats.endpoints import PlayByPlayV2, BoxScoreSummaryV2
-    except Exception as exc:  # pragma: no cover - import failure
-        raise ImportError(
-            "nba_api is required to fetch play-by-play data"
-        ) from exc
+    def fetch(endpoint: str, params: dict, is_final=None) -> dict:
+        if cache is not None:
+            return cache.fetch(endpoint, params, is_final, fetcher)
+        if fetcher is not None:
+            return fetcher(endpoint, params)
+        return fetch_nba_stats(endpoint, params)
 
     game_id_str = str(game_id).zfill(10)
 
-    pbp_endpoint = PlayByPlayV2(game_id=game_id_str, start_period=1, end_period=14)
-    df = pbp_endpoint.get_data_frames()[0]
+    pbp_payload = fetch(
+        "playbyplayv2",
+        {"GameID": game_id_str, "StartPeriod": 1, "EndPeriod": 14},
+        _pbp_is_final,
+    )
+    df = decode_pbp_payload(pbp_payload)
 
-    df.columns = [c.lower() for c in df.columns]
-
-    jump_ball = df[df["eventmsgtype"] == 10].iloc[0]
-
-    if pd.notnull(jump_ball["homedescription"]):
-        home_team_abbrev = jump_ball["player1_team_abbreviation"]
-        away_team_abbrev = jump_ball["player2_team_abbreviation"]
-        home_team_id = jump_ball["player1_team_id"]
-        away_team_id = jump_ball["player2_team_id"]
+    game = schedule.lookup(game_id_str) if schedule is not None else None
+    if game is not None:
+        df["home_team_abbrev"] = game["home_team_abbrev"]
+        df["away_team_abbrev"] = game["away_team_abbrev"]
+        df["home_team_id"] = game["home_team_id"]
+        df["away_team_id"] = game["away_team_id"]
+        df["game_date"] = game["game_date"]
     else:
-        home_team_abbrev = jump_ball["player2_team_abbreviation"]
-        away_team_abbrev = jump_ball["player1_team_abbreviation"]
-        home_team_id = jump_ball["player2_team_id"]
-        away_team_id = jump_ball["player1_team_id"]
-
-    df["home_team_abbrev"] = home_team_abbrev
-    df["away_team_abbrev"] = away_team_abbrev
-    df["home_team_id"] = home_team_id
-    df["away_team_id"] = away_team_id
+        (
+            df["home_team_abbrev"],
+            df["away_team_abbrev"],
+            df["home_team_id"],
+            df["away_team_id"],
+        ) = _jump_ball_teams(df)
 
-    summary_endpoint = BoxScoreSummaryV2(game_id=game_id_str)
-    game_date_str = summary_endpoint.get_data_frames()[0]["GAME_DATE_EST"].iloc[0].split("T")[0]
-    df["game_date"] = game_date_str
+        summary_payload = fetch(
+            "boxscoresummaryv2", {"GameID": game_id_str}, _summary_is_final
+        )
+        game_date_str = (
+            result_set_frame(summary_payload)["game_date_est"].iloc[0].split("T")[0]
+        )
+        df["game_date"] = game_date_str
 
     season_code = int(game_id_str[3:5])
     if season_code >= 99:
@@ -76,4 +605,4 @@ def load_pbp(
         season = 2000 + season_code + 1
     df["season"] = season
 
-    return df
+    return apply_pbp_schema(df)
@@ -0,0 +1,585 @@
+from __future__ import annotations
+
+from itertools import combinations
+from typing import Iterable, Optional, Union
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from .pbp import PbP
+from .registry import Registry
+from .teamtotals import TeamTotals
+
+
+def lineup_keys(player_ids: np.ndarray) -> np.ndarray:
+    """
+    function to give every five man unit a canonical 64 bit key. The ids in
+    each row are sorted so the order players are listed in doesn't matter and
+    then hashed together, FNV-1a style over whole ids with a splitmix64 finish
+
+    Inputs:
+    player_ids - N x 5 integer array of player ids
+
+    Outputs:
+    keys       - length N int64 array of lineup keys
+    """
+    ids = np.sort(np.asarray(player_ids, dtype=np.int64), axis=1).astype(np.uint64)
+    keys = np.full(len(ids), 0xCBF29CE484222325, dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        for i in range(ids.shape[1]):
+            keys ^= ids[:, i]
+            keys *= np.uint64(0x100000001B3)
+        keys ^= keys >> np.uint64(30)
+        keys *= np.uint64(0xBF58476D1CE4E5B9)
+        keys ^= keys >> np.uint64(27)
+        keys *= np.uint64(0x94D049BB133111EB)
+        keys ^= keys >> np.uint64(31)
+
+    return keys.view(np.int64)
+
+
+class LineupTotals:
+    """
+    This class is used to calculate five man unit totals from the events of
+    many games. Each unit is reduced to one 64 bit lineup key so every
+    aggregation runs on a single integer column instead of five id or name
+    columns per side. The games can be PbP objects or their PbP.df dataframes
+    and can come from any iterable, they are folded into a running table of
+    five versus five matchups per game that the unit and matchup stats are
+    derived from
+
+    Free throws are credited to the units on the floor at the free throw event
+    rather than at the foul like PbP._plus_minus_calc_player() does
+    """
+
+    home_cols = [f"home_player_{i}_id" for i in range(1, 6)]
+    away_cols = [f"away_player_{i}_id" for i in range(1, 6)]
+    matchup_keys = [
+        "game_id",
+        "lineup_key",
+        "opponent_lineup_key",
+        "team_id",
+        "opponent",
+    ]
+    side_stats = ["fgm", "fga", "tpm", "tpa", "ftm", "fta", "tov", "oreb", "dreb"]
+
+    def __init__(
+        self,
+        games: Iterable[Union[PbP, pd.DataFrame]],
+        registry: Optional[Registry] = None,
+        batch_size: int = 100,
+    ):
+        self._registry = registry
+        self._game_registry = Registry()
+        self.batch_size = batch_size
+        self.matchups = None
+        self.lineups = pd.DataFrame(
+            columns=[f"player_{i}_id" for i in range(1, 6)], dtype=np.int64
+        )
+        self.add_games(games)
+
+    @property
+    def registry(self) -> Registry:
+        if self._registry is not None:
+            return self._registry
+        return self._game_registry
+
+    def add_games(self, games: Iterable[Union[PbP, pd.DataFrame]]) -> LineupTotals:
+        """
+        method to fold more games into the running matchup table
+        """
+        batch = []
+        for game in games:
+            if isinstance(game, PbP):
+                self._game_registry = self._game_registry.merge(game.registry)
+                game = game.df
+            elif self._registry is None:
+                self._game_registry = self._game_registry.merge(
+                    Registry.from_events(game)
+                )
+            batch.append(self._game_matchups(game))
+            if len(batch) >= self.batch_size:
+                self._fold(batch)
+                batch = []
+        if batch:
+            self._fold(batch)
+
+        return self
+
+    def _game_matchups(self, df: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame]:
+        """
+        method to reduce one game's events to home versus away unit stints
+        with the stats of both sides. Also returns the member ids of every
+        lineup key seen in the game
+        """
+        home_ids = df[self.home_cols].to_numpy(dtype=np.int64)
+        away_ids = df[self.away_cols].to_numpy(dtype=np.int64)
+        home_keys = lineup_keys(home_ids)
+        away_keys = lineup_keys(away_ids)
+
+        home_event = (df["event_team"] == df["home_team_abbrev"]).to_numpy()
+        away_event = (df["event_team"] == df["away_team_abbrev"]).to_numpy()
+        points = df["points_made"].to_numpy()
+        # box score counts go to the team of player1 like PbP.teambygamestats(),
+        # team ids can be nullable integers that are blank for team events
+        home_stat = (df["player1_team_id"] == df["home_team_id"]).to_numpy(
+            dtype=bool, na_value=False
+        )
+        away_stat = (df["player1_team_id"] == df["away_team_id"]).to_numpy(
+            dtype=bool, na_value=False
+        )
+
+        events = pd.DataFrame(
+            {
+                "game_id": df["game_id"].to_numpy(dtype=np.int64),
+                "lineup_key": home_keys,
+                "opponent_lineup_key": away_keys,
+                "team_id": df["home_team_id"].to_numpy(dtype=np.int64),
+                "opponent": df["away_team_id"].to_numpy(dtype=np.int64),
+                "seconds": df["event_length"].fillna(0).to_numpy(),
+                "possessions": df["home_possession"].to_numpy(),
+                "possessions_opponent": df["away_possession"].to_numpy(),
+                "points_for": np.where(home_event, points, 0),
+                "points_against": np.where(away_event, points, 0),
+            }
+        )
+        for stat, values in self._event_counts(df).items():
+            events[stat] = np.where(home_stat, values, 0)
+            events[f"{stat}_opponent"] = np.where(away_stat, values, 0)
+        matchups = events.groupby(self.matchup_keys, sort=False).sum().reset_index()
+
+        lineups = pd.DataFrame(
+            np.sort(np.concatenate([home_ids, away_ids]), axis=1),
+            index=np.concatenate([home_keys, away_keys]),
+            columns=self.lineups.columns,
+        )
+
+        return matchups, lineups[~lineups.index.duplicated()]
+
+    @staticmethod
+    def _event_counts(df: pd.DataFrame) -> dict[str, np.ndarray]:
+        """
+        function to flag the field goals, free throws, turnovers and rebounds
+        of each event the same way the PbP team stat methods count them
+        """
+        event_type = df["event_type_de"]
+        points = df["points_made"]
+        is_ft = event_type == "free-throw"
+
+        counts = {
+            "fgm": (event_type == "shot") & (points > 0),
+            "fga": event_type.isin(["missed_shot", "shot"]),
+            "tpm": points == 3,
+            "tpa": df["is_three"] == 1,
+            "ftm": is_ft & (points == 1),
+            "fta": is_ft,
+            "tov": df["is_turnover"] == 1,
+            "oreb": df["is_o_rebound"] == 1,
+            "dreb": df["is_d_rebound"] == 1,
+        }
+
+        return {stat: flag.to_numpy(dtype=np.int64) for stat, flag in counts.items()}
+
+    def _fold(self, batch: list[tuple[pd.DataFrame, pd.DataFrame]]) -> None:
+        """
+        method to add a batch of per game matchups to the running table
+        """
+        lineups = pd.concat([self.lineups] + [game[1] for game in batch])
+        lineups = lineups.reset_index().drop_duplicates()
+        if lineups["index"].duplicated().any():
+            raise ValueError("two different lineups hashed to the same key")
+        self.lineups = lineups.set_index("index").rename_axis(None)
+
+        matchups = [game[0] for game in batch]
+        if self.matchups is not None:
+            matchups.insert(0, self.matchups)
+        self.matchups = (
+            pd.concat(matchups)
+            .groupby(self.matchup_keys, sort=False)
+            .sum()
+            .reset_index()
+        )
+
+    def _both_sides(self) -> pd.DataFrame:
+        """
+        method to return the matchup table from the point of view of both the
+        home and away units so each unit shows up as lineup_key
+        """
+        columns = {
+            "lineup_key": "opponent_lineup_key",
+            "opponent_lineup_key": "lineup_key",
+            "team_id": "opponent",
+            "opponent": "team_id",
+            "points_for": "points_against",
+            "points_against": "points_for",
+        }
+        for stat in ["possessions"] + self.side_stats:
+            columns[stat] = f"{stat}_opponent"
+            columns[f"{stat}_opponent"] = stat
+        flipped = self.matchups.rename(columns=columns)
+
+        return pd.concat([self.matchups, flipped[self.matchups.columns]])
+
+    def _add_lineup_details(self, df: pd.DataFrame, key: str, prefix: str) -> None:
+        """
+        method to attach the member ids and a readable lineup string for the
+        lineup keys in a column
+        """
+        members = self.lineups.reindex(df[key].to_numpy())
+        for i, column in enumerate(members.columns):
+            df.insert(
+                df.columns.get_loc(key) + 1 + i,
+                f"{prefix}{column}",
+                members[column].to_numpy(),
+            )
+        names = [self.registry.player_names(members[c]) for c in members.columns]
+        df[f"{prefix}lineup"] = [", ".join(map(str, row)) for row in zip(*names)]
+
+    @staticmethod
+    def _add_rate_stats(df: pd.DataFrame) -> pd.DataFrame:
+        """
+        function to derive minutes and per 100 possession ratings from the
+        summed unit stats
+        """
+        df["minutes"] = df["seconds"] / 60
+        df["off_rating"] = df["points_for"] / df["possessions"] * 100
+        df["def_rating"] = df["points_against"] / df["possessions_opponent"] * 100
+        df["net_rating"] = df["off_rating"] - df["def_rating"]
+        df["plus_minus"] = df["points_for"] - df["points_against"]
+
+        return df.replace([np.inf, -np.inf], np.nan)
+
+    def _unit_totals(self, by_game: bool = False) -> pd.DataFrame:
+        """
+        method to sum the matchup table to one row per team and lineup_key, or
+        per game, team and lineup_key
+        """
+        keys = (
+            ["game_id", "team_id", "lineup_key"]
+            if by_game
+            else ["team_id", "lineup_key"]
+        )
+        units = self._both_sides().drop(columns=["opponent_lineup_key", "opponent"])
+        if not by_game:
+            units = units.drop(columns="game_id")
+
+        return units.groupby(keys).sum().reset_index()
+
+    def lineup_stats(self) -> pd.DataFrame:
+        """
+        method to return minutes, possessions, points for and against and
+        ratings for every five man unit
+
+        Outputs:
+        lineup_df - one row per team and lineup_key with the five member ids, a
+                    lineup string of their names and the unit's stats
+        """
+        lineup_df = self._unit_totals()
+        lineup_df.insert(
+            1, "team_abbrev", self.registry.team_abbrevs(lineup_df["team_id"])
+        )
+        self._add_lineup_details(lineup_df, "lineup_key", "")
+
+        return self._add_rate_stats(lineup_df)
+
+    def matchup_stats(self) -> pd.DataFrame:
+        """
+        method to return the stats of every five versus five matchup from the
+        point of view of each unit
+
+        Outputs:
+        matchup_df - one row per lineup_key and opponent_lineup_key with the
+                     member ids of both units and their stats against each other
+        """
+        keys = [key for key in self.matchup_keys if key != "game_id"]
+        matchup_df = (
+            self._both_sides()
+            .drop(columns="game_id")
+            .groupby(keys, sort=False)
+            .sum()
+            .reset_index()
+        )
+        matchup_df.insert(
+            matchup_df.columns.get_loc("team_id") + 1,
+            "team_abbrev",
+            self.registry.team_abbrevs(matchup_df["team_id"]),
+        )
+        self._add_lineup_details(matchup_df, "lineup_key", "")
+        self._add_lineup_details(matchup_df, "opponent_lineup_key", "opponent_")
+
+        return self._add_rate_stats(matchup_df)
+
+    def _roster_slots(
+        self, units: pd.DataFrame, teams: Optional[np.ndarray] = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        method to number every team and player pair in a unit table so each
+        unit becomes five roster slot indexes. Slots are numbered in team then
+        player id order so a unit's slots are sorted like its member ids
+
+        Inputs:
+        units       - unit table from _unit_totals()
+        teams       - optional integer per unit to use instead of team_id, like
+                      the index of its game and team
+
+        Outputs:
+        slots       - number of slots x 2 array of team and player ids
+        unit_slots  - units x 5 array of slot indexes
+        """
+        if teams is None:
+            teams = units["team_id"].to_numpy()
+        members = self.lineups.reindex(units["lineup_key"].to_numpy()).to_numpy()
+        slots, slot_index = np.unique(
+            np.column_stack(
+                [
+                    np.repeat(teams, members.shape[1]),
+                    members.ravel(),
+                ]
+            ),
+            axis=0,
+            return_inverse=True,
+        )
+
+        return slots, slot_index.reshape(members.shape)
+
+    def on_off_stats(self, by_game: bool = False) -> pd.DataFrame:
+        """
+        method to return every player's team stats with them on and off the
+        court. The units are mapped to (team, player) roster slots with a
+        sparse incidence matrix so the on court totals of the whole roster are
+        one matrix product, and the off court totals are the team totals minus
+        the on court ones. With by_game the slots are (game, team, player) so
+        every game's splits come out of the same products
+
+        Inputs:
+        by_game   - split each game separately instead of across all of them
+
+        Outputs:
+        on_off_df - two rows per team and player, court "on" and "off", with
+                    the summed stats, four factors and ratings of the team.
+                    With by_game there are two rows per game, team and player
+                    and a game_id column
+        """
+        keys = ["game_id", "team_id"] if by_game else ["team_id"]
+        units = self._unit_totals(by_game)
+        columns = units.columns.drop(keys + ["lineup_key"])
+        values = units[columns].to_numpy(dtype=np.float64)
+        teams, team_index = np.unique(
+            units[keys].to_numpy(), axis=0, return_inverse=True
+        )
+        team_index = team_index.ravel()
+        slots, unit_slots = self._roster_slots(units, team_index)
+        unit_rows = np.repeat(np.arange(len(units)), unit_slots.shape[1])
+
+        on_court = sparse.csr_matrix(
+            (np.ones(len(unit_rows)), (unit_rows, unit_slots.ravel())),
+            shape=(len(units), len(slots)),
+        )
+        team_units = sparse.csr_matrix(
+            (np.ones(len(units)), (np.arange(len(units)), team_index)),
+            shape=(len(units), len(teams)),
+        )
+
+        on = on_court.T @ values
+        team_totals = team_units.T @ values
+        off = team_totals[slots[:, 0]] - on
+
+        on_off_df = pd.DataFrame(np.vstack([on, off]), columns=columns)
+        on_off_df = on_off_df.astype(units[columns].dtypes.to_dict())
+        slot_teams = np.tile(teams[slots[:, 0]], (2, 1))
+        team_ids = slot_teams[:, -1]
+        player_ids = np.tile(slots[:, 1], 2)
+        on_off_df.insert(0, "team_id", team_ids)
+        on_off_df.insert(1, "team_abbrev", self.registry.team_abbrevs(team_ids))
+        on_off_df.insert(2, "player_id", player_ids)
+        on_off_df.insert(3, "player_name", self.registry.player_names(player_ids))
+        on_off_df.insert(4, "court", np.repeat(["on", "off"], len(slots)))
+        if by_game:
+            on_off_df.insert(0, "game_id", slot_teams[:, 0])
+        on_off_df = TeamTotals._add_rate_stats(on_off_df)
+        on_off_df = self._add_rate_stats(on_off_df)
+
+        return on_off_df.sort_values(
+            keys + ["player_id", "court"], ascending=[True] * len(keys) + [True, False]
+        ).reset_index(drop=True)
+
+    def _member_incidence(
+        self, keys: pd.Series, player_ids: np.ndarray
+    ) -> sparse.csr_matrix:
+        """
+        method to build a sparse rows x players matrix with a one for each
+        member of the lineup key in every row
+        """
+        members = self.lineups.reindex(keys.to_numpy()).to_numpy()
+        rows = np.repeat(np.arange(len(members)), members.shape[1])
+        columns = np.searchsorted(player_ids, members.ravel())
+
+        return sparse.csr_matrix(
+            (np.ones(len(rows)), (rows, columns)),
+            shape=(len(members), len(player_ids)),
+        )
+
+    def overlap_matrices(
+        self, weight: str = "seconds"
+    ) -> tuple[np.ndarray, sparse.csr_matrix, sparse.csr_matrix]:
+        """
+        method to return how long every pair of players shared the court as
+        teammates and as opponents. Both are sparse player x player products of
+        the matchup x player incidence matrices so nothing is densified no
+        matter how many games have been added
+
+        Inputs:
+        weight      - "seconds" or "possessions", possessions counts the
+                      possessions of both teams
+
+        Outputs:
+        player_ids  - sorted player ids labeling the rows and columns
+        teammates   - symmetric sparse matrix of time shared as teammates, the
+                      diagonal is each player's own total
+        opponents   - symmetric sparse matrix of time shared as opponents
+        """
+        if weight == "seconds":
+            weights = self.matchups["seconds"].to_numpy(dtype=np.float64)
+        elif weight == "possessions":
+            weights = (
+                self.matchups["possessions"] + self.matchups["possessions_opponent"]
+            ).to_numpy(dtype=np.float64)
+        else:
+            raise ValueError(f"weight must be seconds or possessions not {weight}")
+
+        player_ids = np.unique(self.lineups.to_numpy())
+        home = self._member_incidence(self.matchups["lineup_key"], player_ids)
+        away = self._member_incidence(self.matchups["opponent_lineup_key"], player_ids)
+        weighted_home = home.multiply(weights[:, None]).tocsr()
+        weighted_away = away.multiply(weights[:, None]).tocsr()
+
+        teammates = home.T @ weighted_home + away.T @ weighted_away
+        opponents = home.T @ weighted_away
+        opponents = opponents + opponents.T
+
+        return player_ids, teammates.tocsr(), opponents.tocsr()
+
+    def overlap_stats(self) -> pd.DataFrame:
+        """
+        method to return the shared minutes and possessions of every pair of
+        players that were on the court together, built from the nonzero
+        entries of overlap_matrices()
+
+        Outputs:
+        overlap_df - one row per player, other player and relation (teammate
+                     or opponent) with seconds, minutes and possessions
+        """
+        player_ids, teammate_seconds, opponent_seconds = self.overlap_matrices()
+        _, teammate_poss, opponent_poss = self.overlap_matrices("possessions")
+
+        frames = []
+        for relation, seconds, possessions in [
+            ("teammate", teammate_seconds, teammate_poss),
+            ("opponent", opponent_seconds, opponent_poss),
+        ]:
+            pairs = ((seconds != 0) + (possessions != 0)).tocoo()
+            off_diagonal = pairs.row != pairs.col
+            rows = pairs.row[off_diagonal]
+            columns = pairs.col[off_diagonal]
+            frames.append(
+                pd.DataFrame(
+                    {
+                        "player_id": player_ids[rows],
+                        "other_player_id": player_ids[columns],
+                        "relation": relation,
+                        "seconds": np.asarray(seconds[rows, columns]).ravel(),
+                        "possessions": np.asarray(possessions[rows, columns]).ravel(),
+                    }
+                )
+            )
+
+        overlap_df = pd.concat(frames, ignore_index=True)
+        overlap_df["possessions"] = overlap_df["possessions"].astype(np.int64)
+        overlap_df.insert(
+            1, "player_name", self.registry.player_names(overlap_df["player_id"])
+        )
+        overlap_df.insert(
+            3,
+            "other_player_name",
+            self.registry.player_names(overlap_df["other_player_id"]),
+        )
+        overlap_df.insert(
+            overlap_df.columns.get_loc("seconds") + 1,
+            "minutes",
+            overlap_df["seconds"] / 60,
+        )
+
+        return overlap_df.sort_values(
+            ["player_id", "relation", "other_player_id"], ascending=[True, False, True]
+        ).reset_index(drop=True)
+
+    def combination_stats(self, size: int = 2) -> pd.DataFrame:
+        """
+        method to return the stats of every two or three man combination of
+        teammates. Each combination is packed into one integer key of
+        roster slot indexes, 21 bits per player, and generated for every unit
+        with the same few column picks, so the totals come from a single
+        bincount per stat instead of exploding the units into pandas rows
+
+        Inputs:
+        size            - number of players in each combination, 1 to 3 so the
+                          packed keys fit in 63 bits
+
+        Outputs:
+        combination_df  - one row per team and combination with the member ids,
+                          a string of their names and the summed stats and
+                          ratings of the units they were part of
+        """
+        if not 1 <= size <= 3:
+            raise ValueError(f"combination size must be between 1 and 3 not {size}")
+
+        units = self._unit_totals()
+        columns = units.columns.drop(["team_id", "lineup_key"])
+        slots, unit_slots = self._roster_slots(units)
+        if len(slots) >= 1 << 21:
+            raise ValueError("too many roster slots to pack into combination keys")
+
+        picks = list(combinations(range(unit_slots.shape[1]), size))
+        keys = np.zeros((len(units), len(picks)), dtype=np.int64)
+        for i, pick in enumerate(picks):
+            for column in pick:
+                keys[:, i] = (keys[:, i] << 21) | unit_slots[:, column]
+
+        combination_keys, combination_index = np.unique(
+            keys.ravel(), return_inverse=True
+        )
+        combination_index = combination_index.ravel()
+        values = units[columns].to_numpy(dtype=np.float64)
+        combination_df = pd.DataFrame(
+            {
+                column: np.bincount(
+                    combination_index,
+                    weights=np.repeat(values[:, i], len(picks)),
+                    minlength=len(combination_keys),
+                )
+                for i, column in enumerate(columns)
+            }
+        ).astype(units[columns].dtypes.to_dict())
+
+        member_slots = np.column_stack(
+            [
+                (combination_keys >> (21 * (size - 1 - i))) & ((1 << 21) - 1)
+                for i in range(size)
+            ]
+        )
+        team_ids = slots[member_slots[:, 0], 0]
+        combination_df.insert(0, "team_id", team_ids)
+        combination_df.insert(1, "team_abbrev", self.registry.team_abbrevs(team_ids))
+        names = []
+        for i in range(size):
+            player_ids = slots[member_slots[:, i], 1]
+            combination_df.insert(2 + i, f"player_{i + 1}_id", player_ids)
+            names.append(self.registry.player_names(player_ids))
+        combination_df.insert(
+            2 + size,
+            "players",
+            [", ".join(map(str, row)) for row in zip(*names)],
+        )
+
+        return self._add_rate_stats(combination_df)
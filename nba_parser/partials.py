@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+from typing import Optional
+
+import pandas as pd
+
+from .registry import Registry
+
+
+class TotalsPartial:
+    """
+    This class is an associative partial aggregate of per game stat rows. It
+    keeps the summed counting stats and games played for each key (player_id
+    or team_id), the teams each player played for, the season range and the
+    names seen. Workers can build one from their own games and the parent
+    process combines them with merge(), so only these small summaries have to
+    cross process boundaries. PlayerTotals and TeamTotals derive their final
+    ratings from a merged partial
+    """
+
+    def __init__(
+        self,
+        key: str,
+        sums: Optional[pd.DataFrame] = None,
+        teams: Optional[pd.DataFrame] = None,
+        min_season: Optional[int] = None,
+        max_season: Optional[int] = None,
+        registry: Optional[Registry] = None,
+    ) -> None:
+        self.key = key
+        self.sums = sums
+        self.teams = (
+            teams if teams is not None else pd.DataFrame(columns=[key, "team_id"])
+        )
+        self.min_season = min_season
+        self.max_season = max_season
+        self.registry = registry if registry is not None else Registry()
+
+    @classmethod
+    def from_frame(
+        cls, df: pd.DataFrame, key: str, columns: list[str]
+    ) -> TotalsPartial:
+        """
+        method to build a partial from a dataframe of per game rows
+
+        Inputs:
+        df      - per game rows like the output of playerbygamestats()
+        key     - column to aggregate on
+        columns - counting stat columns to sum
+
+        Outputs:
+        partial - TotalsPartial of the rows
+        """
+        sums = df.groupby(key)[columns].sum()
+        sums["gp"] = df.groupby(key)["game_id"].count()
+
+        # equivalent of select distinct, keeping the order teams were played for
+        if key == "team_id":
+            teams = None
+        else:
+            teams = df[[key, "team_id"]].drop_duplicates()
+
+        return cls(
+            key,
+            sums,
+            teams,
+            df["season"].min(),
+            df["season"].max(),
+            Registry.from_frame(df),
+        )
+
+    def merge(self, other: TotalsPartial) -> TotalsPartial:
+        """
+        method to combine two partials into a new one, neither input is
+        changed. Merging is associative so partials can be combined in any
+        grouping. The sums don't depend on the order either, but the teams
+        frame keeps the order teams were first seen in
+        """
+        if self.key != other.key:
+            raise ValueError(
+                f"can't merge a {self.key} partial with a {other.key} partial"
+            )
+        if self.sums is None:
+            return other.copy()
+        if other.sums is None:
+            return self.copy()
+
+        return TotalsPartial(
+            self.key,
+            pd.concat([self.sums, other.sums]).groupby(level=0).sum(),
+            pd.concat([self.teams, other.teams]).drop_duplicates(),
+            min(self.min_season, other.min_season),
+            max(self.max_season, other.max_season),
+            self.registry.merge(other.registry),
+        )
+
+    def copy(self) -> TotalsPartial:
+        """
+        method to copy a partial so merged results never share frames with
+        their inputs
+        """
+        return TotalsPartial(
+            self.key,
+            self.sums.copy() if self.sums is not None else None,
+            self.teams.copy(),
+            self.min_season,
+            self.max_season,
+            Registry(self.registry.players.copy(), self.registry.teams.copy()),
+        )
@@ -1,8 +1,17 @@
+from __future__ import annotations
+
 from datetime import datetime
 import math
+from typing import TYPE_CHECKING, Union
 import numpy as np
 import pandas as pd
 
+from .arrowtable import check_output, convert_output
+from .registry import Registry
+
+if TYPE_CHECKING:
+    import pyarrow as pa
+
 
 class PbP:
     """
@@ -30,6 +39,9 @@ class PbP:
         else:
             self.game_date = pbp_df["game_date"].unique()[0]
 
+        # id -> name lookups for the game so stats can be grouped on ids only
+        self.registry = Registry.from_events(self.df)
+
         # change column types to fit my database at a later time on insert
 
         self.df["scoremargin"] = self.df["scoremargin"].astype(str)
@@ -714,28 +726,18 @@ class PbP:
         """
         function to calculate possessions each player participated in
         """
-        home_names = [f"home_player_{i}" for i in range(1, 6)]
         home_ids = [f"home_player_{i}_id" for i in range(1, 6)]
-        home_df = self.df[
-            home_names
-            + home_ids
-            + ["home_possession", "game_id", "home_team_id"]
-        ]
-        home_long_names = home_df.melt(
-            id_vars=["home_possession", "game_id", "home_team_id"],
-            value_vars=home_names,
-            value_name="player_name",
-        )
-        home_long_ids = home_df.melt(
+        home_long = self.df[
+            home_ids + ["home_possession", "game_id", "home_team_id"]
+        ].melt(
             id_vars=["home_possession", "game_id", "home_team_id"],
             value_vars=home_ids,
             value_name="player_id",
         )
-        home_long_names["player_id"] = home_long_ids["player_id"]
         home_possession_df = (
-            home_long_names.groupby(
-                ["player_id", "player_name", "game_id", "home_team_id"]
-            )["home_possession"]
+            home_long.groupby(["player_id", "game_id", "home_team_id"])[
+                "home_possession"
+            ]
             .sum()
             .reset_index()
             .sort_values("home_possession")
@@ -747,28 +749,18 @@ class PbP:
             )
         )
 
-        away_names = [f"away_player_{i}" for i in range(1, 6)]
         away_ids = [f"away_player_{i}_id" for i in range(1, 6)]
-        away_df = self.df[
-            away_names
-            + away_ids
-            + ["away_possession", "game_id", "away_team_id"]
-        ]
-        away_long_names = away_df.melt(
-            id_vars=["away_possession", "game_id", "away_team_id"],
-            value_vars=away_names,
-            value_name="player_name",
-        )
-        away_long_ids = away_df.melt(
+        away_long = self.df[
+            away_ids + ["away_possession", "game_id", "away_team_id"]
+        ].melt(
             id_vars=["away_possession", "game_id", "away_team_id"],
             value_vars=away_ids,
             value_name="player_id",
         )
-        away_long_names["player_id"] = away_long_ids["player_id"]
         away_possession_df = (
-            away_long_names.groupby(
-                ["player_id", "player_name", "game_id", "away_team_id"]
-            )["away_possession"]
+            away_long.groupby(["player_id", "game_id", "away_team_id"])[
+                "away_possession"
+            ]
             .sum()
             .reset_index()
             .sort_values("away_possession")
@@ -1496,11 +1488,14 @@ class PbP:
 
         return parsed_list
 
-    def rapm_possessions(self) -> pd.DataFrame:
+    def rapm_possessions(
+        self, output: str = "pandas"
+    ) -> Union[pd.DataFrame, "pa.Table"]:
         """
         method to extract out all the rapm possessions to be able to run a RAPM
-        regression on later
+        regression on later. Pass output="arrow" to get a pyarrow Table
         """
+        check_output(output)
 
         pbp_df = self.df.copy()
         points_by_second = (
@@ -1526,13 +1521,16 @@ class PbP:
 
         poss_df = pd.concat(self.parse_possessions(shift_dfs))
 
-        return poss_df
+        return convert_output(poss_df, output)
 
-    def playerbygamestats(self) -> pd.DataFrame:
+    def playerbygamestats(
+        self, output: str = "pandas"
+    ) -> Union[pd.DataFrame, "pa.Table"]:
         """
         this function combines all playerbygamestats and returns a dataframe
-        containing them
+        containing them. Pass output="arrow" to get a pyarrow Table
         """
+        check_output(output)
         points = self._point_calc_player()
         blocks = self._block_calc_player()
         assists = self._assist_calc_player()
@@ -1585,6 +1583,12 @@ class PbP:
         pbg = pbg.merge(
             poss, how="left", on=["player_id", "team_id", "game_id"]
         )
+        # names are only attached once all the id based merges are done
+        pbg.insert(
+            len(pbg.columns) - 1,
+            "player_name",
+            self.registry.player_names(pbg["player_id"]),
+        )
 
         pbg["blk"] = pbg["blk"].fillna(0).astype(int)
         pbg["ast"] = pbg["ast"].fillna(0).astype(int)
@@ -1615,12 +1619,15 @@ class PbP:
         pbg["player_id"] = pbg["player_id"].astype(int)
         pbg = pbg[pbg["toc"] > 0]
 
-        return pbg
+        return convert_output(pbg, output)
 
-    def teambygamestats(self) -> pd.DataFrame:
+    def teambygamestats(
+        self, output: str = "pandas"
+    ) -> Union[pd.DataFrame, "pa.Table"]:
         """
-        main team stats calc hook
+        main team stats calc hook. Pass output="arrow" to get a pyarrow Table
         """
+        check_output(output)
 
         points = self._point_calc_team()
         blocks = self._block_calc_team()
@@ -1676,4 +1683,4 @@ class PbP:
             tbg["team_id"] == self.home_team_id, self.away_team, self.home_team
         )
 
-        return tbg
+        return convert_output(tbg, output)
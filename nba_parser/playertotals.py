@@ -1,7 +1,21 @@
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Iterable, Optional, Union
+
 import pandas as pd
 import numpy as np
+from scipy import sparse
 from sklearn.linear_model import RidgeCV
 
+from .arrowtable import check_output, convert_output
+from .partials import TotalsPartial
+from .rapmmodel import RapmModel
+from .registry import Registry
+
+if TYPE_CHECKING:
+    import pyarrow as pa
+
 
 class PlayerTotals:
     """
@@ -9,56 +23,120 @@ class PlayerTotals:
     dataframes. The dataframes have to be created by PbP.playerbygamestats()
     or else the methods won't work. I've grouped these stat calculations in a
     seperate class because they work best with larger sample sizes
+
+    The per game dataframes can come from any iterable, including a generator,
+    and are folded into running per player sums in batches so the whole sample
+    never has to be held in one big dataframe. More games can be added later
+    with add_games()
     """
 
-    def __init__(self, pbg_list: list[pd.DataFrame]):
-        self.pbg = pd.concat(pbg_list)
-
-    def player_advanced_stats(self) -> pd.DataFrame:
-
-        stats = [
-            "toc",
-            "fgm",
-            "fga",
-            "tpm",
-            "tpa",
-            "ftm",
-            "fta",
-            "blk",
-            "ast",
-            "oreb",
-            "dreb",
-            "tov",
-            "pf",
-            "stl",
-            "plus",
-            "minus",
-            "plus_minus",
-            "possessions",
-            "points",
-        ]
-        grouped_df = (
-            self.pbg.groupby(["player_id", "player_name"])[stats].sum().reset_index()
-        )
-        # equivalent of select distinct
-        team_df = self.pbg[
-            ["player_id", "player_name", "team_abbrev"]
-        ].drop_duplicates()
+    stats = [
+        "toc",
+        "fgm",
+        "fga",
+        "tpm",
+        "tpa",
+        "ftm",
+        "fta",
+        "blk",
+        "ast",
+        "oreb",
+        "dreb",
+        "tov",
+        "pf",
+        "stl",
+        "plus",
+        "minus",
+        "plus_minus",
+        "possessions",
+        "points",
+    ]
 
-        team_df = (
-            self.pbg.groupby(["player_id", "player_name"])
-            .agg({"team_abbrev": lambda x: "/".join(x.unique())})
-            .reset_index()
-        )
+    def __init__(
+        self,
+        pbg_list: Iterable[pd.DataFrame],
+        registry: Optional[Registry] = None,
+        batch_size: int = 100,
+    ):
+        # player and team names are looked up from the registry at the end so
+        # every groupby below only has to key on integer ids. If one isn't
+        # passed the names collected from the games are used
+        self._registry = registry
+        self.batch_size = batch_size
+        self.partial = PlayerTotals.build_partial(pbg_list, batch_size)
+        if self.partial.sums is None:
+            raise ValueError(
+                "PlayerTotals needs at least one non empty playerbygamestats() "
+                "dataframe"
+            )
 
-        gp_df = (
-            self.pbg.groupby(["player_id", "player_name"])["game_id"]
-            .count()
-            .reset_index()
-            .rename(columns={"game_id": "gp"})
+    @property
+    def registry(self) -> Registry:
+        if self._registry is not None:
+            return self._registry
+        return self.partial.registry
+
+    @classmethod
+    def from_partial(
+        cls, partial: TotalsPartial, registry: Optional[Registry] = None
+    ) -> "PlayerTotals":
+        """
+        method to create a PlayerTotals object from a partial aggregate, for
+        example one merged from partials built in worker processes
+        """
+        player_totals = cls.__new__(cls)
+        player_totals._registry = registry
+        player_totals.batch_size = 100
+        player_totals.partial = partial
+
+        return player_totals
+
+    @staticmethod
+    def build_partial(
+        pbg_list: Iterable[pd.DataFrame], batch_size: int = 100
+    ) -> TotalsPartial:
+        """
+        function to fold playerbygamestats() dataframes into a TotalsPartial in
+        batches. This is what each worker should run and send back when
+        processing is spread across processes
+        """
+        partial = TotalsPartial("player_id")
+        batch = []
+        # games without rows would only add missing seasons to the partial
+        for pbg in (pbg for pbg in pbg_list if not pbg.empty):
+            batch.append(pbg)
+            if len(batch) >= batch_size:
+                partial = partial.merge(
+                    TotalsPartial.from_frame(
+                        pd.concat(batch), "player_id", PlayerTotals.stats
+                    )
+                )
+                batch = []
+        if batch:
+            partial = partial.merge(
+                TotalsPartial.from_frame(
+                    pd.concat(batch), "player_id", PlayerTotals.stats
+                )
+            )
+
+        return partial
+
+    def add_games(self, pbg_list: Iterable[pd.DataFrame]) -> "PlayerTotals":
+        """
+        method to fold more playerbygamestats() dataframes into the running
+        totals. Only the new games are touched
+        """
+        self.partial = self.partial.merge(
+            PlayerTotals.build_partial(pbg_list, self.batch_size)
         )
-        grouped_df = grouped_df.merge(gp_df, on=["player_id", "player_name"])
-        grouped_df = grouped_df.merge(team_df, on=["player_id", "player_name"])
+
+        return self
+
+    @staticmethod
+    def _add_rate_stats(grouped_df: pd.DataFrame) -> pd.DataFrame:
+        """
+        function to derive the rate stats from summed counting stats
+        """
         grouped_df["off_rating"] = (grouped_df["plus"] * 100) / grouped_df[
             "possessions"
         ]
@@ -103,203 +181,169 @@ class PlayerTotals:
             1,
         )
 
-        grouped_df["min_season"] = self.pbg["season"].min()
-        grouped_df["max_season"] = self.pbg["season"].max()
-
         return grouped_df
 
-    @staticmethod
-    def rapm_matrix_map(row_in: np.ndarray, players: list[int]) -> np.ndarray:
-        p1 = row_in[0]
-        p2 = row_in[1]
-        p3 = row_in[2]
-        p4 = row_in[3]
-        p5 = row_in[4]
-        p6 = row_in[5]
-        p7 = row_in[6]
-        p8 = row_in[7]
-        p9 = row_in[8]
-        p10 = row_in[9]
-
-        rowOut = np.zeros([(len(players) * 2) + 1])
-
-        rowOut[players.index(p1)] = 1
-        rowOut[players.index(p2)] = 1
-        rowOut[players.index(p3)] = 1
-        rowOut[players.index(p4)] = 1
-        rowOut[players.index(p5)] = 1
-
-        rowOut[players.index(p6) + len(players)] = -1
-        rowOut[players.index(p7) + len(players)] = -1
-        rowOut[players.index(p8) + len(players)] = -1
-        rowOut[players.index(p9) + len(players)] = -1
-        rowOut[players.index(p10) + len(players)] = -1
-
-        rowOut[len(players) + 1] = row_in[10]
-
-        return rowOut
+    def player_advanced_stats(
+        self, output: str = "pandas"
+    ) -> Union[pd.DataFrame, "pa.Table"]:
+        """
+        method to calculate the totals and rate stats of every player. Pass
+        output="arrow" to get a pyarrow Table
+        """
+        check_output(output)
+        grouped_df = self.partial.sums.reset_index()
+
+        team_df = self.partial.teams.copy()
+        team_df["team_abbrev"] = self.registry.team_abbrevs(team_df["team_id"])
+        team_df = (
+            team_df.groupby("player_id", sort=False)["team_abbrev"]
+            .agg("/".join)
+            .reset_index()
+        )
+
+        grouped_df = grouped_df.merge(team_df, on="player_id")
+        grouped_df.insert(
+            1, "player_name", self.registry.player_names(grouped_df["player_id"])
+        )
+        grouped_df = self._add_rate_stats(grouped_df)
+
+        grouped_df["min_season"] = self.partial.min_season
+        grouped_df["max_season"] = self.partial.max_season
+
+        return convert_output(grouped_df, output)
 
     @staticmethod
-    def player_rapm_results(rapm_shifts: pd.DataFrame) -> pd.DataFrame:
+    def player_rolling_stats(
+        pbg_list: Iterable[pd.DataFrame],
+        windows: tuple[int, ...] = (5, 10, 20),
+        registry: Optional[Registry] = None,
+    ) -> pd.DataFrame:
         """
-        funciton to produce RAPM coefficients for players in the
-        rapm shifts passed to the function
+        function to calculate every player's trailing window and season to date
+        advanced stats as of each of their games. The rows are sorted by date
+        once, the counting stats are cumulatively summed per player and every
+        window is the difference of two cumulative sums, so all players and
+        windows are computed in a handful of vectorized operations. Each row
+        only uses games played strictly before that game so the output can be
+        used as model features without leaking the game's own result
+
+        Inputs:
+        pbg_list - playerbygamestats() dataframes or one concatenated dataframe
+        windows  - trailing game window sizes, these run across seasons
+        registry - optional Registry to look player names up from
+
+        Outputs:
+        rolling_df - one row per player game and window with the window name in
+                     the window column (last_5, last_10, ..., season), the games
+                     played and summed counting stats in the window and the
+                     rate stats of player_advanced_stats()
         """
+        if isinstance(pbg_list, pd.DataFrame):
+            pbg = pbg_list
+        else:
+            pbg = pd.concat(pbg_list)
+        if registry is None:
+            registry = Registry.from_frame(pbg)
 
-        def lambda_to_alpha(lambda_value, samples):
-            return (lambda_value * samples) / 2.0
+        pbg = pbg.sort_values(
+            ["player_id", "game_date", "game_id"], kind="stable"
+        ).reset_index(drop=True)
+        keys = pbg[["player_id", "team_id", "game_id", "game_date", "season"]]
 
-        def player_details(rapm_shifts):
-            """
-            function to get player_id, player_name kvp in a dataframe
-            to join to rapm output to get names for player_ids
-            """
-            off_player_1 = rapm_shifts[
-                ["off_player_1_id", "off_player_1"]
-            ].drop_duplicates()
-            off_player_2 = rapm_shifts[
-                ["off_player_2_id", "off_player_2"]
-            ].drop_duplicates()
-            off_player_3 = rapm_shifts[
-                ["off_player_3_id", "off_player_3"]
-            ].drop_duplicates()
-            off_player_4 = rapm_shifts[
-                ["off_player_4_id", "off_player_4"]
-            ].drop_duplicates()
-            off_player_5 = rapm_shifts[
-                ["off_player_5_id", "off_player_5"]
-            ].drop_duplicates()
-            off_player_1 = off_player_1.rename(
-                columns={"off_player_1_id": "player_id", "off_player_1": "player_name"}
-            )
-            off_player_2 = off_player_2.rename(
-                columns={"off_player_2_id": "player_id", "off_player_2": "player_name"}
-            )
-            off_player_3 = off_player_3.rename(
-                columns={"off_player_3_id": "player_id", "off_player_3": "player_name"}
-            )
-            off_player_4 = off_player_4.rename(
-                columns={"off_player_4_id": "player_id", "off_player_4": "player_name"}
-            )
-            off_player_5 = off_player_5.rename(
-                columns={"off_player_5_id": "player_id", "off_player_5": "player_name"}
-            )
-            def_player_1 = rapm_shifts[
-                ["def_player_1_id", "def_player_1"]
-            ].drop_duplicates()
-            def_player_2 = rapm_shifts[
-                ["def_player_2_id", "def_player_2"]
-            ].drop_duplicates()
-            def_player_3 = rapm_shifts[
-                ["def_player_3_id", "def_player_3"]
-            ].drop_duplicates()
-            def_player_4 = rapm_shifts[
-                ["def_player_4_id", "def_player_4"]
-            ].drop_duplicates()
-            def_player_5 = rapm_shifts[
-                ["def_player_5_id", "def_player_5"]
-            ].drop_duplicates()
-            def_player_1 = def_player_1.rename(
-                columns={"def_player_1_id": "player_id", "def_player_1": "player_name"}
-            )
-            def_player_2 = def_player_2.rename(
-                columns={"def_player_2_id": "player_id", "def_player_2": "player_name"}
-            )
-            def_player_3 = def_player_3.rename(
-                columns={"def_player_3_id": "player_id", "def_player_3": "player_name"}
-            )
-            def_player_4 = def_player_4.rename(
-                columns={"def_player_4_id": "player_id", "def_player_4": "player_name"}
-            )
-            def_player_5 = def_player_5.rename(
-                columns={"def_player_5_id": "player_id", "def_player_5": "player_name"}
-            )
-            players = pd.concat(
-                [
-                    off_player_1,
-                    off_player_2,
-                    off_player_3,
-                    off_player_4,
-                    off_player_5,
-                    def_player_1,
-                    def_player_2,
-                    def_player_3,
-                    def_player_4,
-                    def_player_5,
-                ]
-            )
-            players = players.drop_duplicates()
-
-            return players
-
-        players = list(
-            set(
-                list(rapm_shifts["off_player_1_id"].unique())
-                + list(rapm_shifts["off_player_2_id"].unique())
-                + list(rapm_shifts["off_player_3_id"].unique())
-                + list(rapm_shifts["off_player_4_id"].unique())
-                + list(rapm_shifts["off_player_5_id"].unique())
-                + list(rapm_shifts["def_player_1_id"].unique())
-                + list(rapm_shifts["def_player_2_id"].unique())
-                + list(rapm_shifts["def_player_3_id"].unique())
-                + list(rapm_shifts["def_player_4_id"].unique())
-                + list(rapm_shifts["def_player_5_id"].unique())
-            )
+        counts = pbg[PlayerTotals.stats].to_numpy(dtype=float)
+        # cumulative sums of every game before the current one
+        cumulative = pd.DataFrame(counts).groupby(pbg["player_id"].to_numpy()).cumsum()
+        before = cumulative.to_numpy() - counts
+        row = np.arange(len(pbg))
+        position = pbg.groupby("player_id").cumcount().to_numpy()
+        season_position = (
+            pbg.groupby(["player_id", "season"]).cumcount().to_numpy()
         )
 
-        players.sort()
+        window_dfs = []
+        for window in windows:
+            has_full_window = position >= window
+            start = np.where(has_full_window, row - window, row - position)
+            sums = before - np.where(has_full_window[:, None], before[start], 0)
+            window_df = pd.DataFrame(sums, columns=PlayerTotals.stats)
+            window_df.insert(0, "gp", np.minimum(position, window))
+            window_df.insert(0, "window", f"last_{window}")
+            window_dfs.append(pd.concat([keys, window_df], axis=1))
+
+        season_start = row - season_position
+        season_df = pd.DataFrame(
+            before - before[season_start], columns=PlayerTotals.stats
+        )
+        season_df.insert(0, "gp", season_position)
+        season_df.insert(0, "window", "season")
+        window_dfs.append(pd.concat([keys, season_df], axis=1))
 
-        player_df = player_details(rapm_shifts)
-        rapm_shifts["points_per_100_poss"] = rapm_shifts["points_made"] * 100
-        rapm_shifts["possessions"] = 1
-        rapm_shifts["is_home"] = np.where(
+        rolling_df = pd.concat(window_dfs, ignore_index=True)
+        rolling_df.insert(
+            1, "player_name", registry.player_names(rolling_df["player_id"])
+        )
+        rolling_df = PlayerTotals._add_rate_stats(rolling_df)
+        # players without any earlier games in the window have no rates yet
+        rolling_df = rolling_df.replace([np.inf, -np.inf], np.nan)
+
+        return rolling_df
+
+    @staticmethod
+    def _rapm_design_matrix(
+        rapm_shifts: pd.DataFrame,
+    ) -> tuple[sparse.csr_matrix, np.ndarray]:
+        """
+        function to build the sparse RAPM design matrix from the rapm shifts
+        in one vectorized pass. Each row gets a 1 in the column of each offensive
+        player, a -1 in the column of each defensive player and the is_home flag
+        in the last column. Returns the matrix and the sorted player ids that
+        index its columns
+        """
+        off_cols = [f"off_player_{i}_id" for i in range(1, 6)]
+        def_cols = [f"def_player_{i}_id" for i in range(1, 6)]
+        ids = rapm_shifts[off_cols + def_cols].to_numpy(dtype=np.int64)
+        players, codes = np.unique(ids.ravel(), return_inverse=True)
+        codes = codes.reshape(ids.shape)
+        codes[:, 5:] += len(players)
+
+        is_home = np.where(
             rapm_shifts["home_team_abbrev"] == rapm_shifts["event_team_abbrev"], 1, 0
         )
-        train_x = rapm_shifts[
+        rows = np.repeat(np.arange(ids.shape[0]), 11)
+        cols = np.column_stack(
+            [codes, np.full(ids.shape[0], 2 * len(players))]
+        ).ravel()
+        data = np.column_stack(
             [
-                "off_player_1_id",
-                "off_player_2_id",
-                "off_player_3_id",
-                "off_player_4_id",
-                "off_player_5_id",
-                "def_player_1_id",
-                "def_player_2_id",
-                "def_player_3_id",
-                "def_player_4_id",
-                "def_player_5_id",
-                "is_home",
+                np.ones((ids.shape[0], 5)),
+                -np.ones((ids.shape[0], 5)),
+                is_home,
             ]
-        ].to_numpy()
-
-        train_x = np.apply_along_axis(PlayerTotals.rapm_matrix_map, 1, train_x, players)
-        train_y = rapm_shifts[["points_per_100_poss"]].to_numpy()
-        possessions = rapm_shifts["possessions"]
+        ).ravel()
 
-        lambdas_rapm = [0.01, 0.025, 0.05, .075, 0.1]
-        alphas = [lambda_to_alpha(l, train_x.shape[0]) for l in lambdas_rapm]
-        clf = RidgeCV(alphas=alphas, cv=5, fit_intercept=True)
-        model = clf.fit(train_x, train_y, sample_weight=possessions)
-        player_arr = np.transpose(np.array(players).reshape(1, len(players)))
+        train_x = sparse.csr_matrix(
+            (data, (rows, cols)), shape=(ids.shape[0], (2 * len(players)) + 1)
+        )
+        train_x.eliminate_zeros()
 
-        # extract our coefficients into the offensive and defensive parts
-        coef = np.atleast_2d(model.coef_)
-        coef_offensive_array = np.transpose(coef[:, 0 : len(players)])
-        coef_defensive_array = np.transpose(coef[:, len(players) : -1])
+        return train_x, players
 
-        # concatenate the offensive and defensive values with the playey ids into a mx3 matrix
-        player_id_with_coef = np.concatenate(
-            [player_arr, coef_offensive_array, coef_defensive_array], axis=1
+    @staticmethod
+    def _rapm_coef_frame(
+        players: np.ndarray, coef: np.ndarray, intercept: float, name: str
+    ) -> pd.DataFrame:
+        """
+        function to split a fitted coefficient vector into offensive and
+        defensive parts and rank them
+        """
+        coef = np.ravel(coef)
+        players_coef = pd.DataFrame(
+            {
+                "player_id": players,
+                f"{name}_off": coef[0 : len(players)],
+                f"{name}_def": coef[len(players) : 2 * len(players)],
+            }
         )
-        # build a dataframe from our matrix
-        players_coef = pd.DataFrame(player_id_with_coef)
-        intercept = model.intercept_
-        name = "rapm"
-        # apply new column names
-        players_coef.columns = [
-            "player_id",
-            f"{name}_off",
-            f"{name}_def",
-        ]
         # Add the offesnive and defensive components together (we should really be weighing this to the number of offensive and defensive possession played as they are often not equal).
         players_coef[name] = players_coef[f"{name}_off"] + players_coef[f"{name}_def"]
 
@@ -313,13 +357,342 @@ class PlayerTotals:
         )
 
         # add the intercept for reference
-        players_coef[f"{name}_intercept"] = intercept[0]
+        players_coef[f"{name}_intercept"] = np.ravel(intercept)[0]
+
+        return players_coef
 
-        results_df = players_coef.merge(
-            player_df[["player_id", "player_name"]], on="player_id"
+    @staticmethod
+    def _rapm_model(
+        players: np.ndarray, coef: np.ndarray, intercept: float
+    ) -> RapmModel:
+        """
+        function to wrap a fitted coefficient vector in a RapmModel
+        """
+        coef = np.ravel(coef)
+        return RapmModel(
+            players,
+            coef[0 : len(players)],
+            coef[len(players) : 2 * len(players)],
+            coef[-1],
+            np.ravel(intercept)[0],
         )
+
+    @staticmethod
+    def player_rapm_results(rapm_shifts: pd.DataFrame) -> pd.DataFrame:
+        """
+        funciton to produce RAPM coefficients for players in the
+        rapm shifts passed to the function
+        """
+
+        def lambda_to_alpha(lambda_value, samples):
+            return (lambda_value * samples) / 2.0
+
+        registry = Registry.from_rapm_possessions(rapm_shifts)
+        train_x, players = PlayerTotals._rapm_design_matrix(rapm_shifts)
+        train_y = rapm_shifts["points_made"].to_numpy() * 100
+        possessions = np.ones(train_x.shape[0])
+
+        lambdas_rapm = [0.01, 0.025, 0.05, .075, 0.1]
+        alphas = [lambda_to_alpha(l, train_x.shape[0]) for l in lambdas_rapm]
+        clf = RidgeCV(alphas=alphas, cv=5, fit_intercept=True)
+        model = clf.fit(train_x, train_y, sample_weight=possessions)
+
+        players_coef = PlayerTotals._rapm_coef_frame(
+            players, model.coef_, model.intercept_, "rapm"
+        )
+
+        results_df = players_coef
+        results_df["player_name"] = registry.player_names(results_df["player_id"])
+        results_df = np.round(results_df, decimals=2)
+        results_df["min_season"] = rapm_shifts["season"].min()
+        results_df["max_season"] = rapm_shifts["season"].max()
+        results_df.attrs["rapm_model"] = PlayerTotals._rapm_model(
+            players, model.coef_, model.intercept_
+        )
+
+        return results_df
+
+    @staticmethod
+    def player_rapm_multi_results(
+        rapm_shifts: pd.DataFrame, targets: list[str]
+    ) -> pd.DataFrame:
+        """
+        function to produce RAPM coefficients for several target columns of the
+        rapm shifts at once. The design matrix is built once and shared by every
+        target. Every target is solved against the same eigendecomposition of
+        it, so fitting four targets costs about the same as fitting one. Each
+        target is scaled to a per 100 possession rate and gets its own
+        regularization strength picked with the same five fold cross validation
+        as player_rapm_results()
+
+        Inputs:
+        rapm_shifts - dataframe of possessions from PbP.rapm_possessions() with
+                      any extra target columns added to it
+        targets     - list of column names in rapm_shifts to regress on
+
+        Outputs:
+        results_df  - one row per player with rapm_{target}_off, rapm_{target}_def,
+                      rapm_{target}, their ranks and intercept for each target
+        """
+
+        def lambda_to_alpha(lambda_value, samples):
+            return (lambda_value * samples) / 2.0
+
+        registry = Registry.from_rapm_possessions(rapm_shifts)
+        train_x, players = PlayerTotals._rapm_design_matrix(rapm_shifts)
+        train_y = rapm_shifts[targets].to_numpy(dtype=float) * 100
+
+        lambdas_rapm = [0.01, 0.025, 0.05, .075, 0.1]
+        alphas = [lambda_to_alpha(l, train_x.shape[0]) for l in lambdas_rapm]
+        coef, intercept = PlayerTotals._rapm_multi_solve(train_x, train_y, alphas)
+        coef = list(coef.T)
+
+        results_df = pd.DataFrame({"player_id": players})
+        for i, target in enumerate(targets):
+            players_coef = PlayerTotals._rapm_coef_frame(
+                players, coef[i], intercept[i], f"rapm_{target}"
+            )
+            results_df = results_df.merge(players_coef, on="player_id")
+
+        results_df["player_name"] = registry.player_names(results_df["player_id"])
         results_df = np.round(results_df, decimals=2)
         results_df["min_season"] = rapm_shifts["season"].min()
         results_df["max_season"] = rapm_shifts["season"].max()
+        results_df.attrs["rapm_models"] = {
+            target: PlayerTotals._rapm_model(players, coef[i], intercept[i])
+            for i, target in enumerate(targets)
+        }
 
         return results_df
+
+    @staticmethod
+    def _rapm_multi_solve(
+        train_x: sparse.csr_matrix, train_y: np.ndarray, alphas: list, cv: int = 5
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        function to fit a ridge regression for every column of train_y, each
+        with the alpha that scores the best mean R^2 over the same unshuffled
+        k folds RidgeCV(cv=5) uses. The centered X'X of every training split and
+        of the whole matrix is eigendecomposed once and reused for every alpha
+        and target, so extra targets only add matrix products. Returns the
+        coefficients with one column per target and the intercepts
+        """
+        samples = train_x.shape[0]
+        # KFold without shuffling gives contiguous folds with the first
+        # samples % cv of them one row bigger
+        fold_sizes = np.full(cv, samples // cv)
+        fold_sizes[: samples % cv] += 1
+        folds = np.repeat(np.arange(cv), fold_sizes)
+        bounds = np.append(0, np.cumsum(fold_sizes))
+        blocks = PlayerTotals._rapm_gram_blocks(train_x, train_y, folds)
+
+        def decompose(keys):
+            gram = sum(blocks[k][0] for k in keys).toarray()
+            xty = sum(blocks[k][1] for k in keys)
+            x_sum = sum(blocks[k][2] for k in keys)
+            y_sum = sum(blocks[k][3] for k in keys)
+            rows = sum(blocks[k][4] for k in keys)
+            gram -= np.outer(x_sum, x_sum) / rows
+            xty = xty - (np.outer(x_sum, y_sum) / rows)
+            values, vectors = np.linalg.eigh(gram)
+
+            def solve(alpha):
+                coef = vectors @ ((vectors.T @ xty) / (values + alpha)[:, None])
+                return coef, (y_sum - (x_sum @ coef)) / rows
+
+            return solve
+
+        scores = np.zeros((len(alphas), train_y.shape[1]))
+        for k in range(cv):
+            solve = decompose([j for j in range(cv) if j != k])
+            test_x = train_x[bounds[k] : bounds[k + 1]]
+            test_y = train_y[bounds[k] : bounds[k + 1]]
+            total = ((test_y - test_y.mean(axis=0)) ** 2).sum(axis=0)
+            for i, alpha in enumerate(alphas):
+                coef, intercept = solve(alpha)
+                residual = ((test_y - (test_x @ coef) - intercept) ** 2).sum(axis=0)
+                scores[i] += 1 - (residual / total)
+        best = np.argmax(scores, axis=0)
+
+        solve = decompose(range(cv))
+        coef = np.zeros((train_x.shape[1], train_y.shape[1]))
+        intercept = np.zeros(train_y.shape[1])
+        for i in np.unique(best):
+            alpha_coef, alpha_intercept = solve(alphas[i])
+            coef[:, best == i] = alpha_coef[:, best == i]
+            intercept[best == i] = alpha_intercept[best == i]
+
+        return coef, intercept
+
+    @staticmethod
+    def _rapm_gram_blocks(
+        train_x: sparse.csr_matrix, train_y: np.ndarray, block_keys: np.ndarray
+    ) -> dict:
+        """
+        function to reduce the RAPM design matrix to sufficient statistics for
+        each block of rows sharing a key. Each block holds X'X, X'y, the column
+        sums of X, the sum of y and the row count so that the ridge solution for
+        any union of blocks can be found by adding blocks together
+        """
+        blocks = {}
+        order = np.argsort(block_keys, kind="stable")
+        keys, starts = np.unique(block_keys[order], return_index=True)
+        bounds = np.append(starts, len(order))
+        for i, key in enumerate(keys):
+            rows = order[bounds[i] : bounds[i + 1]]
+            block_x = train_x[rows]
+            block_y = train_y[rows]
+            blocks[key] = (
+                (block_x.T @ block_x).tocsr(),
+                block_x.T @ block_y,
+                np.asarray(block_x.sum(axis=0)).ravel(),
+                block_y.sum(axis=0),
+                len(rows),
+            )
+
+        return blocks
+
+    @staticmethod
+    def _rapm_solve_blocks(blocks: list, lambda_value: float) -> tuple:
+        """
+        function to sum a list of gram blocks and solve the centered ridge
+        regression for the players that appear in them. Returns the column
+        positions solved for, their coefficients and the intercept
+        """
+        gram = sum(block[0] for block in blocks)
+        xty = sum(block[1] for block in blocks)
+        x_sum = sum(block[2] for block in blocks)
+        y_sum = sum(block[3] for block in blocks)
+        samples = sum(block[4] for block in blocks)
+
+        # only solve for columns that actually show up in the window, the home
+        # court column is always kept
+        active = np.flatnonzero(gram.diagonal() > 0)
+        active = np.union1d(active, [gram.shape[0] - 1])
+        gram = gram[active][:, active].toarray()
+        xty = xty[active]
+        x_sum = x_sum[active]
+
+        # centering the sufficient statistics is the same as fitting an
+        # intercept on the raw rows
+        gram -= np.outer(x_sum, x_sum) / samples
+        xty = xty - (x_sum * y_sum / samples)
+        alpha = (lambda_value * samples) / 2.0
+        coef = np.linalg.solve(gram + (alpha * np.eye(len(active))), xty)
+        intercept = (y_sum - (x_sum @ coef)) / samples
+
+        return active, coef, intercept
+
+    @staticmethod
+    def player_rapm_windows(
+        rapm_shifts: pd.DataFrame,
+        windows: list[tuple],
+        lambda_value: float = 0.05,
+        n_jobs: int = 1,
+    ) -> pd.DataFrame:
+        """
+        function to produce RAPM results for many season or date windows over
+        the same possessions in one pass. The design matrix is built once and
+        reduced to X'X blocks per season (or per game date for date windows),
+        and each window is solved from the sum of its blocks instead of
+        rebuilding the regression from the raw possessions
+
+        Inputs:
+        rapm_shifts  - dataframe of possessions from PbP.rapm_possessions()
+        windows      - list of (start, end) tuples, both ends inclusive. Integer
+                       tuples are season ranges, anything else is treated as a
+                       date range. Windows without possessions are left out
+                       and a ValueError is raised if none of them have any
+        lambda_value - ridge penalty, converted to an alpha the same way as in
+                       player_rapm_results
+        n_jobs       - number of threads used to solve windows in parallel
+
+        Outputs:
+        results_df   - the rapm columns of player_rapm_results for every window
+                       stacked together with window_type, season or date, and
+                       window_start and window_end dates. Season windows use
+                       the dates of their first and last games
+        """
+        registry = Registry.from_rapm_possessions(rapm_shifts)
+        train_x, players = PlayerTotals._rapm_design_matrix(rapm_shifts)
+        train_y = rapm_shifts["points_made"].to_numpy(dtype=float) * 100
+        seasons = rapm_shifts["season"].to_numpy()
+        dates = pd.to_datetime(rapm_shifts["game_date"]).dt.normalize().to_numpy()
+
+        def is_season_window(window):
+            return all(isinstance(w, (int, np.integer)) for w in window)
+
+        season_blocks = {}
+        date_blocks = {}
+        if any(is_season_window(w) for w in windows):
+            season_blocks = PlayerTotals._rapm_gram_blocks(train_x, train_y, seasons)
+        if not all(is_season_window(w) for w in windows):
+            date_blocks = PlayerTotals._rapm_gram_blocks(train_x, train_y, dates)
+
+        def solve_window(window):
+            if is_season_window(window):
+                blocks = {
+                    k: v
+                    for k, v in season_blocks.items()
+                    if window[0] <= k <= window[1]
+                }
+                window_seasons = list(blocks)
+                window_dates = dates[np.isin(seasons, window_seasons)]
+                window_type = "season"
+            else:
+                start, end = pd.Timestamp(window[0]), pd.Timestamp(window[1])
+                blocks = {
+                    k: v for k, v in date_blocks.items() if start <= k <= end
+                }
+                in_range = (dates >= start.to_datetime64()) & (
+                    dates <= end.to_datetime64()
+                )
+                window_seasons = np.unique(seasons[in_range])
+                window_dates = np.array([start.to_datetime64(), end.to_datetime64()])
+                window_type = "date"
+            if not blocks:
+                return None
+
+            active, coef, intercept = PlayerTotals._rapm_solve_blocks(
+                list(blocks.values()), lambda_value
+            )
+            full_coef = np.zeros((2 * len(players)) + 1)
+            full_coef[active] = coef
+            in_window = np.isin(np.arange(len(players)), active) | np.isin(
+                np.arange(len(players)) + len(players), active
+            )
+            players_coef = PlayerTotals._rapm_coef_frame(
+                players[in_window],
+                np.concatenate(
+                    [
+                        full_coef[0 : len(players)][in_window],
+                        full_coef[len(players) : 2 * len(players)][in_window],
+                    ]
+                ),
+                intercept,
+                "rapm",
+            )
+            players_coef["min_season"] = min(window_seasons)
+            players_coef["max_season"] = max(window_seasons)
+            # season windows are described by the dates of their first and
+            # last possessions so both kinds of window share column types
+            players_coef["window_type"] = window_type
+            players_coef["window_start"] = pd.Timestamp(window_dates.min())
+            players_coef["window_end"] = pd.Timestamp(window_dates.max())
+
+            return players_coef
+
+        if n_jobs > 1:
+            with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+                window_results = list(executor.map(solve_window, windows))
+        else:
+            window_results = [solve_window(w) for w in windows]
+
+        if all(r is None for r in window_results):
+            raise ValueError(f"no possessions fall in the windows {list(windows)}")
+        results_df = pd.concat([r for r in window_results if r is not None])
+        results_df["player_name"] = registry.player_names(results_df["player_id"])
+        rapm_cols = [c for c in results_df.columns if c.startswith("rapm")]
+        results_df[rapm_cols] = np.round(results_df[rapm_cols], decimals=2)
+
+        return results_df.reset_index(drop=True)
@@ -0,0 +1,92 @@
+import numpy as np
+
+
+class RapmModel:
+    """
+    This class holds the coefficients of a fitted player RAPM regression so
+    hypothetical lineups can be scored against it without going back to the
+    results dataframe. PlayerTotals.player_rapm_results() attaches one of these
+    to its output as results_df.attrs["rapm_model"]. Predictions are points
+    per 100 possessions for the offensive lineup
+    """
+
+    def __init__(
+        self,
+        player_ids: np.ndarray,
+        off_coef: np.ndarray,
+        def_coef: np.ndarray,
+        home_coef: float,
+        intercept: float,
+    ) -> None:
+        self.player_ids = np.asarray(player_ids, dtype=np.int64)
+        self.home_coef = float(home_coef)
+        self.intercept = float(intercept)
+
+        # players the model has never seen get a coefficient of zero which is
+        # stored in the slot after the last real player
+        self._off_coef = np.append(np.asarray(off_coef, dtype=float), 0.0)
+        self._def_coef = np.append(np.asarray(def_coef, dtype=float), 0.0)
+
+        # id -> coefficient index lookup array so scoring is a single gather
+        # instead of a dictionary lookup per player. The last slot catches any
+        # id larger than the largest id in the model
+        self._lookup = np.full(
+            self.player_ids.max() + 2, len(self.player_ids), dtype=np.int32
+        )
+        self._lookup[self.player_ids] = np.arange(len(self.player_ids))
+
+    def __deepcopy__(self, memo):
+        # the coefficients are never changed after fitting so copies of the
+        # results dataframe can share one model instead of copying the lookup
+        return self
+
+    def _index(self, ids: np.ndarray) -> np.ndarray:
+        """
+        function to map an array of player ids to coefficient indexes
+        """
+        return self._lookup[np.clip(ids, 0, len(self._lookup) - 1)]
+
+    def predict_lineups(
+        self,
+        off_ids: np.ndarray,
+        def_ids: np.ndarray,
+        is_home=0,
+        chunk_size: int = 250_000,
+    ) -> np.ndarray:
+        """
+        method to score offensive lineups against defensive lineups
+
+        Inputs:
+        off_ids    - N x 5 integer array of offensive player ids
+        def_ids    - N x 5 integer array of defensive player ids
+        is_home    - scalar or length N array flagging the offense as the home
+                     team
+        chunk_size - number of lineups scored at a time to keep the gathered
+                     coefficient arrays small
+
+        Outputs:
+        predictions - length N array of expected points per 100 possessions
+        """
+        off_ids = np.asarray(off_ids, dtype=np.int64)
+        def_ids = np.asarray(def_ids, dtype=np.int64)
+        for name, ids in [("off_ids", off_ids), ("def_ids", def_ids)]:
+            if ids.ndim != 2 or ids.shape[1] != 5:
+                raise ValueError(f"{name} must be an N x 5 array not {ids.shape}")
+        if len(off_ids) != len(def_ids):
+            raise ValueError("off_ids and def_ids must have the same number of rows")
+
+        is_home = np.broadcast_to(np.asarray(is_home, dtype=float), len(off_ids))
+        predictions = np.empty(len(off_ids))
+
+        for start in range(0, len(off_ids), chunk_size):
+            end = start + chunk_size
+            off_index = self._index(off_ids[start:end])
+            def_index = self._index(def_ids[start:end])
+            predictions[start:end] = (
+                self.intercept
+                + self._off_coef[off_index].sum(axis=1)
+                - self._def_coef[def_index].sum(axis=1)
+                + (self.home_coef * is_home[start:end])
+            )
+
+        return predictions
@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+
+class Registry:
+    """
+    This class holds the id -> name dimensions for players and teams so the
+    stat calculations can group and join on integer ids only and attach the
+    names at the very end. A registry is built once from the play by play
+    events and can be shared between PbP, PlayerTotals and TeamTotals objects
+    or merged with the registries of other games
+    """
+
+    def __init__(
+        self,
+        players: Optional[pd.Series] = None,
+        teams: Optional[pd.Series] = None,
+    ) -> None:
+        self.players = players if players is not None else pd.Series(dtype=object)
+        self.teams = teams if teams is not None else pd.Series(dtype=object)
+
+    @staticmethod
+    def _first_names(
+        id_cols: list[np.ndarray], name_cols: list[np.ndarray]
+    ) -> pd.Series:
+        """
+        function to reduce parallel id and name arrays to one name per id
+        keeping the first name seen for each id
+        """
+        ids = []
+        names = []
+        for id_col, name_col in zip(id_cols, name_cols):
+            id_col = pd.to_numeric(pd.Series(id_col), errors="coerce").to_numpy()
+            name_col = np.asarray(name_col, dtype=object)
+            valid = ~pd.isnull(id_col) & ~pd.isnull(name_col)
+            id_col = id_col[valid].astype(np.int64)
+            name_col = name_col[valid]
+            # only the first row for each id in every column is kept so the
+            # concat below stays tiny no matter how many events there are
+            _, first = np.unique(id_col, return_index=True)
+            ids.append(id_col[first])
+            names.append(name_col[first])
+
+        if not ids:
+            return pd.Series(dtype=object)
+
+        series = pd.Series(np.concatenate(names), index=np.concatenate(ids))
+        series = series[~series.index.duplicated()]
+        series.index.name = None
+
+        return series.sort_index()
+
+    @classmethod
+    def from_events(cls, pbp_df: pd.DataFrame) -> Registry:
+        """
+        method to build a registry from a play by play dataframe using the
+        event player columns and the on court lineup columns
+        """
+        id_cols = []
+        name_cols = []
+        for i in range(1, 4):
+            id_cols.append(pbp_df[f"player{i}_id"].to_numpy())
+            name_cols.append(pbp_df[f"player{i}_name"].to_numpy())
+        for side in ["home", "away"]:
+            for i in range(1, 6):
+                id_cols.append(pbp_df[f"{side}_player_{i}_id"].to_numpy())
+                name_cols.append(pbp_df[f"{side}_player_{i}"].to_numpy())
+
+        teams = cls._first_names(
+            [
+                pbp_df["home_team_id"].to_numpy(),
+                pbp_df["away_team_id"].to_numpy(),
+            ],
+            [
+                pbp_df["home_team_abbrev"].to_numpy(),
+                pbp_df["away_team_abbrev"].to_numpy(),
+            ],
+        )
+
+        return cls(cls._first_names(id_cols, name_cols), teams)
+
+    @classmethod
+    def from_frame(
+        cls,
+        df: pd.DataFrame,
+        player_cols: tuple[str, str] = ("player_id", "player_name"),
+        team_cols: tuple[str, str] = ("team_id", "team_abbrev"),
+    ) -> Registry:
+        """
+        method to build a registry from any dataframe that carries id and name
+        columns, like the outputs of playerbygamestats() or teambygamestats().
+        Missing columns are skipped
+        """
+        players = None
+        teams = None
+        if set(player_cols).issubset(df.columns):
+            players = cls._first_names(
+                [df[player_cols[0]].to_numpy()], [df[player_cols[1]].to_numpy()]
+            )
+        if set(team_cols).issubset(df.columns):
+            teams = cls._first_names(
+                [df[team_cols[0]].to_numpy()], [df[team_cols[1]].to_numpy()]
+            )
+
+        return cls(players, teams)
+
+    @classmethod
+    def from_rapm_possessions(cls, rapm_shifts: pd.DataFrame) -> Registry:
+        """
+        method to build a registry of players from PbP.rapm_possessions()
+        output
+        """
+        id_cols = []
+        name_cols = []
+        for side in ["off", "def"]:
+            for i in range(1, 6):
+                id_cols.append(rapm_shifts[f"{side}_player_{i}_id"].to_numpy())
+                name_cols.append(rapm_shifts[f"{side}_player_{i}"].to_numpy())
+
+        return cls(cls._first_names(id_cols, name_cols))
+
+    def merge(self, other: Registry) -> Registry:
+        """
+        method to combine two registries, names already in this registry win
+        """
+        players = pd.concat([self.players, other.players])
+        teams = pd.concat([self.teams, other.teams])
+
+        return Registry(
+            players[~players.index.duplicated()].sort_index(),
+            teams[~teams.index.duplicated()].sort_index(),
+        )
+
+    def player_names(self, player_ids) -> np.ndarray:
+        """
+        method to look up player names for an array of player ids
+        """
+        return self.players.reindex(np.asarray(player_ids)).to_numpy()
+
+    def team_abbrevs(self, team_ids) -> np.ndarray:
+        """
+        method to look up team abbreviations for an array of team ids
+        """
+        return self.teams.reindex(np.asarray(team_ids)).to_numpy()
@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Optional, Union
+
+
+def fetch_nba_stats(endpoint: str, params: dict) -> dict:
+    """
+    function to request one stats.nba.com endpoint through nba_api and return
+    the raw json payload as a dictionary
+    """
+    try:
+        from nba_api.stats.library.http import NBAStatsHTTP
+    except Exception as exc:  # pragma: no cover - import failure
+        raise ImportError("nba_api is required to fetch play-by-play data") from exc
+
+    response = NBAStatsHTTP().send_api_request(endpoint=endpoint, parameters=params)
+
+    return response.get_dict()
+
+
+class ResponseCache:
+    """
+    This class stores raw stats.nba.com payloads on disk as gzipped json keyed
+    by endpoint and request parameters, so backfills can be rerun without
+    downloading every game again. Payloads of finished games never expire,
+    anything else, like a game that is still being played, is fetched again
+    once it's older than the ttl. In offline mode nothing is fetched and only
+    what's already in the cache is served, which is how the API path of
+    load_pbp is tested without a network
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        ttl: float = 60,
+        offline: bool = False,
+        fetcher: Optional[Callable[[str, dict], dict]] = None,
+    ) -> None:
+        self.path = Path(path)
+        self.ttl = ttl
+        self.offline = offline
+        self.fetcher = fetcher if fetcher is not None else fetch_nba_stats
+
+    @staticmethod
+    def key(endpoint: str, params: dict) -> str:
+        """
+        function to turn an endpoint and its parameters into a file name safe
+        cache key. Parameter order doesn't matter
+        """
+        params = json.dumps(params, sort_keys=True, default=str)
+
+        return hashlib.sha1(f"{endpoint.lower()}?{params}".encode()).hexdigest()
+
+    def _file(self, endpoint: str, params: dict) -> Path:
+        return self.path / endpoint.lower() / f"{self.key(endpoint, params)}.json.gz"
+
+    def read(self, endpoint: str, params: dict) -> Optional[dict]:
+        """
+        method to read a cached entry with its fetched_at time and final flag,
+        returns None if the request has never been cached
+        """
+        file = self._file(endpoint, params)
+        if not file.exists():
+            return None
+        with gzip.open(file, "rt", encoding="utf-8") as f:
+            return json.load(f)
+
+    def write(
+        self, endpoint: str, params: dict, payload: dict, final: bool = False
+    ) -> None:
+        """
+        method to store a payload. The file is written under a temporary name
+        and renamed so other processes or threads never read half written
+        entries
+        """
+        file = self._file(endpoint, params)
+        file.parent.mkdir(parents=True, exist_ok=True)
+        entry = {
+            "endpoint": endpoint,
+            "params": params,
+            "fetched_at": time.time(),
+            "final": bool(final),
+            "payload": payload,
+        }
+        # the process and thread ids keep concurrent writers from sharing
+        # a temporary name
+        writer = f"{os.getpid()}.{threading.get_ident()}"
+        tmp_file = file.with_name(f".{file.name}.{writer}.tmp")
+        with gzip.open(tmp_file, "wt", encoding="utf-8") as f:
+            json.dump(entry, f)
+        os.replace(tmp_file, file)
+
+    def fetch(
+        self,
+        endpoint: str,
+        params: dict,
+        is_final: Optional[Callable[[dict], bool]] = None,
+        fetcher: Optional[Callable[[str, dict], dict]] = None,
+    ) -> dict:
+        """
+        method to get an endpoint's payload from the cache, or from the fetcher
+        if it isn't cached or has expired
+
+        Inputs:
+        endpoint    - stats.nba.com endpoint name like playbyplayv2
+        params      - request parameters
+        is_final    - optional function that says from a payload whether the
+                      game is over, final payloads are kept forever
+        fetcher     - optional function to use instead of the cache's fetcher
+
+        Outputs:
+        payload     - the raw json payload as a dictionary
+        """
+        entry = self.read(endpoint, params)
+        if entry is not None and (
+            self.offline
+            or entry["final"]
+            or time.time() - entry["fetched_at"] < self.ttl
+        ):
+            return entry["payload"]
+        if self.offline:
+            raise FileNotFoundError(
+                f"{endpoint} {params} isn't in the cache and the cache is offline"
+            )
+
+        fetcher = fetcher if fetcher is not None else self.fetcher
+        payload = fetcher(endpoint, params)
+        final = is_final(payload) if is_final is not None else False
+        self.write(endpoint, params, payload, final)
+
+        return payload
@@ -0,0 +1,242 @@
+from __future__ import annotations
+
+from typing import Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+from .playertotals import PlayerTotals
+from .registry import Registry
+from .teamtotals import TeamTotals
+
+
+class _Rollup:
+    """
+    This class keeps the game, season and career sums of one key (player_id or
+    team_id). Adding or correcting games only turns the changed game rows into
+    a delta and applies it to the season and career rows it touches
+    """
+
+    def __init__(self, key: str, stats: list[str]) -> None:
+        self.key = key
+        self.stats = stats + ["gp"]
+        self.games = self._empty(["game_id", key], ["season", "game_date"])
+        self.seasons = self._empty([key, "season"], [])
+        self.careers = self._empty([key], [])
+
+    def _empty(self, index: list[str], columns: list[str]) -> pd.DataFrame:
+        """
+        method to create an empty level with integer stat columns
+        """
+        return pd.DataFrame(
+            {
+                **{column: pd.Series(dtype=object) for column in columns},
+                **{stat: pd.Series(dtype=np.int64) for stat in self.stats},
+            },
+            index=pd.MultiIndex.from_arrays([[]] * len(index), names=index),
+        )
+
+    def _apply(self, level: pd.DataFrame, delta: pd.DataFrame) -> pd.DataFrame:
+        """
+        method to add a delta to the rows of a level it touches, appending
+        rows for new keys and dropping rows that no longer have any games
+        """
+        delta = delta[(delta != 0).any(axis=1)]
+        existing = delta.index.isin(level.index)
+        if existing.any():
+            rows = delta.index[existing]
+            level.loc[rows, self.stats] = level.loc[rows, self.stats] + delta[existing]
+        if not existing.all():
+            level = (
+                delta[~existing]
+                if level.empty
+                else pd.concat([level, delta[~existing]])
+            )
+        if (level["gp"] == 0).any():
+            level = level[level["gp"] != 0]
+
+        return level
+
+    def upsert(self, rows: pd.DataFrame) -> None:
+        """
+        method to add new game rows, replacing any rows already stored for the
+        same games
+        """
+        rows = rows.assign(gp=1).set_index(["game_id", self.key])
+        rows = rows[self.games.columns]
+        # missing counts are zeros, the same as when they're summed by groupby
+        rows[self.stats] = rows[self.stats].fillna(0)
+        game_ids = rows.index.get_level_values("game_id").unique()
+        self._replace(game_ids, rows)
+
+    def remove(self, game_ids) -> None:
+        """
+        method to remove every row of a list of games
+        """
+        self._replace(pd.Index(game_ids), self.games.iloc[:0])
+
+    def _replace(self, game_ids: pd.Index, rows: pd.DataFrame) -> None:
+        """
+        method to swap the stored rows of some games for new ones and push the
+        difference up to the season and career levels
+        """
+        replaced = self.games.index.get_level_values("game_id").isin(game_ids)
+        old = self.games[replaced]
+        delta = rows
+        if not old.empty:
+            old = old.assign(**{stat: -old[stat] for stat in self.stats})
+            delta = old if rows.empty else pd.concat([rows, old])
+        delta = delta.reset_index()
+
+        if self.games.empty:
+            self.games = rows
+        elif not rows.empty:
+            self.games = pd.concat([self.games[~replaced], rows])
+        else:
+            self.games = self.games[~replaced]
+        self.seasons = self._apply(
+            self.seasons, delta.groupby([self.key, "season"])[self.stats].sum()
+        )
+        self.careers = self._apply(
+            self.careers, delta.groupby(self.key)[self.stats].sum()
+        )
+
+    def read(self, level: str, ids=None, seasons=None) -> pd.DataFrame:
+        """
+        method to select the rows of one level
+        """
+        if level == "game":
+            rows = self.games
+        elif level == "season":
+            rows = self.seasons
+        elif level == "career":
+            rows = self.careers
+        else:
+            raise ValueError(f"level must be game, season or career not {level}")
+
+        mask = np.ones(len(rows), dtype=bool)
+        if ids is not None:
+            mask &= rows.index.get_level_values(self.key).isin(ids)
+        if seasons is not None:
+            if level == "career":
+                raise ValueError("career rows can't be filtered by season")
+            if level == "game":
+                mask &= rows["season"].isin(seasons).to_numpy()
+            else:
+                mask &= rows.index.get_level_values("season").isin(seasons)
+
+        return rows[mask].reset_index()
+
+
+class RollupCache:
+    """
+    This class materializes player and team totals at the game, season and
+    career level so stat pages can read them without regrouping every per
+    game row. Only the summable counting stats are stored, the rate stats are
+    derived from them when they're read. When a game is added, or added again
+    with corrected stats, the difference between its new and old rows is
+    applied to the season and career rows of the players and teams in it and
+    nothing else is recomputed
+    """
+
+    def __init__(self, registry: Optional[Registry] = None) -> None:
+        self._registry = registry
+        self._game_registry = Registry()
+        self.players = _Rollup("player_id", PlayerTotals.stats)
+        self.teams = _Rollup("team_id", TeamTotals.stats + ["toc"])
+
+    @property
+    def registry(self) -> Registry:
+        if self._registry is not None:
+            return self._registry
+        return self._game_registry
+
+    def add_games(
+        self,
+        pbg_list: Iterable[pd.DataFrame] = (),
+        tbg_list: Iterable[pd.DataFrame] = (),
+    ) -> RollupCache:
+        """
+        method to add playerbygamestats() and teambygamestats() dataframes to
+        the cache. Games that are already in the cache are replaced so a
+        correction is just adding the game again
+
+        Inputs:
+        pbg_list    - playerbygamestats() dataframes
+        tbg_list    - teambygamestats() dataframes, both teams of every game
+                      have to be in the same call
+
+        Outputs:
+        self
+        """
+        pbg_list = list(pbg_list)
+        tbg_list = list(tbg_list)
+        if pbg_list:
+            pbg = pd.concat(pbg_list)
+            self._game_registry = self._game_registry.merge(Registry.from_frame(pbg))
+            self.players.upsert(pbg)
+        if tbg_list:
+            tbg = pd.concat(tbg_list)
+            self._game_registry = self._game_registry.merge(Registry.from_frame(tbg))
+            self.teams.upsert(TeamTotals._opponent_frame(tbg))
+
+        return self
+
+    def remove_games(self, game_ids) -> RollupCache:
+        """
+        method to take games out of the cache, the season and career rows of
+        everyone in them are reduced by their stats
+        """
+        self.players.remove(game_ids)
+        self.teams.remove(game_ids)
+
+        return self
+
+    def player_stats(
+        self, level: str = "season", player_ids=None, seasons=None
+    ) -> pd.DataFrame:
+        """
+        method to read player totals and rate stats from the cache
+
+        Inputs:
+        level       - "game", "season" or "career"
+        player_ids  - optional list of player ids to read
+        seasons     - optional list of seasons to read, not for careers
+
+        Outputs:
+        player_df   - summed counting stats, games played and the rate stats of
+                      PlayerTotals.player_advanced_stats()
+        """
+        player_df = self.players.read(level, player_ids, seasons)
+        player_df.insert(
+            player_df.columns.get_loc("player_id") + 1,
+            "player_name",
+            self.registry.player_names(player_df["player_id"]),
+        )
+
+        return PlayerTotals._add_rate_stats(player_df)
+
+    def team_stats(
+        self, level: str = "season", team_ids=None, seasons=None
+    ) -> pd.DataFrame:
+        """
+        method to read team totals and rate stats from the cache
+
+        Inputs:
+        level       - "game", "season" or "career"
+        team_ids    - optional list of team ids to read
+        seasons     - optional list of seasons to read, not for careers
+
+        Outputs:
+        team_df     - summed counting stats, games played, the four factors and
+                      ratings of TeamTotals.team_advanced_stats() and pace
+        """
+        team_df = self.teams.read(level, team_ids, seasons)
+        team_df.insert(
+            team_df.columns.get_loc("team_id") + 1,
+            "team_abbrev",
+            self.registry.team_abbrevs(team_df["team_id"]),
+        )
+        team_df = TeamTotals._add_rate_stats(team_df)
+
+        return TeamTotals._add_pace(team_df)
@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+import os
+import threading
+from pathlib import Path
+from typing import Callable, Optional, Union
+
+import pandas as pd
+
+from .data import result_set_frame
+from .responsecache import fetch_nba_stats
+
+
+class Schedule:
+    """
+    This class keeps a local table of game metadata, the date and home and
+    away teams of every game, built from the LeagueGameLog endpoint. A whole
+    season is refreshed with one request so load_pbp can fill in the game
+    date and teams without a BoxScoreSummaryV2 request per game. The table
+    can be saved to and loaded from a csv
+    """
+
+    columns = [
+        "game_id",
+        "season",
+        "game_date",
+        "home_team_id",
+        "away_team_id",
+        "home_team_abbrev",
+        "away_team_abbrev",
+    ]
+
+    def __init__(
+        self,
+        path: Optional[Union[str, Path]] = None,
+        fetcher: Optional[Callable[[str, dict], dict]] = None,
+    ) -> None:
+        self.path = Path(path) if path is not None else None
+        self.fetcher = fetcher if fetcher is not None else fetch_nba_stats
+        if self.path is not None and self.path.exists():
+            self.games = pd.read_csv(self.path, dtype={"game_date": str})
+        else:
+            self.games = pd.DataFrame(
+                {
+                    column: pd.Series(
+                        dtype=str if column.endswith(("date", "abbrev")) else int
+                    )
+                    for column in self.columns
+                }
+            )
+        self._index = self.games.set_index("game_id")
+
+    @staticmethod
+    def season_string(season: int) -> str:
+        """
+        function to turn a season like 2020 into the 2019-20 format the api
+        expects
+        """
+        return f"{season - 1}-{str(season)[2:]}"
+
+    @staticmethod
+    def from_game_log(payload: dict, season: int) -> pd.DataFrame:
+        """
+        function to turn a team LeagueGameLog payload into one row per game.
+        The log has a row for each team in a game and the home team's matchup
+        is written like LAC vs. LAL while the away team's is LAL @ LAC
+
+        Inputs:
+        payload - raw LeagueGameLog json payload
+        season  - season of the games like 2020 for 2019-20
+
+        Outputs:
+        games   - dataframe of Schedule.columns
+        """
+        log_df = result_set_frame(payload)
+        log_df["game_id"] = log_df["game_id"].astype(int)
+        is_home = log_df["matchup"].str.contains(" vs. ", regex=False)
+        home_df = log_df.loc[
+            is_home, ["game_id", "game_date", "team_id", "team_abbreviation"]
+        ].rename(
+            columns={"team_id": "home_team_id", "team_abbreviation": "home_team_abbrev"}
+        )
+        away_df = log_df.loc[
+            ~is_home, ["game_id", "team_id", "team_abbreviation"]
+        ].rename(
+            columns={"team_id": "away_team_id", "team_abbreviation": "away_team_abbrev"}
+        )
+        games = home_df.merge(away_df, on="game_id")
+        games["game_date"] = games["game_date"].str.split("T").str[0]
+        games["season"] = season
+
+        return games[Schedule.columns].sort_values("game_id").reset_index(drop=True)
+
+    def refresh(self, season: int, season_type: str = "Regular Season") -> int:
+        """
+        method to download the schedule of a season with one LeagueGameLog
+        request and replace the season's rows in the table. The table is
+        saved if the schedule has a path
+
+        Inputs:
+        season      - season like 2020 for 2019-20
+        season_type - Regular Season, Playoffs or Pre Season
+
+        Outputs:
+        games       - number of games in the refreshed season
+        """
+        payload = self.fetcher(
+            "leaguegamelog",
+            {
+                "Counter": 0,
+                "Direction": "ASC",
+                "LeagueID": "00",
+                "PlayerOrTeam": "T",
+                "Season": self.season_string(season),
+                "SeasonType": season_type,
+                "Sorter": "DATE",
+                "DateFrom": "",
+                "DateTo": "",
+            },
+        )
+        season_games = self.from_game_log(payload, season)
+        kept = self.games[~self.games["game_id"].isin(season_games["game_id"])]
+        self.games = pd.concat([kept, season_games]) if not kept.empty else season_games
+        self.games = self.games.sort_values("game_id").reset_index(drop=True)
+        self._index = self.games.set_index("game_id")
+        if self.path is not None:
+            self.save(self.path)
+
+        return len(season_games)
+
+    def save(self, path: Union[str, Path]) -> None:
+        """
+        method to write the table to a csv. The file is written under a
+        temporary name and renamed so readers never see a half written table
+        """
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # the process and thread ids keep concurrent writers from sharing
+        # a temporary name
+        writer = f"{os.getpid()}.{threading.get_ident()}"
+        tmp_path = path.with_name(f".{path.name}.{writer}.tmp")
+        self.games.to_csv(tmp_path, index=False)
+        os.replace(tmp_path, path)
+
+    def lookup(self, game_id: Union[int, str]) -> Optional[dict]:
+        """
+        method to get the metadata of a game as a dictionary, returns None if
+        the game isn't in the schedule
+        """
+        game_id = int(game_id)
+        if game_id not in self._index.index:
+            return None
+        game = self._index.loc[game_id]
+
+        return {
+            "game_id": game_id,
+            "season": int(game["season"]),
+            "game_date": game["game_date"],
+            "home_team_id": int(game["home_team_id"]),
+            "away_team_id": int(game["away_team_id"]),
+            "home_team_abbrev": game["home_team_abbrev"],
+            "away_team_abbrev": game["away_team_abbrev"],
+        }
@@ -0,0 +1,291 @@
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import threading
+from pathlib import Path
+from typing import Iterable, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+# kinds of rows the store keeps with the id column their partitions are
+# sorted by
+KEYS = {"players": "player_id", "teams": "team_id"}
+
+
+class SeasonStore:
+    """
+    This class keeps playerbygamestats() and teambygamestats() outputs on disk
+    partitioned by season. Every partition holds one .npy file per column
+    sorted by player or team id and then game date, object columns like
+    strings are stored as integer codes plus a json list of their unique
+    values with missing values as code -1, and a small index holds
+    the row range of every id. Lookups memory map the column files and only
+    read the rows of the requested id, so a player's games over a few seasons
+    take milliseconds instead of filtering big concatenated frames
+    """
+
+    def __init__(self, path: Union[str, Path]) -> None:
+        self.path = Path(path)
+        self._partitions = {}
+
+    def _partition_dir(self, kind: str, season: int) -> Path:
+        return self.path / kind / str(int(season))
+
+    def seasons(self, kind: str = "players") -> list[int]:
+        """
+        method to list the seasons stored for players or teams
+        """
+        kind_dir = self.path / kind
+        if not kind_dir.exists():
+            return []
+
+        return sorted(
+            int(season_dir.name)
+            for season_dir in kind_dir.iterdir()
+            if season_dir.name.isdigit()
+        )
+
+    def _write_partition(self, kind: str, season: int, df: pd.DataFrame) -> None:
+        """
+        method to write a season's rows sorted by id and game date. The files
+        are written to a temporary directory that is swapped in afterwards so
+        readers never see a half written partition
+        """
+        key = KEYS[kind]
+        df = df.assign(game_date=pd.to_datetime(df["game_date"]))
+        df = df.sort_values([key, "game_date", "game_id"], kind="stable")
+        df = df.reset_index(drop=True)
+        partition_dir = self._partition_dir(kind, season)
+        # the process and thread ids keep concurrent writers from sharing
+        # a temporary name
+        writer = f"{os.getpid()}.{threading.get_ident()}"
+        tmp_dir = partition_dir.with_name(f".{season}.{writer}.tmp")
+        if tmp_dir.exists():
+            shutil.rmtree(tmp_dir)
+        tmp_dir.mkdir(parents=True)
+
+        columns = {}
+        for column in df.columns:
+            values = df[column]
+            if values.dtype == object or isinstance(values.dtype, pd.CategoricalDtype):
+                codes, uniques = pd.factorize(values.astype(object))
+                np.save(tmp_dir / f"{column}.npy", codes.astype(np.int32))
+                # numbers and booleans keep their type, anything json can't
+                # hold like a timestamp is stored as its string
+                uniques = [
+                    unique.item() if isinstance(unique, np.generic) else unique
+                    for unique in uniques
+                ]
+                with open(tmp_dir / f"{column}.json", "w") as f:
+                    json.dump(uniques, f, default=str)
+                columns[column] = "string"
+            else:
+                np.save(tmp_dir / f"{column}.npy", values.to_numpy())
+                columns[column] = str(values.dtype)
+
+        ids = df[key].to_numpy()
+        starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+        np.savez(
+            tmp_dir / "index.npz",
+            ids=ids[starts],
+            starts=starts,
+            stops=np.r_[starts[1:], len(ids)],
+        )
+        game_dates = df["game_date"]
+        with open(tmp_dir / "meta.json", "w") as f:
+            json.dump(
+                {
+                    "columns": columns,
+                    "rows": len(df),
+                    "min_date": str(game_dates.min()) if len(df) else None,
+                    "max_date": str(game_dates.max()) if len(df) else None,
+                },
+                f,
+            )
+
+        old_dir = partition_dir.with_name(f".{season}.{writer}.old")
+        if partition_dir.exists():
+            os.replace(partition_dir, old_dir)
+        os.replace(tmp_dir, partition_dir)
+        if old_dir.exists():
+            shutil.rmtree(old_dir)
+        self._partitions.pop((kind, season), None)
+
+    def _partition(self, kind: str, season: int) -> dict:
+        """
+        method to open a partition. The index, metadata and string values are
+        read once and the column files are memory mapped
+        """
+        if (kind, season) not in self._partitions:
+            partition_dir = self._partition_dir(kind, season)
+            with open(partition_dir / "meta.json") as f:
+                meta = json.load(f)
+            with np.load(partition_dir / "index.npz") as index:
+                index = {name: index[name] for name in index.files}
+            uniques = {}
+            for column, column_type in meta["columns"].items():
+                if column_type == "string":
+                    with open(partition_dir / f"{column}.json") as f:
+                        uniques[column] = np.array(
+                            json.load(f) + [np.nan], dtype=object
+                        )
+            self._partitions[(kind, season)] = {
+                "meta": meta,
+                "index": index,
+                "uniques": uniques,
+                "arrays": {
+                    column: np.load(partition_dir / f"{column}.npy", mmap_mode="r")
+                    for column in meta["columns"]
+                },
+            }
+
+        return self._partitions[(kind, season)]
+
+    def _read_rows(self, kind: str, season: int, start: int, stop: int) -> pd.DataFrame:
+        """
+        method to read a row range of a partition, decoding string codes back
+        to their values
+        """
+        partition = self._partition(kind, season)
+        data = {}
+        for column, array in partition["arrays"].items():
+            values = np.array(array[start:stop])
+            if column in partition["uniques"]:
+                # code -1 marks a missing value and picks the trailing NaN
+                values = partition["uniques"][column][values]
+            data[column] = values
+
+        return pd.DataFrame(data)
+
+    def _id_rows(self, kind: str, season: int, key_id: int) -> tuple[int, int]:
+        """
+        method to look up the row range of an id in a partition, returns an
+        empty range if the id has no rows
+        """
+        index = self._partition(kind, season)["index"]
+        position = np.searchsorted(index["ids"], key_id)
+        if position == len(index["ids"]) or index["ids"][position] != key_id:
+            return 0, 0
+
+        return int(index["starts"][position]), int(index["stops"][position])
+
+    def _read_partition(self, kind: str, season: int) -> pd.DataFrame:
+        rows = self._partition(kind, season)["meta"]["rows"]
+
+        return self._read_rows(kind, season, 0, rows)
+
+    def add_games(
+        self,
+        pbg_list: Iterable[pd.DataFrame] = (),
+        tbg_list: Iterable[pd.DataFrame] = (),
+    ) -> None:
+        """
+        method to add per game outputs to the store. Every season the games
+        touch is rewritten sorted, games that are already stored are replaced
+
+        Inputs:
+        pbg_list    - dataframes from PbP.playerbygamestats()
+        tbg_list    - dataframes from PbP.teambygamestats()
+        """
+        for kind, frames in [("players", pbg_list), ("teams", tbg_list)]:
+            frames = [df for df in frames if not df.empty]
+            if not frames:
+                continue
+            key = KEYS[kind]
+            new_df = pd.concat(frames, ignore_index=True)
+            stored = set(self.seasons(kind))
+            for season, season_df in new_df.groupby("season"):
+                season = int(season)
+                if season in stored:
+                    season_df = pd.concat(
+                        [self._read_partition(kind, season), season_df],
+                        ignore_index=True,
+                    )
+                    season_df = season_df.drop_duplicates(["game_id", key], keep="last")
+                self._write_partition(kind, season, season_df)
+
+    def player_games(
+        self, player_id: int, seasons: Optional[Union[int, Iterable[int]]] = None
+    ) -> pd.DataFrame:
+        """
+        method to get the playerbygamestats() rows of a player
+
+        Inputs:
+        player_id   - id of the player
+        seasons     - optional season or seasons like range(2018, 2021),
+                      every stored season if left out
+
+        Outputs:
+        pbg_df      - the player's games sorted by date
+        """
+        if seasons is None:
+            seasons = self.seasons("players")
+        elif isinstance(seasons, (int, np.integer)):
+            seasons = [seasons]
+        stored = set(self.seasons("players"))
+        frames = []
+        for season in sorted(set(int(season) for season in seasons) & stored):
+            start, stop = self._id_rows("players", season, player_id)
+            if stop > start:
+                frames.append(self._read_rows("players", season, start, stop))
+
+        return self._combine(frames, "players")
+
+    def team_games(
+        self,
+        team_id: int,
+        date_range: Optional[tuple] = None,
+    ) -> pd.DataFrame:
+        """
+        method to get the teambygamestats() rows of a team
+
+        Inputs:
+        team_id     - id of the team
+        date_range  - optional first and last game dates to include, seasons
+                      entirely outside of them aren't read
+
+        Outputs:
+        tbg_df      - the team's games sorted by date
+        """
+        if date_range is not None:
+            first, last = (pd.Timestamp(date) for date in date_range)
+        frames = []
+        for season in self.seasons("teams"):
+            if date_range is not None:
+                meta = self._partition("teams", season)["meta"]
+                if meta["rows"] == 0 or (
+                    pd.Timestamp(meta["max_date"]) < first
+                    or pd.Timestamp(meta["min_date"]) > last
+                ):
+                    continue
+            start, stop = self._id_rows("teams", season, team_id)
+            if stop == start:
+                continue
+            if date_range is not None:
+                # rows of a team are sorted by date so the range is a slice
+                game_dates = self._partition("teams", season)["arrays"]["game_date"]
+                dates = np.asarray(game_dates[start:stop])
+                start, stop = (
+                    start + int(np.searchsorted(dates, np.datetime64(first), "left")),
+                    start + int(np.searchsorted(dates, np.datetime64(last), "right")),
+                )
+            if stop > start:
+                frames.append(self._read_rows("teams", season, start, stop))
+
+        return self._combine(frames, "teams")
+
+    def _combine(self, frames: list, kind: str) -> pd.DataFrame:
+        """
+        method to stack the rows read from several seasons, an empty frame
+        with the stored columns is returned if nothing matched
+        """
+        if frames:
+            return pd.concat(frames, ignore_index=True)
+        seasons = self.seasons(kind)
+        if not seasons:
+            return pd.DataFrame()
+
+        return self._read_rows(kind, seasons[0], 0, 0)
@@ -0,0 +1,291 @@
+from __future__ import annotations
+
+import io
+import sys
+from typing import Iterable, Optional, Union
+
+import pandas as pd
+
+from .pbp import PbP
+
+# outputs the sink knows how to write with the columns that identify a row.
+# Possessions have no key of their own so a game's possessions are replaced
+# as a whole
+OUTPUT_KEYS = {
+    "playerbygamestats": ["game_id", "player_id"],
+    "teambygamestats": ["game_id", "team_id"],
+    "rapm_possessions": None,
+}
+
+_PLACEHOLDERS = {
+    "qmark": lambda i: "?",
+    "numeric": lambda i: f":{i + 1}",
+    "format": lambda i: "%s",
+    "pyformat": lambda i: "%s",
+}
+
+
+def _quote(name: str) -> str:
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def _sql_type(dtype) -> str:
+    """
+    function to pick a column type that sqlite and postgres both understand
+    """
+    if pd.api.types.is_bool_dtype(dtype):
+        return "BOOLEAN"
+    if pd.api.types.is_integer_dtype(dtype):
+        return "BIGINT"
+    if pd.api.types.is_float_dtype(dtype):
+        return "DOUBLE PRECISION"
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return "TIMESTAMP"
+
+    return "TEXT"
+
+
+def _rows(df: pd.DataFrame) -> list[tuple]:
+    """
+    function to turn a dataframe into a list of row tuples of plain python
+    values the drivers can bind. Each column is converted once as an array
+    instead of converting every value of every row
+    """
+    columns = []
+    for column in df.columns:
+        values = df[column]
+        if pd.api.types.is_datetime64_any_dtype(values.dtype):
+            values = values.dt.strftime("%Y-%m-%d %H:%M:%S").astype(object)
+        elif pd.api.types.is_float_dtype(values.dtype):
+            values = values.astype(object)
+        elif not pd.api.types.is_numeric_dtype(values.dtype):
+            values = values.astype(object)
+        values = values.where(values.notna(), None) if values.hasnans else values
+        columns.append(values.tolist())
+
+    return list(zip(*columns))
+
+
+class DatabaseSink:
+    """
+    This class bulk loads the playerbygamestats(), teambygamestats() and
+    rapm_possessions() outputs into a database through any DB-API connection.
+    Games are buffered and written in batches with one executemany per table
+    and one commit per batch, so a batch is either written completely or not
+    at all. Player and team rows are upserted on (game_id, player_id) and
+    (game_id, team_id) and a game's possessions are replaced, which makes
+    loading the same games twice harmless. With a psycopg2 connection the
+    rows are sent with COPY into a temporary table instead of executemany
+    """
+
+    def __init__(
+        self,
+        connection,
+        batch_size: int = 50,
+        tables: Optional[dict] = None,
+        paramstyle: Optional[str] = None,
+        use_copy: Optional[bool] = None,
+    ) -> None:
+        self.connection = connection
+        self.batch_size = batch_size
+        self.tables = {output: output for output in OUTPUT_KEYS}
+        if tables is not None:
+            self.tables.update(tables)
+        driver = sys.modules.get(type(connection).__module__.split(".")[0])
+        if paramstyle is None:
+            paramstyle = getattr(driver, "paramstyle", "qmark")
+        if paramstyle not in _PLACEHOLDERS:
+            raise ValueError(f"paramstyle {paramstyle} isn't supported")
+        self.paramstyle = paramstyle
+        if use_copy is None:
+            use_copy = driver is not None and driver.__name__ == "psycopg2"
+        self.use_copy = use_copy
+        self._created = set()
+        self._pending = {output: [] for output in OUTPUT_KEYS}
+        self._pending_games = 0
+
+    def _placeholders(self, count: int) -> str:
+        return ", ".join(_PLACEHOLDERS[self.paramstyle](i) for i in range(count))
+
+    def _create_table(self, cursor, output: str, df: pd.DataFrame) -> None:
+        """
+        method to create an output's table from the dtypes of its dataframe if
+        it doesn't exist yet, with the output's key as the primary key
+        """
+        if output in self._created:
+            return
+        columns = [
+            f"{_quote(column)} {_sql_type(dtype)}"
+            for column, dtype in df.dtypes.items()
+        ]
+        keys = OUTPUT_KEYS[output]
+        if keys is not None:
+            columns.append(f"PRIMARY KEY ({', '.join(map(_quote, keys))})")
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {_quote(self.tables[output])} "
+            f"({', '.join(columns)})"
+        )
+
+    def _upsert_sql(self, output: str, columns: list, source: str) -> str:
+        """
+        method to build the insert statement of an output, with an ON CONFLICT
+        update for outputs that have a key
+        """
+        column_sql = ", ".join(map(_quote, columns))
+        sql = f"INSERT INTO {_quote(self.tables[output])} ({column_sql}) {source}"
+        keys = OUTPUT_KEYS[output]
+        if keys is not None:
+            updates = ", ".join(
+                f"{_quote(column)} = excluded.{_quote(column)}"
+                for column in columns
+                if column not in keys
+            )
+            sql += (
+                f" ON CONFLICT ({', '.join(map(_quote, keys))}) DO UPDATE SET {updates}"
+            )
+
+        return sql
+
+    def _write_output(self, cursor, output: str, df: pd.DataFrame) -> None:
+        """
+        method to write the rows of one output for a batch of games
+        """
+        self._create_table(cursor, output, df)
+        table = _quote(self.tables[output])
+        columns = list(df.columns)
+        if OUTPUT_KEYS[output] is None:
+            game_ids = [int(game_id) for game_id in df["game_id"].unique()]
+            cursor.executemany(
+                f"DELETE FROM {table} WHERE game_id = {self._placeholders(1)}",
+                [(game_id,) for game_id in game_ids],
+            )
+
+        if self.use_copy:
+            self._copy_output(cursor, output, df)
+            return
+        source = f"VALUES ({self._placeholders(len(columns))})"
+        cursor.executemany(self._upsert_sql(output, columns, source), _rows(df))
+
+    def _copy_output(self, cursor, output: str, df: pd.DataFrame) -> None:
+        """
+        method to send a batch through postgres' COPY into a temporary table
+        and upsert it from there in one statement
+        """
+        table = _quote(self.tables[output])
+        staging = _quote(f"{self.tables[output]}_staging")
+        columns = list(df.columns)
+        column_sql = ", ".join(map(_quote, columns))
+        cursor.execute(
+            f"CREATE TEMPORARY TABLE IF NOT EXISTS {staging} "
+            f"(LIKE {table} INCLUDING DEFAULTS) ON COMMIT DELETE ROWS"
+        )
+        buffer = io.StringIO()
+        df.to_csv(buffer, index=False, header=False, date_format="%Y-%m-%d %H:%M:%S")
+        buffer.seek(0)
+        cursor.copy_expert(
+            f"COPY {staging} ({column_sql}) FROM STDIN WITH (FORMAT csv)", buffer
+        )
+        cursor.execute(
+            self._upsert_sql(output, columns, f"SELECT {column_sql} FROM {staging}")
+        )
+
+    def _batch_frame(self, output: str) -> pd.DataFrame:
+        """
+        method to combine the buffered frames of an output into the rows of
+        one batch. A game added more than once only keeps its latest rows,
+        postgres rejects an upsert that touches the same row twice and
+        possessions would otherwise be inserted twice
+        """
+        frames = self._pending[output]
+        keys = OUTPUT_KEYS[output]
+        if keys is not None:
+            return pd.concat(frames, ignore_index=True).drop_duplicates(
+                keys, keep="last"
+            )
+        latest = {}
+        for position, df in enumerate(frames):
+            for game_id in df["game_id"].unique():
+                latest[game_id] = position
+
+        return pd.concat(
+            [
+                df[df["game_id"].map(latest) == position]
+                for position, df in enumerate(frames)
+            ],
+            ignore_index=True,
+        )
+
+    def flush(self) -> int:
+        """
+        method to write every buffered game in one transaction. If anything
+        fails the transaction is rolled back and the games stay buffered
+
+        Outputs:
+        games   - number of games written
+        """
+        if self._pending_games == 0:
+            return 0
+        cursor = self.connection.cursor()
+        written = [output for output, frames in self._pending.items() if frames]
+        try:
+            for output in written:
+                self._write_output(cursor, output, self._batch_frame(output))
+            self.connection.commit()
+        except Exception:
+            self.connection.rollback()
+            raise
+        finally:
+            cursor.close()
+
+        # tables created in a rolled back transaction may not exist so they are
+        # only skipped once a batch has been committed
+        self._created.update(written)
+        games = self._pending_games
+        self._pending = {output: [] for output in OUTPUT_KEYS}
+        self._pending_games = 0
+
+        return games
+
+    def add_game(
+        self,
+        pbg_df: Optional[pd.DataFrame] = None,
+        tbg_df: Optional[pd.DataFrame] = None,
+        rapm_df: Optional[pd.DataFrame] = None,
+    ) -> None:
+        """
+        method to buffer the outputs of one game, the buffer is flushed once
+        it holds batch_size games. Games without any rows aren't counted
+        """
+        added = False
+        for output, df in zip(OUTPUT_KEYS, [pbg_df, tbg_df, rapm_df]):
+            if df is not None and not df.empty:
+                self._pending[output].append(df)
+                added = True
+        if not added:
+            return
+        self._pending_games += 1
+        if self._pending_games >= self.batch_size:
+            self.flush()
+
+    def write_games(self, games: Iterable[Union[PbP, pd.DataFrame]]) -> int:
+        """
+        method to calculate and write all three outputs of many games
+
+        Inputs:
+        games   - PbP objects or play by play dataframes
+
+        Outputs:
+        games   - number of games written
+        """
+        count = 0
+        for game in games:
+            pbp = game if isinstance(game, PbP) else PbP(game)
+            self.add_game(
+                pbp.playerbygamestats(),
+                pbp.teambygamestats(),
+                pbp.rapm_possessions(),
+            )
+            count += 1
+        self.flush()
+
+        return count
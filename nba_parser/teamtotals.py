@@ -1,7 +1,19 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Iterable, Optional, Union
+
 import pandas as pd
 import numpy as np
+from scipy import sparse
 from sklearn.linear_model import RidgeCV
 
+from .arrowtable import check_output, convert_output
+from .partials import TotalsPartial
+from .registry import Registry
+
+if TYPE_CHECKING:
+    import pyarrow as pa
+
 
 class TeamTotals:
     """
@@ -11,53 +23,308 @@ class TeamTotals:
     seperate class because they work best with larger sample sizes
     """
 
-    def __init__(self, tbg_list: list[pd.DataFrame]):
+    stats = [
+        "fgm",
+        "tpm",
+        "fga",
+        "points_for",
+        "points_against",
+        "plus_minus",
+        "tpa",
+        "fta",
+        "tov",
+        "dreb",
+        "oreb",
+        "ftm",
+        "ast",
+        "blk",
+        "dreb_opponent",
+        "oreb_opponent",
+        "fgm_opponent",
+        "fga_opponent",
+        "tpm_opponent",
+        "tpa_opponent",
+        "fta_opponent",
+        "ftm_opponent",
+        "tov_opponent",
+        "possessions",
+        "possessions_opponent",
+    ]
+
+    def __init__(
+        self, tbg_list: Iterable[pd.DataFrame], registry: Optional[Registry] = None
+    ):
+        tbg_list = [tbg for tbg in tbg_list if not tbg.empty]
+        if not tbg_list:
+            raise ValueError(
+                "TeamTotals needs at least one non empty teambygamestats() dataframe"
+            )
         self.tbg = pd.concat(tbg_list)
+        # team abbreviations are looked up from the registry at the end so the
+        # aggregations only have to key on team_id
+        self._registry = registry
+        self.partial = TotalsPartial.from_frame(
+            TeamTotals._opponent_frame(self.tbg), "team_id", TeamTotals.stats
+        )
 
-    def team_advanced_stats(self) -> pd.DataFrame:
-
-        teams_df = self.tbg.merge(self.tbg, on="game_id", suffixes=["", "_opponent"])
-        teams_df = teams_df[teams_df.team_id != teams_df.team_id_opponent]
-        team_advanced_stats = (
-            teams_df.groupby(["team_id", "team_abbrev"])[
-                [
-                    "fgm",
-                    "tpm",
-                    "fga",
-                    "points_for",
-                    "points_against",
-                    "plus_minus",
-                    "tpa",
-                    "fta",
-                    "tov",
-                    "dreb",
-                    "oreb",
-                    "ftm",
-                    "ast",
-                    "blk",
-                    "dreb_opponent",
-                    "oreb_opponent",
-                    "fgm_opponent",
-                    "fga_opponent",
-                    "tpm_opponent",
-                    "tpa_opponent",
-                    "fta_opponent",
-                    "ftm_opponent",
-                    "tov_opponent",
-                    "possessions",
-                    "possessions_opponent",
-                ]
-            ]
-            .sum()
-            .reset_index()
+    @property
+    def registry(self) -> Registry:
+        if self._registry is not None:
+            return self._registry
+        return self.partial.registry
+
+    @classmethod
+    def from_partial(
+        cls, partial: TotalsPartial, registry: Optional[Registry] = None
+    ) -> "TeamTotals":
+        """
+        method to create a TeamTotals object from a partial aggregate, for
+        example one merged from partials built in worker processes. Only
+        team_advanced_stats() is available as the per game rows needed for the
+        RAPM regression aren't kept in a partial
+        """
+        team_totals = cls.__new__(cls)
+        team_totals.tbg = None
+        team_totals._registry = registry
+        team_totals.partial = partial
+
+        return team_totals
+
+    @staticmethod
+    def build_partial(
+        tbg_list: Iterable[pd.DataFrame], batch_size: int = 100
+    ) -> TotalsPartial:
+        """
+        function to fold teambygamestats() dataframes into a TotalsPartial in
+        batches. This is what each worker should run and send back when
+        processing is spread across processes
+        """
+        partial = TotalsPartial("team_id")
+        batch = []
+        # games without rows would only add missing seasons to the partial
+        for tbg in (tbg for tbg in tbg_list if not tbg.empty):
+            batch.append(tbg)
+            if len(batch) >= batch_size:
+                partial = partial.merge(
+                    TotalsPartial.from_frame(
+                        TeamTotals._opponent_frame(pd.concat(batch)),
+                        "team_id",
+                        TeamTotals.stats,
+                    )
+                )
+                batch = []
+        if batch:
+            partial = partial.merge(
+                TotalsPartial.from_frame(
+                    TeamTotals._opponent_frame(pd.concat(batch)),
+                    "team_id",
+                    TeamTotals.stats,
+                )
+            )
+
+        return partial
+
+    @staticmethod
+    def _opponent_frame(tbg: pd.DataFrame) -> pd.DataFrame:
+        """
+        function to line up every team game row with its opponent's stats. The
+        two rows of each game are paired through a sorted index instead of a
+        self merge on game_id, so no extra rows are created and thrown away
+        """
+        tbg = tbg.reset_index(drop=True)
+        game_ids = tbg["game_id"].to_numpy()
+        order = np.argsort(game_ids, kind="stable")
+        sorted_ids = game_ids[order]
+        if (
+            len(order) % 2
+            or (sorted_ids[0::2] != sorted_ids[1::2]).any()
+            or (sorted_ids[1::2][:-1] == sorted_ids[2::2]).any()
+        ):
+            raise ValueError("every game needs exactly two team rows")
+
+        opponent = np.empty(len(order), dtype=np.int64)
+        opponent[order[0::2]] = order[1::2]
+        opponent[order[1::2]] = order[0::2]
+
+        opponent_df = (
+            tbg.drop(columns="game_id")
+            .iloc[opponent]
+            .add_suffix("_opponent")
+            .reset_index(drop=True)
+        )
+
+        return pd.concat([tbg, opponent_df], axis=1)
+
+    def team_rolling_stats(self, windows: tuple[int, ...] = (5, 10)) -> pd.DataFrame:
+        """
+        method to calculate every team's trailing window and season to date
+        ratings, four factors and pace as of each of its games. The team games
+        are lined up with their opponents once, sorted by date and cumulatively
+        summed per team, and every window is the difference of two cumulative
+        sums. Each row only uses games played strictly before that game
+
+        Inputs:
+        windows    - trailing game window sizes, these run across seasons
+
+        Outputs:
+        rolling_df - one row per team game and window with the window name in
+                     the window column (last_5, last_10, ..., season), games
+                     played, summed stats and the rates of team_advanced_stats()
+                     plus pace
+        """
+        if self.tbg is None:
+            raise ValueError(
+                "team_rolling_stats needs the per game rows, it can't be run on "
+                "TeamTotals created from a partial"
+            )
+
+        teams_df = self._opponent_frame(self.tbg)
+        teams_df = teams_df.sort_values(
+            ["team_id", "game_date", "game_id"], kind="stable"
+        ).reset_index(drop=True)
+        keys = teams_df[["team_id", "game_id", "game_date", "season", "opponent"]]
+        columns = TeamTotals.stats + ["toc"]
+
+        counts = teams_df[columns].to_numpy(dtype=float)
+        # cumulative sums of every game before the current one
+        cumulative = (
+            pd.DataFrame(counts).groupby(teams_df["team_id"].to_numpy()).cumsum()
+        )
+        before = cumulative.to_numpy() - counts
+        row = np.arange(len(teams_df))
+        position = teams_df.groupby("team_id").cumcount().to_numpy()
+        season_position = teams_df.groupby(["team_id", "season"]).cumcount().to_numpy()
+
+        window_dfs = []
+        for window in windows:
+            has_full_window = position >= window
+            start = np.where(has_full_window, row - window, row - position)
+            sums = before - np.where(has_full_window[:, None], before[start], 0)
+            window_df = pd.DataFrame(sums, columns=columns)
+            window_df.insert(0, "gp", np.minimum(position, window))
+            window_df.insert(0, "window", f"last_{window}")
+            window_dfs.append(pd.concat([keys, window_df], axis=1))
+
+        season_start = row - season_position
+        season_df = pd.DataFrame(before - before[season_start], columns=columns)
+        season_df.insert(0, "gp", season_position)
+        season_df.insert(0, "window", "season")
+        window_dfs.append(pd.concat([keys, season_df], axis=1))
+
+        rolling_df = pd.concat(window_dfs, ignore_index=True)
+        rolling_df.insert(
+            1, "team_abbrev", self.registry.team_abbrevs(rolling_df["team_id"])
+        )
+        rolling_df = self._add_rate_stats(rolling_df)
+        rolling_df = self._add_pace(rolling_df)
+        # teams without any earlier games in the window have no rates yet
+        rolling_df = rolling_df.replace([np.inf, -np.inf], np.nan)
+
+        return rolling_df
+
+    def team_ratings_as_of(self, dates) -> pd.DataFrame:
+        """
+        method to get every team's season to date ratings as of a list of dates,
+        using only games played strictly before each date. Dates a team hasn't
+        played before yet are left out for that team
+
+        Inputs:
+        dates       - list like of dates
+
+        Outputs:
+        as_of_df    - one row per date and team with the summed stats, ratings,
+                      four factors and pace of the team's latest season so far
+        """
+        if self.tbg is None:
+            raise ValueError(
+                "team_ratings_as_of needs the per game rows, it can't be run on "
+                "TeamTotals created from a partial"
+            )
+
+        teams_df = self._opponent_frame(self.tbg)
+        teams_df["game_date"] = pd.to_datetime(teams_df["game_date"])
+        teams_df = teams_df.sort_values(
+            ["game_date", "team_id", "game_id"], kind="stable"
+        ).reset_index(drop=True)
+        columns = TeamTotals.stats + ["toc"]
+
+        # cumulative sums including the game so the latest game before a date
+        # carries the totals up to that date
+        cumulative = teams_df.groupby(["team_id", "season"])[columns].cumsum()
+        cumulative["gp"] = teams_df.groupby(["team_id", "season"]).cumcount() + 1
+        cumulative[["team_id", "season", "game_date"]] = teams_df[
+            ["team_id", "season", "game_date"]
+        ]
+
+        dates_df = pd.DataFrame(
+            {"as_of_date": pd.to_datetime(pd.Series(dates)).sort_values().values}
+        )
+        dates_df = dates_df.merge(
+            pd.DataFrame({"team_id": np.sort(teams_df["team_id"].unique())}),
+            how="cross",
+        )
+        as_of_df = pd.merge_asof(
+            dates_df,
+            cumulative,
+            left_on="as_of_date",
+            right_on="game_date",
+            by="team_id",
+            allow_exact_matches=False,
         )
-        gp_df = (
-            self.tbg.groupby(["team_id"])["game_id"]
-            .count()
-            .reset_index()
-            .rename(columns={"game_id": "gp"})
+        as_of_df = as_of_df.dropna(subset=["game_date"])
+        as_of_df = as_of_df.drop(columns="game_date").rename(
+            columns={"as_of_date": "game_date"}
         )
-        team_advanced_stats = team_advanced_stats.merge(gp_df, on="team_id")
+        as_of_df = as_of_df.astype({"season": int, "gp": int})
+        as_of_df.insert(
+            2, "team_abbrev", self.registry.team_abbrevs(as_of_df["team_id"])
+        )
+        as_of_df = self._add_rate_stats(as_of_df)
+        as_of_df = self._add_pace(as_of_df)
+
+        return as_of_df.reset_index(drop=True)
+
+    @staticmethod
+    def _add_pace(team_df: pd.DataFrame) -> pd.DataFrame:
+        """
+        function to add pace, possessions per 48 minutes, from summed team and
+        opponent possessions and seconds played
+        """
+        team_df["pace"] = (
+            48
+            * 60
+            * (team_df["possessions"] + team_df["possessions_opponent"])
+            / (2 * team_df["toc"])
+        )
+
+        return team_df
+
+    def team_advanced_stats(
+        self, output: str = "pandas"
+    ) -> Union[pd.DataFrame, "pa.Table"]:
+        """
+        method to calculate the team totals and rate stats of every team. Pass
+        output="arrow" to get a pyarrow Table
+        """
+        check_output(output)
+        team_advanced_stats = self.partial.sums.reset_index()
+        team_advanced_stats.insert(
+            1,
+            "team_abbrev",
+            self.registry.team_abbrevs(team_advanced_stats["team_id"]),
+        )
+        team_advanced_stats = self._add_rate_stats(team_advanced_stats)
+        team_advanced_stats["min_season"] = self.partial.min_season
+        team_advanced_stats["max_season"] = self.partial.max_season
+
+        return convert_output(team_advanced_stats, output)
+
+    @staticmethod
+    def _add_rate_stats(team_advanced_stats: pd.DataFrame) -> pd.DataFrame:
+        """
+        function to derive the four factors and ratings from summed team and
+        opponent counting stats
+        """
         team_advanced_stats["efg_percentage"] = (
             team_advanced_stats["fgm"] + (0.5 * team_advanced_stats["tpm"])
         ) / team_advanced_stats["fga"]
@@ -97,46 +364,48 @@ class TeamTotals:
             / team_advanced_stats["possessions"]
             * 100
         )
-        team_advanced_stats["min_season"] = self.tbg["season"].min()
-        team_advanced_stats["max_season"] = self.tbg["season"].max()
 
         return team_advanced_stats
 
-    @staticmethod
-    def rapm_matrix_map(row_in: np.ndarray, teams: list[int]) -> np.ndarray:
-        """
-        function that rearranges the team rapm matrix to make it ready to pass
-        to the Ridge Regression
-        """
-
-        team1 = row_in[0]
-        team2 = row_in[1]
-
-        rowout = np.zeros([(len(teams) * 2) + 1])
-
-        rowout[teams.index(team1)] = 1
-        rowout[teams.index(team2) + len(teams)] = -1
-        rowout[-1] = row_in[-1]
-
-        return rowout
-
-    def _rapm_matrix_creation(self) -> tuple[np.ndarray, np.ndarray]:
+    def _rapm_matrix_creation(
+        self,
+    ) -> tuple[sparse.csr_matrix, np.ndarray, np.ndarray]:
         """
         function to create train_x and train_y matrices for input into a Ridge
-        regression
+        regression. The team and opponent ids are factorized together so the
+        whole sparse design matrix is built in one vectorized step. Returns the
+        sorted team ids that index the matrix columns as well
         """
-        self.tbg["points_per_100_poss"] = (
-            self.tbg["points_for"] / self.tbg["possessions"]
-        ) * 100
-
-        teams = list(self.tbg["team_id"].unique())
-        teams.sort()
+        team_ids = self.tbg["team_id"].to_numpy(dtype=np.int64)
+        opponent_ids = self.tbg["opponent"].to_numpy(dtype=np.int64)
+        teams, codes = np.unique(
+            np.concatenate([team_ids, opponent_ids]), return_inverse=True
+        )
+        rows = np.repeat(np.arange(len(team_ids)), 3)
+        cols = np.column_stack(
+            [
+                codes[: len(team_ids)],
+                codes[len(team_ids) :] + len(teams),
+                np.full(len(team_ids), 2 * len(teams)),
+            ]
+        ).ravel()
+        data = np.column_stack(
+            [
+                np.ones(len(team_ids)),
+                -np.ones(len(team_ids)),
+                self.tbg["is_home"].to_numpy(dtype=float),
+            ]
+        ).ravel()
 
-        train_x = self.tbg[["team_id", "opponent", "is_home"]].to_numpy()
-        train_x = np.apply_along_axis(TeamTotals.rapm_matrix_map, 1, train_x, teams)
-        train_y = self.tbg[["points_per_100_poss"]].to_numpy()
+        train_x = sparse.csr_matrix(
+            (data, (rows, cols)), shape=(len(team_ids), (2 * len(teams)) + 1)
+        )
+        train_x.eliminate_zeros()
+        train_y = (
+            self.tbg["points_for"].to_numpy() / self.tbg["possessions"].to_numpy()
+        ) * 100
 
-        return train_x, train_y
+        return train_x, train_y, teams
 
     def team_rapm_results(self) -> pd.DataFrame:
         """
@@ -147,10 +416,14 @@ class TeamTotals:
         def lambda_to_alpha(lambda_value, samples):
             return (lambda_value * samples) / 2.0
 
-        train_x, train_y = self._rapm_matrix_creation()
+        if self.tbg is None:
+            raise ValueError(
+                "team_rapm_results needs the per game rows, it can't be run on "
+                "TeamTotals created from a partial"
+            )
+
+        train_x, train_y, teams = self._rapm_matrix_creation()
         possessions = self.tbg["possessions"]
-        teams = list(self.tbg["team_id"].unique())
-        teams.sort()
         lambdas_rapm = [0.01, 0.05, 0.1]
         alphas = [lambda_to_alpha(l, train_x.shape[0]) for l in lambdas_rapm]
         clf = RidgeCV(alphas=alphas, cv=5, fit_intercept=True)
@@ -181,13 +454,11 @@ class TeamTotals:
         teams_coef[f"{name}_def_rank"] = teams_coef[f"{name}_def"].rank(ascending=False)
 
         # add the intercept for reference
-        teams_coef[f"{name}_intercept"] = intercept[0]
-
-        results_df = teams_coef.merge(
-            self.tbg[["team_id", "team_abbrev"]].drop_duplicates(), on="team_id"
-        )
+        teams_coef[f"{name}_intercept"] = np.ravel(intercept)[0]
 
+        results_df = teams_coef
         results_df["team_id"] = results_df["team_id"].astype(int)
+        results_df["team_abbrev"] = self.registry.team_abbrevs(results_df["team_id"])
         results_df["min_season"] = self.tbg["season"].min()
         results_df["max_season"] = self.tbg["season"].max()
         results_df = np.round(results_df, decimals=2)
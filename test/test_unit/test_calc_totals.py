@@ -1,6 +1,7 @@
 import pytest
 from pathlib import Path
 import pandas as pd
+import numpy as np
 import nba_parser as npar
 
 
@@ -116,7 +117,14 @@ def test_team_rapm(setup):
     _, tbg_list, _ = setup
 
     team_totals = npar.TeamTotals(tbg_list)
+    columns = list(team_totals.tbg.columns)
     team_rapm = team_totals.team_rapm_results()
+    train_x, _, teams = team_totals._rapm_matrix_creation()
+
+    assert list(team_totals.tbg.columns) == columns
+    assert train_x.shape == (len(team_totals.tbg), (2 * len(teams)) + 1)
+    assert (train_x.sum(axis=1).A.ravel() == team_totals.tbg["is_home"]).all()
+    assert len(team_rapm) == len(teams)
 
 
 def test_player_rapm(setup):
@@ -127,3 +135,544 @@ def test_player_rapm(setup):
 
     rapm_possession = pd.concat([x.rapm_possessions() for x in pbp_list])
     player_rapm = npar.PlayerTotals.player_rapm_results(rapm_possession)
+
+
+def test_player_rapm_multi(setup):
+    """
+    test to make sure multi target rapm solves every target against the same
+    design matrix and returns one wide dataframe
+    """
+    _, _, pbp_list = setup
+
+    rapm_possession = pd.concat([x.rapm_possessions() for x in pbp_list])
+    rapm_possession["is_three"] = (rapm_possession["points_made"] == 3).astype(int)
+    player_rapm = npar.PlayerTotals.player_rapm_multi_results(
+        rapm_possession, ["points_made", "is_three"]
+    )
+
+    assert player_rapm["player_id"].is_unique
+    assert "rapm_points_made" in player_rapm.columns
+    assert "rapm_is_three_def" in player_rapm.columns
+    assert (
+        player_rapm.loc[player_rapm["player_id"] == 2544, "player_name"].values[0]
+        == "LeBron James"
+    )
+
+    # the points target picks its alpha the same way as the single target fit,
+    # which solves the sparse regression iteratively so it can be off in the
+    # last rounded digit
+    single_rapm = npar.PlayerTotals.player_rapm_results(rapm_possession)
+    merged = player_rapm.merge(single_rapm, on="player_id")
+    assert (merged["rapm_points_made"] - merged["rapm"]).abs().max() < 0.011
+
+
+def test_player_rapm_windows(setup):
+    """
+    test to make sure window rapm built from summed gram blocks matches a
+    ridge regression fit directly on the possessions in the window
+    """
+    from sklearn.linear_model import Ridge
+
+    _, _, pbp_list = setup
+
+    rapm_possession = pd.concat([x.rapm_possessions() for x in pbp_list])
+    windows = [(2020, 2020), ("2019-10-22", "2019-10-24")]
+    player_rapm = npar.PlayerTotals.player_rapm_windows(
+        rapm_possession, windows, n_jobs=2
+    )
+
+    train_x, players = npar.PlayerTotals._rapm_design_matrix(rapm_possession)
+    train_y = rapm_possession["points_made"].to_numpy() * 100
+    model = Ridge(alpha=(0.05 * len(train_y)) / 2.0).fit(train_x.toarray(), train_y)
+    season_rapm = player_rapm[player_rapm["window_type"] == "season"]
+    season_rapm = season_rapm.set_index("player_id")
+    date_rapm = player_rapm[player_rapm["window_type"] == "date"]
+    off_coef = model.coef_[: len(players)].round(2)
+    coef_diff = season_rapm.loc[players, "rapm_off"].values - off_coef
+
+    assert player_rapm["window_start"].dtype == "datetime64[ns]"
+    assert set(date_rapm["window_start"]) == {pd.Timestamp("2019-10-22")}
+    assert season_rapm["window_start"].iloc[0] == pd.Timestamp(
+        rapm_possession["game_date"].min()
+    )
+    assert abs(coef_diff).max() < 0.011
+    assert len(date_rapm) < len(season_rapm)
+    with pytest.raises(ValueError, match="2030"):
+        npar.PlayerTotals.player_rapm_windows(rapm_possession, [(2030, 2030)])
+
+
+def test_rapm_model_predict_lineups(setup):
+    """
+    test to make sure the model attached to the rapm results scores lineups the
+    same as the design matrix times the fitted coefficients
+    """
+    import numpy as np
+
+    _, _, pbp_list = setup
+
+    rapm_possession = pd.concat([x.rapm_possessions() for x in pbp_list])
+    player_rapm = npar.PlayerTotals.player_rapm_results(rapm_possession)
+    model = player_rapm.attrs["rapm_model"]
+
+    off_ids = rapm_possession[[f"off_player_{i}_id" for i in range(1, 6)]].to_numpy()
+    def_ids = rapm_possession[[f"def_player_{i}_id" for i in range(1, 6)]].to_numpy()
+    is_home = np.where(
+        rapm_possession["home_team_abbrev"] == rapm_possession["event_team_abbrev"],
+        1,
+        0,
+    )
+    predictions = model.predict_lineups(off_ids, def_ids, is_home, chunk_size=500)
+
+    train_x, players = npar.PlayerTotals._rapm_design_matrix(rapm_possession)
+    coef = np.concatenate(
+        [
+            model._off_coef[:-1],
+            model._def_coef[:-1],
+            [model.home_coef],
+        ]
+    )
+    expected = train_x @ coef + model.intercept
+
+    assert isinstance(model, npar.RapmModel)
+    assert np.allclose(predictions, expected)
+    # players the model has never seen count as zero
+    unknown = model.predict_lineups([[1, 2, 3, 4, 5]], [[6, 7, 8, 9, 10]])
+    assert np.allclose(unknown, model.intercept)
+
+    with pytest.raises(ValueError, match="off_ids"):
+        model.predict_lineups([[1, 2, 3, 4]], [[6, 7, 8, 9]])
+    with pytest.raises(ValueError, match="def_ids"):
+        model.predict_lineups([[1, 2, 3, 4, 5]], [6, 7, 8, 9, 10])
+    with pytest.raises(ValueError):
+        model.predict_lineups(off_ids[:2], def_ids[:3])
+
+
+def test_player_totals_streaming(setup):
+    """
+    test to make sure player totals built from a generator and added to in
+    batches match the totals built from the whole list at once
+    """
+    pbg_list, _, _ = setup
+
+    full = npar.PlayerTotals(pbg_list).player_advanced_stats()
+    streamed = npar.PlayerTotals((pbg for pbg in pbg_list[:4]), batch_size=3)
+    streamed.add_games(iter(pbg_list[4:]))
+    streamed = streamed.player_advanced_stats()
+
+    pd.testing.assert_frame_equal(full, streamed)
+    assert streamed.loc[streamed["player_id"] == 2544, "gp"].values[0] == 10
+
+    with_empty = npar.PlayerTotals([pbg_list[0].iloc[:0]] + pbg_list)
+    pd.testing.assert_frame_equal(full, with_empty.player_advanced_stats())
+    with pytest.raises(ValueError):
+        npar.PlayerTotals([])
+    with pytest.raises(ValueError):
+        npar.PlayerTotals([pbg_list[0].iloc[:0]])
+    with pytest.raises(ValueError):
+        npar.TeamTotals([])
+
+
+def test_merged_partials(setup):
+    """
+    test to make sure totals built from merged partials, in any grouping and
+    after a pickle round trip like a worker process would do, match the totals
+    built from every game at once
+    """
+    import pickle
+
+    pbg_list, tbg_list, _ = setup
+
+    player_partials = [
+        pickle.loads(pickle.dumps(npar.PlayerTotals.build_partial(pbg_list[i : i + 3])))
+        for i in range(0, len(pbg_list), 3)
+    ]
+    left = player_partials[0].merge(player_partials[1]).merge(player_partials[2])
+    right = player_partials[0].merge(player_partials[1].merge(player_partials[2]))
+    merged = left.merge(player_partials[3])
+
+    pd.testing.assert_frame_equal(left.sums, right.sums)
+    empty = npar.TotalsPartial("player_id")
+    assert empty.merge(left) is not left
+    assert empty.merge(left).sums is not left.sums
+    assert left.merge(empty).teams is not left.teams
+    pd.testing.assert_frame_equal(
+        npar.PlayerTotals.from_partial(merged).player_advanced_stats(),
+        npar.PlayerTotals(pbg_list).player_advanced_stats(),
+    )
+
+    team_partial = npar.TeamTotals.build_partial(tbg_list[:5]).merge(
+        npar.TeamTotals.build_partial(tbg_list[5:])
+    )
+    pd.testing.assert_frame_equal(
+        npar.TeamTotals.from_partial(team_partial).team_advanced_stats(),
+        npar.TeamTotals(tbg_list).team_advanced_stats(),
+    )
+    with pytest.raises(ValueError):
+        npar.TeamTotals.from_partial(team_partial).team_rapm_results()
+
+
+def test_player_rolling_stats(setup):
+    """
+    test to make sure rolling player stats only use games before each game and
+    match player_advanced_stats run on the same trailing games
+    """
+    pbg_list, _, _ = setup
+
+    rolling = npar.PlayerTotals.player_rolling_stats(pbg_list, windows=(3,))
+    lebron = rolling[rolling["player_id"] == 2544].sort_values("game_date")
+    lebron_games = pd.concat(pbg_list)
+    lebron_games = lebron_games[lebron_games["player_id"] == 2544].sort_values(
+        "game_date"
+    )
+    expected = npar.PlayerTotals([lebron_games.iloc[4:7]]).player_advanced_stats()
+    last_3 = lebron[lebron["window"] == "last_3"].iloc[7]
+    season = lebron[lebron["window"] == "season"]
+
+    assert set(rolling["window"]) == {"last_3", "season"}
+    assert last_3["gp"] == 3
+    assert last_3["points"] == expected["points"].values[0]
+    assert last_3["ts_percent"] == expected["ts_percent"].values[0]
+    assert season["gp"].tolist() == list(range(10))
+    assert season["fgm"].iloc[0] == 0
+    assert season["fgm"].iloc[-1] == 88 - lebron_games["fgm"].iloc[-1]
+
+
+def test_team_rolling_stats(setup):
+    """
+    test to make sure rolling and as of date team ratings only use earlier
+    games and line up with team_advanced_stats over the same games
+    """
+    _, tbg_list, _ = setup
+
+    team_totals = npar.TeamTotals(tbg_list)
+    rolling = team_totals.team_rolling_stats(windows=(2,))
+    lakers = rolling[
+        (rolling["team_id"] == 1610612747) & (rolling["window"] == "season")
+    ].sort_values("game_date")
+
+    assert lakers["gp"].tolist() == list(range(10))
+    lakers_games = pd.concat(tbg_list)
+    lakers_games = lakers_games[lakers_games["team_id"] == 1610612747].sort_values(
+        "game_date"
+    )
+    assert lakers["fgm"].iloc[-1] == 426 - lakers_games["fgm"].iloc[-1]
+    assert (rolling.loc[rolling["window"] == "last_2", "gp"] <= 2).all()
+
+    as_of = team_totals.team_ratings_as_of(["2019-12-01"])
+    full = team_totals.team_advanced_stats().set_index("team_id")
+    as_of = as_of.set_index("team_id")
+
+    assert as_of.loc[1610612747, "gp"] == 10
+    assert as_of.loc[1610612747, "fgm"] == 426
+    assert round(as_of.loc[1610612747, "off_rating"], 6) == round(
+        full.loc[1610612747, "off_rating"], 6
+    )
+
+    with pytest.raises(ValueError):
+        npar.TeamTotals([tbg_list[0].iloc[:1]])
+
+
+def test_lineup_totals(setup):
+    """
+    test to make sure lineup totals add back up to the team totals and that
+    matchups are the same from both sides
+    """
+    _, tbg_list, pbp_list = setup
+
+    lineup_totals = npar.LineupTotals(pbp_list[:4], batch_size=3)
+    lineup_totals.add_games(pbp.df for pbp in pbp_list[4:])
+    lineup_df = lineup_totals.lineup_stats()
+    team_df = pd.concat(tbg_list).groupby("team_id").sum(numeric_only=True)
+    unit_df = lineup_df.groupby("team_id").sum(numeric_only=True)
+
+    assert (unit_df["seconds"] == team_df["toc"]).all()
+    assert (unit_df["points_for"] == team_df["points_for"]).all()
+    assert (unit_df["possessions"] == team_df["possessions"]).all()
+    assert not lineup_df["lineup_key"].duplicated().any()
+    assert lineup_df["lineup"].str.count(", ").eq(4).all()
+
+    keys = npar.lineuptotals.lineup_keys(
+        [[2544, 201580, 201980, 202340, 203076], [203076, 202340, 201980, 201580, 2544]]
+    )
+    assert keys[0] == keys[1]
+
+    matchup_df = lineup_totals.matchup_stats()
+    matchup_keys = ["lineup_key", "opponent_lineup_key", "team_id", "opponent"]
+    assert not matchup_df.duplicated(matchup_keys).any()
+    assert matchup_df["plus_minus"].sum() == 0
+    assert matchup_df["seconds"].sum() == lineup_df["seconds"].sum()
+
+
+def test_on_off_stats(setup):
+    """
+    test to make sure on and off court splits add back up to the team totals
+    and line up with the lineup table
+    """
+    _, tbg_list, pbp_list = setup
+
+    lineup_totals = npar.LineupTotals(pbp_list)
+    on_off = lineup_totals.on_off_stats()
+    team_df = pd.concat(tbg_list).groupby("team_id").sum(numeric_only=True)
+    split = on_off.groupby(["team_id", "player_id"])[["seconds", "fga", "tov"]].sum()
+    split = split.join(team_df[["toc", "fga", "tov"]], on="team_id", rsuffix="_team")
+
+    assert (split["seconds"] == split["toc"]).all()
+    assert (split["fga"] == split["fga_team"]).all()
+    assert (split["tov"] == split["tov_team"]).all()
+
+    lebron = on_off[on_off["player_id"] == 2544].set_index("court")
+    lineups = lineup_totals.lineup_stats()
+    with_lebron = lineups[(lineups.filter(like="player_") == 2544).any(axis=1)]
+    assert lebron.loc["on", "plus_minus"] == with_lebron["plus_minus"].sum()
+    assert lebron.loc["on", "fgm"] == with_lebron["fgm"].sum()
+    assert lebron.loc["on", "minutes"] + lebron.loc["off", "minutes"] == 29100 / 60
+
+    # off court rows of a game only exist for the games a player played in, so
+    # only the on court splits add up to the season ones
+    by_game = lineup_totals.on_off_stats(by_game=True)
+    stats = ["seconds", "fgm", "tov", "points_for", "plus_minus"]
+    on_games = by_game[by_game["court"] == "on"]
+    summed = on_games.groupby(["team_id", "player_id"])[stats].sum()
+    expected = on_off[on_off["court"] == "on"].set_index(["team_id", "player_id"])
+    pd.testing.assert_frame_equal(summed, expected[stats])
+    assert by_game["game_id"].nunique() == len(pbp_list)
+
+    game_id = pbp_list[0].df["game_id"].iloc[0]
+    single = npar.LineupTotals(pbp_list[:1]).on_off_stats()
+    one_game = by_game[by_game["game_id"] == game_id].drop(columns="game_id")
+    pd.testing.assert_frame_equal(one_game.reset_index(drop=True), single)
+
+
+def test_overlap_matrices(setup):
+    """
+    test to make sure teammate and opponent overlaps are symmetric and add up
+    to each player's own time on the court
+    """
+    _, _, pbp_list = setup
+
+    lineup_totals = npar.LineupTotals(pbp_list)
+    player_ids, teammates, opponents = lineup_totals.overlap_matrices()
+    own_seconds = teammates.diagonal()
+    lebron = np.searchsorted(player_ids, 2544)
+
+    assert abs(teammates - teammates.T).max() == 0
+    assert abs(opponents - opponents.T).max() == 0
+    assert own_seconds[lebron] == 21193
+    assert np.allclose(np.asarray(teammates.sum(axis=1)).ravel(), 5 * own_seconds)
+    assert np.allclose(np.asarray(opponents.sum(axis=1)).ravel(), 5 * own_seconds)
+
+    _, poss_teammates, _ = lineup_totals.overlap_matrices("possessions")
+    assert poss_teammates[lebron, lebron] == 768 + 769
+
+    overlap_df = lineup_totals.overlap_stats()
+    pair = overlap_df[
+        (overlap_df["player_id"] == 2544)
+        & (overlap_df["other_player_id"] == 203076)
+        & (overlap_df["relation"] == "teammate")
+    ]
+    davis = np.searchsorted(player_ids, 203076)
+    assert pair["seconds"].iloc[0] == teammates[lebron, davis]
+    assert not (overlap_df["player_id"] == overlap_df["other_player_id"]).any()
+
+    with pytest.raises(ValueError):
+        lineup_totals.overlap_matrices("minutes")
+
+
+def test_assist_network(setup, tmp_path):
+    """
+    test to make sure the assist network agrees with the player assist totals
+    and survives merging and a round trip through a file
+    """
+    pbg_list, _, pbp_list = setup
+
+    network = npar.AssistNetwork(pbp_list)
+    edges = network.edges()
+    assists = pd.concat(pbg_list).groupby("player_id")["ast"].sum()
+    passes = edges.groupby("passer_id")["assists"].sum()
+
+    assert (passes.reindex(assists.index, fill_value=0) == assists).all()
+    lebron_davis = edges[(edges["passer_id"] == 2544) & (edges["scorer_id"] == 203076)]
+    assert lebron_davis[["assists", "points", "threes"]].values.tolist() == [
+        [29, 60, 2]
+    ]
+    assert lebron_davis["scorer_name"].iloc[0] == "Anthony Davis"
+
+    merged = npar.AssistNetwork(pbp_list[:3]).merge(
+        npar.AssistNetwork(pbp.df for pbp in pbp_list[3:])
+    )
+    assert merged.edges().equals(edges)
+
+    network.save(tmp_path / "assists.npz")
+    assert npar.AssistNetwork.load(tmp_path / "assists.npz").edges().equals(edges)
+
+    player_ids, matrices = network.matrices()
+    assert matrices["points"].sum() == edges["points"].sum()
+    lebron = np.searchsorted(player_ids, 2544)
+    davis = np.searchsorted(player_ids, 203076)
+    assert matrices["assists"][lebron, davis] == 29
+
+
+def test_combination_stats(setup):
+    """
+    test to make sure two and three man combinations match the units they
+    were part of and single players match the on court splits
+    """
+    _, _, pbp_list = setup
+
+    lineup_totals = npar.LineupTotals(pbp_list)
+    lineups = lineup_totals.lineup_stats()
+    members = lineups.filter(regex=r"^player_\d_id$")
+
+    pairs = lineup_totals.combination_stats(2)
+    pair = pairs[(pairs["player_1_id"] == 2544) & (pairs["player_2_id"] == 203076)]
+    with_both = lineups[(members == 2544).any(axis=1) & (members == 203076).any(axis=1)]
+    assert pair["seconds"].iloc[0] == with_both["seconds"].sum()
+    assert pair["plus_minus"].iloc[0] == with_both["plus_minus"].sum()
+    assert pair["players"].iloc[0] == "LeBron James, Anthony Davis"
+    assert (pairs["player_1_id"] < pairs["player_2_id"]).all()
+
+    trios = lineup_totals.combination_stats(3)
+    assert trios["seconds"].sum() == 10 * lineups["seconds"].sum()
+    trio_ids = ["team_id", "player_1_id", "player_2_id", "player_3_id"]
+    assert not trios.duplicated(trio_ids).any()
+
+    singles = lineup_totals.combination_stats(1)
+    on_court = lineup_totals.on_off_stats()
+    on_court = on_court[on_court["court"] == "on"].reset_index(drop=True)
+    assert (singles["player_1_id"] == on_court["player_id"]).all()
+    assert (singles["plus_minus"] == on_court["plus_minus"]).all()
+
+    with pytest.raises(ValueError):
+        lineup_totals.combination_stats(4)
+
+
+def test_rollup_cache(setup):
+    """
+    test to make sure the rollup levels match the totals classes and that
+    corrections and removals only move the affected rows
+    """
+    pbg_list, tbg_list, _ = setup
+
+    rollup = npar.RollupCache().add_games(pbg_list[:4], tbg_list[:4])
+    rollup.add_games(pbg_list[4:], tbg_list[4:])
+
+    careers = rollup.player_stats("career").set_index("player_id")
+    expected = npar.PlayerTotals(pbg_list).player_advanced_stats()
+    expected = expected.set_index("player_id")
+    columns = npar.PlayerTotals.stats + ["gp", "ts_percent", "usg_percent"]
+    pd.testing.assert_frame_equal(
+        careers.loc[expected.index, columns], expected[columns], check_dtype=False
+    )
+
+    teams = rollup.team_stats("season", seasons=[2020]).set_index("team_id")
+    expected = npar.TeamTotals(tbg_list).team_advanced_stats().set_index("team_id")
+    assert teams.loc[1610612747, "gp"] == 10
+    lakers_rating = expected.loc[1610612747, "off_rating"]
+    assert teams.loc[1610612747, "off_rating"] == lakers_rating
+    assert len(rollup.player_stats("game", [2544])) == 10
+
+    corrected = pbg_list[0].copy()
+    corrected.loc[corrected["player_id"] == 2544, "fgm"] += 1
+    other_seasons = rollup.players.seasons.drop(index=(2544, 2020))
+    rollup.add_games([corrected])
+    lebron = rollup.player_stats("career", [2544])
+    assert lebron["fgm"].iloc[0] == 89
+    assert lebron["gp"].iloc[0] == 10
+    assert rollup.players.seasons.drop(index=(2544, 2020)).equals(other_seasons)
+
+    rollup.remove_games([pbg_list[0]["game_id"].iloc[0]])
+    lebron = rollup.player_stats("career", [2544])
+    assert lebron["gp"].iloc[0] == 9
+    first_game = pbg_list[0].set_index("player_id")
+    assert lebron["fgm"].iloc[0] == 88 - first_game.loc[2544, "fgm"]
+
+    with pytest.raises(ValueError):
+        rollup.player_stats("week")
+
+
+def test_totals_arrow_output(setup):
+    """
+    test to make sure the totals classes can return their stats as arrow
+    tables
+    """
+    pa = pytest.importorskip("pyarrow")
+    pc = pytest.importorskip("pyarrow.compute")
+    pbg_list, tbg_list, _ = setup
+
+    player_totals = npar.PlayerTotals(pbg_list)
+    team_totals = npar.TeamTotals(tbg_list)
+    for stats_df, table in [
+        (
+            player_totals.player_advanced_stats(),
+            player_totals.player_advanced_stats(output="arrow"),
+        ),
+        (
+            team_totals.team_advanced_stats(),
+            team_totals.team_advanced_stats(output="arrow"),
+        ),
+    ]:
+        assert isinstance(table, pa.Table)
+        assert table.num_rows == len(stats_df)
+        assert table.column_names == list(stats_df.columns)
+        np.testing.assert_array_equal(
+            table.column("fgm").to_numpy(), stats_df["fgm"].to_numpy()
+        )
+
+    table = player_totals.player_advanced_stats(output="arrow")
+    assert pa.types.is_dictionary(table.schema.field("player_name").type)
+    lebron = table.filter(pc.equal(table["player_id"], 2544))
+    assert lebron["fgm"].to_pylist() == [88]
+
+
+def test_season_store(setup, tmp_path):
+    """
+    test to make sure the season store returns the same rows as filtering
+    the per game outputs and that adding games again replaces them
+    """
+    pbg_list, tbg_list, _ = setup
+    # move half the games to another season so there are two partitions
+    pbg_list = [
+        df.assign(season=2021) if i % 2 else df for i, df in enumerate(pbg_list)
+    ]
+    pbg_df = pd.concat(pbg_list, ignore_index=True)
+    tbg_df = pd.concat(tbg_list, ignore_index=True)
+
+    store = npar.SeasonStore(tmp_path)
+    store.add_games(pbg_list, tbg_list)
+    store.add_games(pbg_list[:3])
+    assert store.seasons("players") == [2020, 2021]
+
+    lebron = store.player_games(2544)
+    expected = pbg_df[pbg_df["player_id"] == 2544].sort_values(["season", "game_date"])
+    assert len(lebron) == 10
+    assert lebron["points"].sum() == 240
+    assert list(lebron["game_id"]) == list(expected["game_id"])
+    assert lebron["player_name"].iloc[0] == "LeBron James"
+    assert list(lebron.columns) == list(pbg_df.columns)
+    assert len(store.player_games(2544, 2021)) == 5
+    assert len(store.player_games(2544, range(2018, 2020))) == 0
+    assert store.player_games(1).empty
+
+    lakers = store.team_games(1610612747, ("2019-10-23", "2019-11-05"))
+    expected = tbg_df[
+        (tbg_df["team_id"] == 1610612747)
+        & tbg_df["game_date"].between("2019-10-23", "2019-11-05")
+    ]
+    assert len(lakers) > 0
+    assert sorted(lakers["game_id"]) == sorted(expected["game_id"])
+    assert len(store.team_games(1610612747)) == len(
+        tbg_df[tbg_df["team_id"] == 1610612747]
+    )
+
+    # object columns keep their missing values and non string values
+    lebron_games = pbg_df[pbg_df["player_id"] == 2544].sort_values(
+        ["season", "game_date"]
+    )
+    notes = [None, 12, "starter", np.nan, True] * 2
+    mixed_store = npar.SeasonStore(tmp_path / "mixed")
+    mixed_store.add_games([lebron_games.assign(note=np.array(notes, dtype=object))])
+    stored_notes = mixed_store.player_games(2544)["note"]
+    assert stored_notes.dtype == object
+    assert stored_notes.isna().tolist() == [True, False, False, True, False] * 2
+    assert stored_notes.iloc[1] == 12 and isinstance(stored_notes.iloc[1], int)
+    assert stored_notes.iloc[4] is True
@@ -0,0 +1,432 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+import json
+import threading
+import time
+import pandas as pd
+import nba_parser as npar
+from nba_parser.responsecache import ResponseCache
+import pytest
+
+
+@pytest.fixture(scope="session")
+def setup():
+    """
+    function for test setup and teardown. Builds stats.nba.com style payloads
+    out of the raw api columns of a saved game so the api path of load_pbp can
+    run without a network
+    """
+    data_path = Path(__file__).parent / "test_data"
+    csv_df = npar.data.read_pbp_csv(data_path / "21900002.csv")
+    raw_df = pd.read_csv(data_path / "21900002.csv").loc[:, :"video_available_flag"]
+    pbp_payload = {
+        "resource": "playbyplay",
+        "resultSets": [
+            {
+                "name": "PlayByPlay",
+                "headers": [c.upper() for c in raw_df.columns],
+                "rowSet": raw_df.astype(object)
+                .where(raw_df.notna(), None)
+                .values.tolist(),
+            }
+        ],
+    }
+    summary_payload = {
+        "resource": "boxscore",
+        "resultSets": [
+            {
+                "name": "GameSummary",
+                "headers": ["GAME_DATE_EST", "GAME_ID", "GAME_STATUS_ID"],
+                "rowSet": [["2019-10-22T00:00:00", "0021900002", 3]],
+            }
+        ],
+    }
+
+    yield csv_df, {"playbyplayv2": pbp_payload, "boxscoresummaryv2": summary_payload}
+
+
+def test_response_cache(setup, tmp_path):
+    """
+    test to make sure load_pbp reads the api payloads through the cache, only
+    fetches final games once and can be replayed offline
+    """
+    csv_df, payloads = setup
+    calls = []
+
+    def fetcher(endpoint, params):
+        calls.append(endpoint)
+        return payloads[endpoint]
+
+    cache = ResponseCache(tmp_path, ttl=0, fetcher=fetcher)
+    pbp_df = npar.load_pbp(21900002, cache=cache)
+    npar.load_pbp(21900002, cache=cache)
+
+    assert calls == ["playbyplayv2", "boxscoresummaryv2"]
+    pd.testing.assert_frame_equal(
+        pbp_df,
+        csv_df[pbp_df.columns],
+    )
+    assert pbp_df["home_team_abbrev"].iloc[0] == "LAC"
+    assert pbp_df["game_date"].iloc[0] == pd.Timestamp("2019-10-22")
+
+    offline = ResponseCache(tmp_path, offline=True)
+    pd.testing.assert_frame_equal(npar.load_pbp(21900002, cache=offline), pbp_df)
+    with pytest.raises(FileNotFoundError):
+        npar.load_pbp(21900003, cache=offline)
+
+    # a game that is still going is fetched again once the ttl runs out
+    live_payload = {
+        "resultSets": [
+            {
+                "headers": payloads["playbyplayv2"]["resultSets"][0]["headers"],
+                "rowSet": payloads["playbyplayv2"]["resultSets"][0]["rowSet"][:200],
+            }
+        ]
+    }
+    live_calls = []
+
+    def live_fetcher(endpoint, params):
+        live_calls.append(endpoint)
+        return live_payload
+
+    live_cache = ResponseCache(tmp_path / "live", ttl=0, fetcher=live_fetcher)
+    params = {"GameID": "0021900002", "StartPeriod": 1, "EndPeriod": 14}
+    live_cache.fetch("playbyplayv2", params, npar.data._pbp_is_final)
+    live_cache.fetch("playbyplayv2", params, npar.data._pbp_is_final)
+
+    assert not live_cache.read("playbyplayv2", params)["final"]
+    assert len(live_calls) == 2
+    assert (
+        ResponseCache(tmp_path / "live", ttl=3600, fetcher=live_fetcher).fetch(
+            "playbyplayv2", params
+        )
+        == live_payload
+    )
+    assert len(live_calls) == 2
+    assert ResponseCache.key("playbyplayv2", params) == ResponseCache.key(
+        "PlayByPlayV2", dict(reversed(list(params.items())))
+    )
+
+    # threads writing the same entry at once each use their own temporary file
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(
+            executor.map(
+                lambda i: live_cache.write("playbyplayv2", params, live_payload),
+                range(32),
+            )
+        )
+    assert live_cache.read("playbyplayv2", params)["payload"] == live_payload
+    assert not [
+        file for file in (tmp_path / "live").rglob(".*") if file.name.endswith(".tmp")
+    ]
+
+
+def test_read_pbp_csv(setup):
+    """
+    test to make sure saved csvs are read with the schema dtypes and that
+    reading only the columns a stat needs gives the same stats
+    """
+    csv_path = Path(__file__).parent / "test_data" / "21900002.csv"
+    pbp_df = npar.load_pbp(21900002, csv_path=csv_path)
+
+    assert pbp_df["player1_team_id"].dtype == "Int64"
+    assert pbp_df["event_type_de"].dtype == "category"
+    assert pbp_df["game_date"].dtype == "datetime64[ns]"
+    assert pbp_df["home_team_abbrev"].dtype == pbp_df["event_team"].dtype
+    assert (
+        pbp_df.memory_usage(deep=True).sum()
+        < pd.read_csv(csv_path).memory_usage(deep=True).sum()
+    )
+
+    plain_stats = npar.PbP(pd.read_csv(csv_path)).playerbygamestats()
+    for engine in [None, "pyarrow"]:
+        stat_df = npar.load_pbp(
+            21900002, csv_path=csv_path, stats=["playerbygamestats"], engine=engine
+        )
+        assert list(stat_df.columns) == npar.data.pbp_usecols(["playerbygamestats"])
+        pd.testing.assert_frame_equal(
+            npar.PbP(stat_df).playerbygamestats(),
+            plain_stats,
+            check_dtype=False,
+            check_categorical=False,
+        )
+
+    with pytest.raises(ValueError):
+        npar.data.pbp_usecols(["boxscore"])
+
+
+def test_schedule(setup, tmp_path):
+    """
+    test to make sure a season schedule is built from one game log request,
+    survives a save and load, and that load_pbp only asks for the box score
+    summary of games that aren't in the schedule
+    """
+    csv_df, payloads = setup
+    game_log = {
+        "resultSets": [
+            {
+                "name": "LeagueGameLog",
+                "headers": [
+                    "SEASON_ID",
+                    "TEAM_ID",
+                    "TEAM_ABBREVIATION",
+                    "GAME_ID",
+                    "GAME_DATE",
+                    "MATCHUP",
+                ],
+                "rowSet": [
+                    [
+                        "22019",
+                        1610612740,
+                        "NOP",
+                        "0021900001",
+                        "2019-10-22",
+                        "NOP @ TOR",
+                    ],
+                    [
+                        "22019",
+                        1610612761,
+                        "TOR",
+                        "0021900001",
+                        "2019-10-22",
+                        "TOR vs. NOP",
+                    ],
+                    [
+                        "22019",
+                        1610612747,
+                        "LAL",
+                        "0021900002",
+                        "2019-10-22",
+                        "LAL @ LAC",
+                    ],
+                    [
+                        "22019",
+                        1610612746,
+                        "LAC",
+                        "0021900002",
+                        "2019-10-22",
+                        "LAC vs. LAL",
+                    ],
+                ],
+            }
+        ]
+    }
+    calls = []
+
+    def fetcher(endpoint, params):
+        calls.append((endpoint, params))
+        return game_log if endpoint == "leaguegamelog" else payloads[endpoint]
+
+    schedule = npar.Schedule(tmp_path / "schedule.csv", fetcher=fetcher)
+    assert schedule.lookup(21900002) is None
+    assert schedule.refresh(2020) == 2
+    assert calls[0][1]["Season"] == "2019-20"
+
+    schedule = npar.Schedule(tmp_path / "schedule.csv", fetcher=fetcher)
+    assert schedule.lookup("0021900002") == {
+        "game_id": 21900002,
+        "season": 2020,
+        "game_date": "2019-10-22",
+        "home_team_id": 1610612746,
+        "away_team_id": 1610612747,
+        "home_team_abbrev": "LAC",
+        "away_team_abbrev": "LAL",
+    }
+
+    calls.clear()
+    pbp_df = npar.load_pbp(
+        21900002,
+        schedule=schedule,
+        cache=ResponseCache(tmp_path / "scheduled", fetcher=fetcher),
+    )
+    assert [endpoint for endpoint, _ in calls] == ["playbyplayv2"]
+    pd.testing.assert_frame_equal(
+        pbp_df,
+        csv_df[pbp_df.columns],
+    )
+
+    calls.clear()
+    npar.load_pbp(
+        21900002,
+        schedule=npar.Schedule(fetcher=fetcher),
+        cache=ResponseCache(tmp_path / "unscheduled", fetcher=fetcher),
+    )
+    assert [endpoint for endpoint, _ in calls] == [
+        "playbyplayv2",
+        "boxscoresummaryv2",
+    ]
+
+
+def test_load_pbp_many(setup):
+    """
+    test to make sure load_pbp_many loads every game from a local stand in
+    for the stats api, retries a failed request and stays under the rate
+    limit
+    """
+    csv_df, payloads = setup
+    requests_seen = []
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            endpoint = url.path.rsplit("/", 1)[-1]
+            game_id = parse_qs(url.query)["GameID"][0]
+            with lock:
+                requests_seen.append((endpoint, game_id, time.monotonic()))
+                first_try = len(requests_seen) == 1
+            if first_try:
+                self.send_response(503)
+                self.end_headers()
+                return
+            body = json.dumps(payloads[endpoint]).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        game_ids = [21900002, 21900003, 21900004]
+        frames = list(
+            npar.load_pbp_many(
+                game_ids,
+                max_concurrency=3,
+                rate=20,
+                base_url=f"http://127.0.0.1:{server.server_port}/stats/{{endpoint}}",
+                backoff=0.01,
+                headers={"User-Agent": "nba_parser tests"},
+            )
+        )
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert len(frames) == 3
+    for pbp_df in frames:
+        pd.testing.assert_frame_equal(
+            pbp_df,
+            csv_df[pbp_df.columns],
+        )
+    # two requests per game plus the retried one
+    assert len(requests_seen) == 7
+    assert sorted({game_id for _, game_id, _ in requests_seen}) == [
+        "0021900002",
+        "0021900003",
+        "0021900004",
+    ]
+    started = sorted(seen for _, _, seen in requests_seen)
+    assert started[-1] - started[0] >= 6 / 20 * 0.9
+
+
+def test_load_pbp_many_failures(setup):
+    """
+    test to make sure a game that fails to load is collected and skipped
+    instead of dropping the rest of the games when failures are asked for
+    """
+    import requests
+
+    _, payloads = setup
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            endpoint = url.path.rsplit("/", 1)[-1]
+            if parse_qs(url.query)["GameID"][0] == "0021900003":
+                self.send_response(404)
+                self.end_headers()
+                return
+            body = json.dumps(payloads[endpoint]).encode()
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    options = {
+        "max_concurrency": 2,
+        "rate": 50,
+        "base_url": f"http://127.0.0.1:{server.server_port}/stats/{{endpoint}}",
+        "headers": {"User-Agent": "nba_parser tests"},
+    }
+    try:
+        failures = {}
+        frames = list(
+            npar.load_pbp_many(
+                [21900002, 21900003, 21900004], failures=failures, **options
+            )
+        )
+        with pytest.raises(requests.HTTPError):
+            list(npar.load_pbp_many([21900003, 21900002], **options))
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert len(frames) == 2
+    assert list(failures) == [21900003]
+    assert isinstance(failures[21900003], requests.HTTPError)
+
+
+def test_iter_games_csv(tmp_path):
+    """
+    test to make sure a multi game csv is split into the same games that
+    reading each game's csv gives, whether the games are contiguous or their
+    rows are mixed together
+    """
+    data_path = Path(__file__).parent / "test_data"
+    game_files = [data_path / f"{game_id}.csv" for game_id in [21900002, 21900025]]
+    season_df = pd.concat([pd.read_csv(file) for file in game_files])
+    season_df.to_csv(tmp_path / "season.csv", index=False)
+    mixed_df = season_df.assign(row=season_df.groupby("game_id").cumcount())
+    mixed_df.sort_values(["row", "game_id"]).drop(columns="row").to_csv(
+        tmp_path / "mixed.csv", index=False
+    )
+
+    for file_name, presorted in [("season.csv", True), ("mixed.csv", False)]:
+        games = list(
+            npar.iter_games_csv(
+                tmp_path / file_name, chunksize=500, presorted=presorted
+            )
+        )
+        assert [game_df["game_id"].iat[0] for game_df in games] == [
+            21900002,
+            21900025,
+        ]
+        for game_df, file in zip(games, game_files):
+            pd.testing.assert_frame_equal(
+                game_df, npar.data.read_pbp_csv(file), check_categorical=False
+            )
+
+    with pytest.raises(ValueError):
+        list(npar.iter_games_csv(tmp_path / "mixed.csv", chunksize=500))
+
+
+def test_decode_pbp_payload(setup):
+    """
+    test to make sure raw payload bytes decode to the same typed columns as
+    the saved csv and the home team is found from the jump ball
+    """
+    csv_df, payloads = setup
+    raw = json.dumps(payloads["playbyplayv2"]).encode()
+    pbp_df = npar.data.decode_pbp_payload(raw)
+
+    pd.testing.assert_frame_equal(pbp_df, csv_df[pbp_df.columns])
+    pd.testing.assert_frame_equal(
+        npar.data.decode_pbp_payload(payloads["playbyplayv2"]), pbp_df
+    )
+    assert pbp_df["player2_team_id"].dtype == "Int64"
+    assert npar.data._jump_ball_teams(pbp_df) == ("LAC", "LAL", 1610612746, 1610612747)
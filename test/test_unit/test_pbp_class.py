@@ -1,4 +1,6 @@
+import io
 from pathlib import Path
+from unittest.mock import patch
 import pandas as pd
 from nba_parser import PbP
 import pytest
@@ -514,3 +516,229 @@ def test_pbg_edge_case(setup):
     pbg = pbp.playerbygamestats()
 
     assert pbg.loc[pbg["player_id"] == 1882, "dreb"].values[0] == 4
+
+
+def test_registry(setup):
+    """
+    test to make sure the id -> name registry built from the events is correct
+    and can be shared with other games
+    """
+    pbp, pbp1 = setup
+
+    assert pbp.registry.player_names([1894, 947]).tolist() == [
+        "Corey Maggette",
+        "Allen Iverson",
+    ]
+    assert pbp.registry.team_abbrevs([1610612743]).tolist() == ["DEN"]
+
+    registry = pbp.registry.merge(pbp1.registry)
+    assert registry.players.index.is_unique
+    assert set(pbp1.registry.players.index).issubset(registry.players.index)
+    assert registry.player_names([1894]).tolist() == ["Corey Maggette"]
+
+
+def test_pbp_cache(tmp_path):
+    """
+    test to make sure cached game stats match PbP and are only recomputed
+    when the events or the stats version change
+    """
+    from nba_parser import PbPCache
+    from nba_parser.cache import stats_code_digest
+
+    pbp_df = pd.read_csv(Path(__file__).parent / "test_data" / "21900002.csv")
+    cache = PbPCache(tmp_path)
+    assert cache.version.endswith(stats_code_digest())
+    pbg_df, tbg_df, rapm_df = cache.game_stats(pbp_df.copy())
+    pbp = PbP(pbp_df.copy())
+
+    pd.testing.assert_frame_equal(pbg_df, pbp.playerbygamestats())
+    pd.testing.assert_frame_equal(tbg_df, pbp.teambygamestats())
+    assert len(list((tmp_path / "21900002").iterdir())) == 3
+
+    cached = cache.game_stats(pbp_df.copy())
+    pd.testing.assert_frame_equal(cached[0], pbg_df)
+    pd.testing.assert_frame_equal(cached[2], rapm_df)
+
+    corrected_df = pbp_df.copy()
+    lebron_events = corrected_df["player1_id"] == 2544
+    corrected_df.loc[lebron_events, "player1_name"] = "King James"
+    assert cache.content_hash(corrected_df) != cache.content_hash(pbp_df)
+    pbg_df = cache.game_stats(corrected_df)[0]
+    lebron = pbg_df[pbg_df["player_id"] == 2544]
+    assert lebron["player_name"].iloc[0] == "King James"
+    assert len(list((tmp_path / "21900002").iterdir())) == 3
+
+    cache = PbPCache(tmp_path, version="test", file_format="feather")
+    assert cache.get(21900002, cache.content_hash(pbp_df)) is None
+    cache.game_stats(pbp_df.copy())
+    files = sorted(file.name for file in (tmp_path / "21900002").iterdir())
+    assert all(file.endswith("-vtest.feather") for file in files)
+
+
+def test_arrow_output(setup):
+    """
+    test to make sure the arrow outputs hold the same stats as the
+    dataframes with the string columns dictionary encoded
+    """
+    pa = pytest.importorskip("pyarrow")
+    _, pbp = setup
+
+    for method in ["playerbygamestats", "teambygamestats", "rapm_possessions"]:
+        stats_df = getattr(pbp, method)()
+        table = getattr(pbp, method)(output="arrow")
+
+        assert isinstance(table, pa.Table)
+        assert table.column_names == list(stats_df.columns)
+        assert pa.types.is_int64(table.schema.field("game_id").type)
+        strings = {c: object for c in stats_df.columns if stats_df[c].dtype == object}
+        pd.testing.assert_frame_equal(
+            table.to_pandas().astype(strings), stats_df.reset_index(drop=True)
+        )
+
+    table = pbp.playerbygamestats(output="arrow")
+    assert pa.types.is_dictionary(table.schema.field("player_name").type)
+    assert pa.types.is_dictionary(table.schema.field("team_abbrev").type)
+    # the output is checked before any stats are calculated
+    with patch.object(PbP, "_point_calc_player", side_effect=AssertionError):
+        with pytest.raises(ValueError):
+            pbp.playerbygamestats(output="polars")
+
+
+def test_database_sink(setup):
+    """
+    test to make sure the sink writes every output, that loading the same
+    games again updates rows instead of duplicating them and that a failed
+    batch leaves nothing behind
+    """
+    import sqlite3
+    from nba_parser import DatabaseSink
+
+    pbp, pbp1 = setup
+    connection = sqlite3.connect(":memory:")
+    sink = DatabaseSink(connection, batch_size=1)
+
+    def count(table):
+        return connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+    assert sink.write_games([pbp, pbp1]) == 2
+    counts = [
+        count(table)
+        for table in ["playerbygamestats", "teambygamestats", "rapm_possessions"]
+    ]
+    assert counts == [
+        len(pbp.playerbygamestats()) + len(pbp1.playerbygamestats()),
+        4,
+        len(pbp.rapm_possessions()) + len(pbp1.rapm_possessions()),
+    ]
+
+    pbg_df = pbp1.playerbygamestats()
+    pbg_df["points"] = pbg_df["points"] + 100
+    sink.add_game(pbg_df, pbp1.teambygamestats(), pbp1.rapm_possessions())
+    assert sink.write_games([]) == 0
+    assert [
+        count(table)
+        for table in ["playerbygamestats", "teambygamestats", "rapm_possessions"]
+    ] == counts
+    stored = pd.read_sql(
+        "SELECT player_id, points FROM playerbygamestats WHERE game_id = ?",
+        connection,
+        params=(int(pbg_df["game_id"].iloc[0]),),
+    ).set_index("player_id")["points"]
+    expected = pbg_df.set_index("player_id")["points"]
+    assert (stored.sort_index() == expected.sort_index()).all()
+
+    # the second game has a column the table doesn't so the whole batch fails
+    sink = DatabaseSink(connection, batch_size=10, tables={"teambygamestats": "teams"})
+    sink.add_game(tbg_df=pbp.teambygamestats())
+    sink.add_game(tbg_df=pbp1.teambygamestats())
+    sink.flush()
+    sink.add_game(tbg_df=pbp.teambygamestats().assign(points_for=0))
+    sink.add_game(tbg_df=pbp1.teambygamestats().assign(not_a_column=1))
+    with pytest.raises(sqlite3.OperationalError):
+        sink.flush()
+    assert count("teams") == 4
+    assert connection.execute("SELECT MIN(points_for) FROM teams").fetchone()[0] > 0
+    connection.close()
+
+
+def test_database_sink_batches(setup):
+    """
+    test to make sure empty games aren't counted toward a batch and that a
+    game added twice in one batch is only written once, through executemany
+    with sqlite and through COPY and the staging table upsert with a fake
+    postgres cursor
+    """
+    import sqlite3
+    from nba_parser import DatabaseSink
+
+    pbp, pbp1 = setup
+    connection = sqlite3.connect(":memory:")
+    sink = DatabaseSink(connection, batch_size=2)
+    sink.add_game(pbp.playerbygamestats().iloc[:0])
+    sink.add_game()
+    assert sink.flush() == 0
+
+    rapm_df = pbp.rapm_possessions()
+    sink.add_game(pbp.playerbygamestats(), rapm_df=rapm_df)
+    sink.add_game(pbp.playerbygamestats(), rapm_df=rapm_df)
+    assert sink.flush() == 0
+    stored = connection.execute("SELECT COUNT(*) FROM rapm_possessions").fetchone()
+    assert stored[0] == len(rapm_df)
+    connection.close()
+
+    class FakeCursor:
+        def __init__(self, statements):
+            self.statements = statements
+
+        def execute(self, sql, params=None):
+            self.statements.append(("execute", sql, None))
+
+        def executemany(self, sql, rows):
+            self.statements.append(("executemany", sql, list(rows)))
+
+        def copy_expert(self, sql, buffer):
+            self.statements.append(("copy", sql, buffer.read()))
+
+        def close(self):
+            pass
+
+    class FakeConnection:
+        def __init__(self):
+            self.statements = []
+            self.commits = 0
+
+        def cursor(self):
+            return FakeCursor(self.statements)
+
+        def commit(self):
+            self.commits += 1
+
+        def rollback(self):
+            pass
+
+    connection = FakeConnection()
+    sink = DatabaseSink(connection, paramstyle="pyformat", use_copy=True)
+    tbg_df = pbp.teambygamestats()
+    sink.add_game(tbg_df=tbg_df)
+    sink.add_game(tbg_df=tbg_df.assign(points_for=0))
+    assert sink.flush() == 2
+    assert connection.commits == 1
+
+    kinds = [kind for kind, _, _ in connection.statements]
+    assert kinds == ["execute", "execute", "copy", "execute"]
+    _, create_staging, _ = connection.statements[1]
+    assert create_staging.startswith(
+        'CREATE TEMPORARY TABLE IF NOT EXISTS "teambygamestats_staging" '
+        '(LIKE "teambygamestats"'
+    )
+    _, copy_sql, copied = connection.statements[2]
+    assert copy_sql.startswith('COPY "teambygamestats_staging" ("team_id", ')
+    copied = pd.read_csv(io.StringIO(copied), header=None, names=tbg_df.columns)
+    assert len(copied) == 2
+    assert (copied["points_for"] == 0).all()
+    _, upsert, _ = connection.statements[3]
+    assert upsert.startswith('INSERT INTO "teambygamestats" ("team_id", ')
+    assert 'SELECT "team_id", ' in upsert
+    assert 'FROM "teambygamestats_staging"' in upsert
+    assert 'ON CONFLICT ("game_id", "team_id") DO UPDATE SET' in upsert
+    assert '"points_for" = excluded."points_for"' in upsert